@@ -37,6 +37,9 @@ setup(
     install_requires=['requests>=1.0.0', 'iso8601>=0.1.10'],
     tests_require=['pytest>=2.0.0', 'httpretty>=0.6.1'],
     packages=['solve360'],
+    entry_points={
+        'console_scripts': ['solve360-export = solve360.export:main'],
+    },
     package_data={'': ['LICENSE', ]},
     license='The MIT Licence',
     keywords='norada solve360 api wrapper',
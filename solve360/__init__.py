@@ -2,6 +2,11 @@ from __future__ import absolute_import
 """Python Solve360 API Wrapper."""
 
 __version__ = '0.9.2'
-__all__ = ['Solve360']
+__all__ = ['Solve360', 'ShowResult', 'SqliteResult', 'BufferedWriter',
+           'ClientPool', 'LIST_MAX_LIMIT', 'STATUS_DEADLINE_EXCEEDED']
 
-from solve360.solve360 import Solve360
+from solve360.solve360 import Solve360, LIST_MAX_LIMIT, \
+    STATUS_DEADLINE_EXCEEDED
+from solve360.results import ShowResult, SqliteResult
+from solve360.writer import BufferedWriter
+from solve360.pool import ClientPool
@@ -0,0 +1,235 @@
+"""
+Streaming aggregation over reports.
+
+Reports are fetched one window of criteria at a time, e.g. a month of time
+entries, and each window is reduced to partial aggregates per group before
+the next is fetched. Only the partials are kept, so memory use is bounded
+by the largest window and the number of groups, not by the number of
+records. Fetching a window again replaces its partials.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import datetime
+
+META_KEYS = ['count', 'status']
+
+OPERATIONS = ['sum', 'count', 'min', 'max']
+
+BUCKETS = ['day', 'week', 'month', 'year']
+
+
+def lookup(record, field):
+    """Returns a field of a record, looked up on the record, in its
+    ``fields`` or along a dotted path like ``fields.hours``."""
+    if callable(field):
+        return field(record)
+    if field in record:
+        return record[field]
+    fields = record.get('fields')
+    if isinstance(fields, dict) and field in fields:
+        return fields[field]
+    value = record
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _number(value):
+    """Returns value as a float, or None if it is not numeric."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def bucket_of(value, bucket):
+    """Returns the bucket of an ISO8601 date or timestamp, e.g.
+    ``2014-03`` for month, or None if it is not a date."""
+    try:
+        date = datetime.datetime.strptime(u'{}'.format(value)[:10],
+                                          '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    if bucket == 'day':
+        return date.isoformat()
+    if bucket == 'week':
+        year, week, _ = date.isocalendar()
+        return '{year}-W{week:02d}'.format(year=year, week=week)
+    if bucket == 'month':
+        return date.strftime('%Y-%m')
+    return date.strftime('%Y')
+
+
+def date_windows(start, end, days=31):
+    """Splits the dates from ``start`` to ``end``, both included, into
+    ``(start, end)`` windows of at most ``days`` days as ISO8601 strings."""
+    if not isinstance(start, datetime.date):
+        start = datetime.datetime.strptime(start, '%Y-%m-%d').date()
+    if not isinstance(end, datetime.date):
+        end = datetime.datetime.strptime(end, '%Y-%m-%d').date()
+    windows = []
+    while start <= end:
+        last = min(end, start + datetime.timedelta(days=days - 1))
+        windows.append((start.isoformat(), last.isoformat()))
+        start = last + datetime.timedelta(days=1)
+    return windows
+
+
+class Aggregation(object):
+    """Group by and metrics of an aggregation, applied to partials.
+
+    A partial maps a group key, a tuple of the group by values and the date
+    bucket, to a dict of metric values.
+    """
+
+    def __init__(self, group_by, metrics, bucket=None, date_field='created',
+                 where=None):
+        """Defines the aggregation.
+
+        :param group_by: list - Fields, see ``lookup``, or callables
+            returning the group value of a record.
+        :param metrics: dict - Name to ``(operation, field)``, operation one
+            of ``OPERATIONS``. Count counts the records where field is set,
+            or all records if field is None.
+        :param bucket: str - Groups also by date, one of ``BUCKETS``.
+        :param date_field: str - Field bucketed by date.
+        :param where: callable - Only records it returns True for are
+            aggregated.
+        """
+        for name, (operation, _) in metrics.items():
+            if operation not in OPERATIONS:
+                raise ValueError('Invalid operation {op} of {name}, valid ones '
+                                 'are: {ops}'.format(op=operation, name=name,
+                                                     ops=', '.join(OPERATIONS)))
+        if bucket is not None and bucket not in BUCKETS:
+            raise ValueError('Invalid bucket {bucket}, valid ones are: '
+                             '{buckets}'.format(bucket=bucket,
+                                                buckets=', '.join(BUCKETS)))
+        self.group_by = list(group_by)
+        self.metrics = metrics
+        self.bucket = bucket
+        self.date_field = date_field
+        self.where = where
+
+    def key(self, record):
+        """Returns the group key of a record."""
+        key = tuple(lookup(record, field) for field in self.group_by)
+        if self.bucket:
+            key += (bucket_of(lookup(record, self.date_field), self.bucket),)
+        return key
+
+    def add(self, partial, record):
+        """Adds a record to a partial."""
+        if self.where is not None and not self.where(record):
+            return
+        values = partial.setdefault(self.key(record), {})
+        for name, (operation, field) in self.metrics.items():
+            if operation == 'count':
+                if field is None or lookup(record, field) not in [None, '']:
+                    values[name] = values.get(name, 0) + 1
+                continue
+            number = _number(lookup(record, field))
+            if number is None:
+                continue
+            if name not in values:
+                values[name] = number
+            elif operation == 'sum':
+                values[name] += number
+            elif operation == 'min':
+                values[name] = min(values[name], number)
+            else:
+                values[name] = max(values[name], number)
+
+    def merge(self, into, partial):
+        """Merges a partial into another."""
+        for key, values in partial.items():
+            target = into.setdefault(key, {})
+            for name, value in values.items():
+                if name not in target:
+                    target[name] = value
+                    continue
+                operation = self.metrics[name][0]
+                if operation in ['sum', 'count']:
+                    target[name] += value
+                elif operation == 'min':
+                    target[name] = min(target[name], value)
+                else:
+                    target[name] = max(target[name], value)
+        return into
+
+
+class ReportAggregator(object):
+    """Aggregates a report window by window.
+
+        >>> hours = ReportAggregator(crm, 'timetracking', Aggregation(
+        ...     ['fields.creatorname', 'parent'], {'hours': ('sum', 'hours')},
+        ...     bucket='month'), last='created')
+        >>> hours.load('2014-01-01', '2014-12-31')
+        >>> hours.result()
+        {('John Doe', '12345', '2014-01'): {'hours': 31.5}, ...}
+        >>> hours.refresh(start='2014-12-01', end='2014-12-31')  # Re-aggregates
+    """
+
+    def __init__(self, crm, report_type, aggregation, **criteria):
+        """Creates the aggregator.
+
+        :param crm: Solve360 - Client used to fetch the report.
+        :param report_type: str - Report, e.g. ``timetracking`` or
+            ``opportunities``.
+        :param aggregation: Aggregation - What to compute.
+        :param criteria: dict - Criteria sent with every window.
+        """
+        self.crm = crm
+        self.report_type = report_type
+        self.aggregation = aggregation
+        self.criteria = criteria
+        self.windows = {}  # Window key -> partial
+
+    def refresh(self, key=None, **criteria):
+        """Fetches one window of the report, given by ``criteria``, and
+        replaces its partial. ``key`` names the window, by default its
+        sorted criteria. Returns the partial of the window."""
+        if key is None:
+            key = tuple(sorted(criteria.items()))
+        response = self.crm._show_report(self.report_type,
+                                         **dict(self.criteria, **criteria))
+        partial = {}
+        for uid, record in response.items():
+            if uid not in META_KEYS and isinstance(record, dict):
+                self.aggregation.add(partial, record)
+        self.windows[key] = partial
+        return partial
+
+    def load(self, start, end, days=31):
+        """Fetches the dates from ``start`` to ``end`` in windows of at most
+        ``days`` days, see ``date_windows``, one at a time."""
+        for window_start, window_end in date_windows(start, end, days):
+            self.refresh(start=window_start, end=window_end)
+
+    def forget(self, key):
+        """Drops the partial of a window."""
+        self.windows.pop(key, None)
+
+    def result(self):
+        """Returns the aggregates of all windows by group key."""
+        result = {}
+        for partial in self.windows.values():
+            self.aggregation.merge(result, partial)
+        return result
+
+    def rows(self):
+        """Returns the aggregates as dicts of the group by fields, the
+        ``bucket`` if bucketed, and the metrics, sorted by group."""
+        names = [field if not callable(field) else
+                 getattr(field, '__name__', 'group{}'.format(index))
+                 for index, field in enumerate(self.aggregation.group_by)]
+        if self.aggregation.bucket:
+            names.append('bucket')
+        return [dict(zip(names, key), **values) for key, values
+                in sorted(self.result().items(),
+                          key=lambda item: tuple(u'{}'.format(part)
+                                                 for part in item[0]))]
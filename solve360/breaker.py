@@ -0,0 +1,165 @@
+"""
+Circuit breaker for requests to Solve360.
+
+The breaker tracks the outcome of recent requests per endpoint group. When
+the error rate of a group passes a threshold the circuit opens and requests
+fail fast with CircuitOpenError. After a cool down a single probe request
+is let through, closing the circuit again if it succeeds.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import sys
+import time
+import threading
+from collections import deque
+
+if sys.version_info[0] == 3:
+    from urllib.parse import urlparse
+else:
+    from urlparse import urlparse
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    """Raised for requests made while the circuit of their group is open."""
+
+
+def endpoint_group(url):
+    """Groups requests by host and first path segment, e.g. ``contacts``."""
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.split('/') if segment]
+    return '{host}/{segment}'.format(host=parsed.netloc,
+                                     segment=segments[0] if segments else '')
+
+
+def host_group(url):
+    """Groups requests by host."""
+    return urlparse(url).netloc
+
+
+def is_failure(error):
+    """Connection errors, timeouts and 5XX responses count as failures."""
+    import requests  # Deferred to keep importing the package fast
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is None or response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class _Circuit(object):
+    """State of the circuit for one group."""
+
+    def __init__(self):
+        self.state = CLOSED
+        self.outcomes = deque()  # (timestamp, failed)
+        self.opened = 0
+        self.probing = False
+
+
+class CircuitBreaker(object):
+    """Circuit breaker keyed by endpoint group.
+
+        >>> breaker = CircuitBreaker(error_rate=0.5, reset_timeout=30)
+        >>> breaker.add_listener(lambda group, old, new: log(group, new))
+        >>> crm = Solve360(user, token, breaker=breaker)
+    """
+
+    def __init__(self, error_rate=0.5, min_requests=10, window=60,
+                 reset_timeout=30, group=endpoint_group):
+        """Creates the breaker.
+
+        :param error_rate: float - Share of failed requests opening a circuit.
+        :param min_requests: int - Requests in window needed to open.
+        :param window: float - Seconds of outcomes considered.
+        :param reset_timeout: float - Seconds open before probing.
+        :param group: callable - Returns the group of a request url, see
+            ``endpoint_group`` and ``host_group``.
+        """
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.group = group
+        self.listeners = []
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """Adds a callable called as ``listener(group, old, new)`` on state
+        changes."""
+        self.listeners.append(listener)
+
+    def state(self, group):
+        """Returns the state of the circuit for ``group``."""
+        with self._lock:
+            circuit = self._circuits.get(group)
+            return circuit.state if circuit else CLOSED
+
+    def call(self, url, send):
+        """Calls ``send`` unless the circuit for the url is open, recording
+        the outcome. Raises CircuitOpenError while open."""
+        group = self.group(url)
+        self._before(group)
+        try:
+            response = send()
+        except Exception as error:
+            self._after(group, is_failure(error))
+            raise
+        self._after(group, False)
+        return response
+
+    def _before(self, group):
+        """Raises CircuitOpenError unless a request may be sent."""
+        changes = []
+        with self._lock:
+            circuit = self._circuits.setdefault(group, _Circuit())
+            if circuit.state == OPEN:
+                if time.time() - circuit.opened < self.reset_timeout:
+                    raise CircuitOpenError(group)
+                changes.append(self._set_state(group, circuit, HALF_OPEN))
+            if circuit.state == HALF_OPEN:
+                if circuit.probing:
+                    raise CircuitOpenError(group)
+                circuit.probing = True
+        self._notify(changes)
+
+    def _after(self, group, failed):
+        """Records an outcome and updates the state of the circuit."""
+        changes = []
+        now = time.time()
+        with self._lock:
+            circuit = self._circuits[group]
+            if circuit.state == HALF_OPEN:
+                circuit.probing = False
+                circuit.outcomes.clear()
+                if failed:
+                    circuit.opened = now
+                    changes.append(self._set_state(group, circuit, OPEN))
+                else:
+                    changes.append(self._set_state(group, circuit, CLOSED))
+            elif circuit.state == CLOSED:
+                circuit.outcomes.append((now, failed))
+                while circuit.outcomes and circuit.outcomes[0][0] < now - self.window:
+                    circuit.outcomes.popleft()
+                failures = sum(1 for _, _failed in circuit.outcomes if _failed)
+                total = len(circuit.outcomes)
+                if total >= self.min_requests and \
+                        failures >= self.error_rate * total:
+                    circuit.opened = now
+                    changes.append(self._set_state(group, circuit, OPEN))
+        self._notify(changes)
+
+    @staticmethod
+    def _set_state(group, circuit, state):
+        """Sets the state and returns the change for listeners."""
+        old, circuit.state = circuit.state, state
+        return group, old, state
+
+    def _notify(self, changes):
+        """Calls the listeners outside the lock."""
+        for change in changes:
+            for listener in self.listeners:
+                listener(*change)
@@ -0,0 +1,229 @@
+"""
+Response cache shared by the processes of a host.
+
+Responses of ``show_*``, metadata (fields, categories, ownership) and report
+requests are stored in a SQLite database in WAL mode, so every process
+using the same file is served by one fetch. Entries expire after a TTL per
+kind of response, the least recently used entries are evicted past
+``max_entries`` and writes made through the client invalidate the entries
+they affect.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+
+if sys.version_info[0] == 3:
+    from urllib.parse import urlsplit, parse_qsl, urlencode
+else:
+    from urlparse import urlsplit, parse_qsl
+    from urllib import urlencode
+
+from solve360.results import find_item
+
+SHOW = 'show'
+METADATA = 'metadata'
+REPORT = 'report'
+
+DEFAULT_TTLS = {SHOW: 60, METADATA: 3600, REPORT: 300}
+
+_SHOW_PATH = re.compile(r'^(contacts|companies|projectblogs)/(\d+)/?$')
+_METADATA_PATH = re.compile(r'^(contacts|companies|projectblogs)/'
+                            r'(fields|categories)/?$')
+
+
+def classify(path):
+    """Returns ``(kind, tag)`` of a request path relative to the API root,
+    or None if its responses are not cached. The tag names what a write
+    invalidates, e.g. ``contacts/131``."""
+    path = path.lstrip('/')
+    match = _SHOW_PATH.match(path)
+    if match:
+        return SHOW, '{}/{}'.format(*match.groups())
+    match = _METADATA_PATH.match(path)
+    if match:
+        return METADATA, '{}/{}'.format(*match.groups())
+    if path.rstrip('/') == 'ownership':
+        return METADATA, 'ownership'
+    if path.startswith('report/'):
+        return REPORT, REPORT
+    return None
+
+
+def _activity_ids(response):
+    """Returns the IDs of the activities of a show response."""
+    activities = find_item(response).get('activities')
+    if not isinstance(activities, dict):
+        return []
+    return [str(uid) for uid in activities]
+
+
+class SharedCache(object):
+    """SQLite backed response cache shared between processes.
+
+        >>> cache = SharedCache('/var/tmp/solve360-cache.db', max_entries=50000)
+        >>> crm = Solve360(user, token, cache=cache)
+
+    Each process opens its own connection on first use, also after a fork.
+    """
+
+    def __init__(self, path, ttls=None, max_entries=10000, timeout=10.0,
+                 touch_interval=10.0):
+        """Creates the cache, the database is created on first use.
+
+        :param path: str - Database file, shared by all processes.
+        :param ttls: dict - Seconds entries live per kind ``show``,
+            ``metadata`` and ``report``, merged into ``DEFAULT_TTLS``.
+            A TTL of 0 disables caching of the kind.
+        :param max_entries: int - Entries kept before the least recently
+            used are evicted.
+        :param timeout: float - Seconds to wait for a lock held by another
+            process.
+        :param touch_interval: float - Seconds before a hit records its
+            access time again. Hits in between are read only, so they do
+            not contend for the write lock, at the cost of a coarser LRU.
+        """
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(user, url):
+        """Returns the cache key of a request, the query parameters are
+        sorted so their order does not matter."""
+        parts = urlsplit(url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return u'{user} {path}?{query}'.format(user=user, path=parts.path,
+                                               query=query)
+
+    def get(self, key):
+        """Returns the cached body of key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            row = db.execute('SELECT value, expires, accessed FROM entries '
+                             'WHERE key = ?', (key,)).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += 1
+                return None
+            if now - (row[2] or 0) >= self.touch_interval:
+                with db:
+                    db.execute('UPDATE entries SET accessed = ? WHERE key = ?',
+                               (now, key))
+            self.hits += 1
+        return bytes(row[0])
+
+    def put(self, key, kind, tag, body, response=None):
+        """Stores the body of a response of ``kind``. The activities of a
+        show ``response`` are linked to the entry so activity writes
+        invalidate it."""
+        ttl = self.ttls.get(kind)
+        if not ttl:
+            return
+        import sqlite3
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute('INSERT OR REPLACE INTO entries (key, tag, value, '
+                           'expires, accessed) VALUES (?, ?, ?, ?, ?)',
+                           (key, tag, sqlite3.Binary(body), now + ttl, now))
+                db.execute('DELETE FROM links WHERE key = ?', (key,))
+                if kind == SHOW and response is not None:
+                    db.executemany('INSERT INTO links (activity, key) '
+                                   'VALUES (?, ?)',
+                                   [(uid, key) for uid
+                                    in _activity_ids(response)])
+                self._evict(db)
+
+    def invalidate(self, tags=(), activity=None):
+        """Removes the entries of ``tags`` and the entries linked to the
+        activity with given ID."""
+        with self._lock:
+            db = self._connect()
+            with db:
+                for tag in tags:
+                    db.execute('DELETE FROM links WHERE key IN '
+                               '(SELECT key FROM entries WHERE tag = ?)',
+                               (tag,))
+                    db.execute('DELETE FROM entries WHERE tag = ?', (tag,))
+                if activity is not None:
+                    db.execute('DELETE FROM entries WHERE key IN '
+                               '(SELECT key FROM links WHERE activity = ?)',
+                               (str(activity),))
+                    db.execute('DELETE FROM links WHERE activity = ?',
+                               (str(activity),))
+
+    def clear(self):
+        """Removes all entries."""
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute('DELETE FROM entries')
+                db.execute('DELETE FROM links')
+
+    def close(self):
+        """Closes the connection of this process."""
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
+
+    def _connect(self):
+        """Returns the connection of this process, creating the tables on
+        first use. Called with the lock held."""
+        if self._db is not None and self._pid == os.getpid():
+            return self._db
+        import sqlite3  # Deferred, see solve360.solve360
+        db = sqlite3.connect(self.path, timeout=self.timeout,
+                             check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        with db:
+            db.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY '
+                       'KEY, tag TEXT, value BLOB, expires REAL, '
+                       'accessed REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS entries_tag ON entries '
+                       '(tag)')
+            db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON '
+                       'entries (accessed)')
+            db.execute('CREATE TABLE IF NOT EXISTS links (activity TEXT, '
+                       'key TEXT)')
+            db.execute('CREATE INDEX IF NOT EXISTS links_activity ON links '
+                       '(activity)')
+            db.execute('CREATE INDEX IF NOT EXISTS links_key ON links (key)')
+        self._db = db
+        self._pid = os.getpid()
+        return db
+
+    def _evict(self, db):
+        """Removes expired entries and, past ``max_entries``, the least
+        recently used tenth. Called within a transaction."""
+        count = db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        if count <= self.max_entries:
+            return
+        db.execute('DELETE FROM entries WHERE expires <= ?', (time.time(),))
+        excess = db.execute('SELECT COUNT(*) FROM entries').fetchone()[0] - \
+            self.max_entries
+        if excess > 0:
+            excess += self.max_entries // 10
+            db.execute('DELETE FROM entries WHERE key IN (SELECT key FROM '
+                       'entries ORDER BY accessed LIMIT ?)', (excess,))
+        db.execute('DELETE FROM links WHERE key NOT IN '
+                   '(SELECT key FROM entries)')
+
+
+def decode(body):
+    """Decodes a cached body."""
+    return json.loads(body.decode('utf-8'))
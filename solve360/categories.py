@@ -0,0 +1,153 @@
+"""
+Category tag resolution and bulk tagging.
+
+Category names are resolved to IDs from an index loaded once per entity
+with ``list_*_categories``. Missing categories are created once, also when
+many threads resolve the same name at the same time.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import threading
+
+from solve360.solve360 import VALID_ENTITIES, ERR_MSG_VALID_ENTITIES
+from solve360.results import find_item
+from solve360.concurrency import map_concurrent
+
+
+def _key(name):
+    """Returns the lookup key of a category name, names are matched
+    ignoring case and surrounding whitespace."""
+    return u'{}'.format(name).strip().lower()
+
+
+def _distinct(values):
+    """Returns the distinct values that are not None, in order."""
+    distinct, seen = [], set()
+    for value in values:
+        if value is not None and value not in seen:
+            seen.add(value)
+            distinct.append(value)
+    return distinct
+
+
+def iter_categories(response):
+    """Yields ``(id, name)`` of the categories of a list categories
+    response. Both a ``categories``/``category`` list and categories keyed
+    by ID are handled."""
+    categories = response.get('categories', response)
+    if isinstance(categories, dict) and 'category' in categories:
+        categories = categories['category']
+    if isinstance(categories, dict):
+        categories = [dict(value, id=value.get('id', uid))
+                      for uid, value in categories.items()
+                      if isinstance(value, dict)]
+    for category in categories or []:
+        if isinstance(category, dict) and category.get('name') is not None:
+            yield str(category.get('id')), category['name']
+
+
+class CategoryResolver(object):
+    """Bidirectional category name/ID index per entity.
+
+        >>> resolver = CategoryResolver(crm)
+        >>> resolver.id('contacts', 'Customer')
+        '123'
+        >>> resolver.tag('contacts', segment_ids, ['Customer', 'Newsletter'])
+    """
+
+    def __init__(self, crm, workers=4):
+        """Creates an empty resolver, entities are loaded on first use.
+
+        :param crm: Solve360 - Client used for all requests.
+        :param workers: int - Concurrent updates in ``tag``.
+        """
+        self.crm = crm
+        self.workers = workers
+        self._ids = {}  # entity -> name key -> ID
+        self._names = {}  # entity -> ID -> name
+        self._lock = threading.Lock()
+        self._locks = {}  # entity, or (entity, name key) -> lock
+
+    def id(self, entity, name, create=True):
+        """Returns the ID of the category named ``name``, creating it if
+        missing and ``create`` is set. Returns None otherwise."""
+        self._load(entity)
+        key = _key(name)
+        uid = self._ids[entity].get(key)
+        if uid is not None or not create:
+            return uid
+        with self._lock_for((entity, key)):
+            uid = self._ids[entity].get(key)
+            if uid is None:
+                uid = self._create(entity, name)
+        return uid
+
+    def ids(self, entity, names, create=True):
+        """Returns the IDs of ``names``, see ``id``. Names not found are
+        left out when ``create`` is not set."""
+        return _distinct(self.id(entity, name, create=create)
+                         for name in names)
+
+    def name(self, entity, uid):
+        """Returns the name of the category with given ID, or None."""
+        self._load(entity)
+        return self._names[entity].get(str(uid))
+
+    def refresh(self, entity):
+        """Reloads the categories of entity."""
+        self._load(entity, force=True)
+
+    def tag(self, entity, ids, names, create=True):
+        """Adds the categories ``names`` to the records ``ids``.
+
+        Names are resolved once for all records and each record is updated
+        once with all its categories, ``workers`` records at a time.
+        Returns a dict of record ID to ``(response, error)``.
+        """
+        category_ids = self.ids(entity, names, create=create)
+        if not category_ids:
+            return {}
+        payload = {'categories': {'add': {'category': category_ids}}}
+        records = _distinct(str(uid) for uid in ids)
+
+        def update(uid):
+            """Adds the categories to one record."""
+            return self.crm._update(uid, payload, entity=entity)
+
+        return map_concurrent(update, records, workers=self.workers)
+
+    def _lock_for(self, key):
+        """Returns the lock of an entity or of a name of an entity."""
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _load(self, entity, force=False):
+        """Loads the categories of entity unless already loaded."""
+        if entity not in VALID_ENTITIES:
+            raise ValueError(ERR_MSG_VALID_ENTITIES)
+        if entity in self._ids and not force:
+            return
+        with self._lock_for(entity):
+            if entity in self._ids and not force:
+                return
+            ids, names = {}, {}
+            response = self.crm._list_categories(entity=entity)
+            for uid, name in iter_categories(response):
+                ids[_key(name)] = uid
+                names[uid] = name
+            self._names[entity] = names
+            self._ids[entity] = ids
+
+    def _create(self, entity, name):
+        """Creates a category and adds it to the index. Called with the
+        lock of the name held."""
+        response = self.crm._create_categories(name, entity=entity)
+        item = find_item(response)
+        if item.get('id') is None:  # Not returned, look it up
+            self.refresh(entity)
+            return self._ids[entity].get(_key(name))
+        uid = str(item['id'])
+        with self._lock:
+            self._ids[entity][_key(name)] = uid
+            self._names[entity][uid] = item.get('name', name)
+        return uid
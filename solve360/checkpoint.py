@@ -0,0 +1,120 @@
+"""
+Resumable progress for listing operations.
+
+A checkpoint is a small json state file holding the planned ``count``,
+the completed page offsets and the location of the partial result. The
+partial result is a sibling file with one json encoded page per line, the
+state records the file position of each page so pages are read back one
+at a time when resuming.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import os
+import json
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class ListCheckpoint(object):
+    """Stores completed pages of a listing so it can be resumed."""
+
+    def __init__(self, path, entity, query):
+        """Binds the checkpoint at ``path`` to an entity and list query."""
+        self.path = path
+        self.partial = '{path}.pages'.format(path=path)
+        self.entity = entity
+        self.query = query
+        self.count = None
+        self.completed = []
+        self.positions = {}  # Page offset -> position in the partial result
+
+    def load(self):
+        """Loads previous progress and returns the offsets of the completed
+        pages, read them with ``read``.
+
+        Pages written to the partial result after the last saved state are
+        ignored. Raises ValueError if the checkpoint belongs to another
+        listing.
+        """
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as state_file:
+            state = json.load(state_file)
+        if state.get('entity') != self.entity or state.get('query') != self.query:
+            raise ValueError('Checkpoint {path} belongs to another listing.'
+                             .format(path=self.path))
+        self.count = state.get('count')
+        self.completed = state.get('completed', [])
+        if 'positions' in state:
+            self.positions = dict((int(start), position) for start, position
+                                  in state['positions'].items())
+        else:
+            self.positions = self._scan()
+        size = os.path.getsize(self.partial) \
+            if os.path.exists(self.partial) else 0
+        self.completed = [start for start in self.completed
+                          if self.positions.get(start, size) < size]
+        return list(self.completed)
+
+    def read(self, start):
+        """Returns the saved page at offset ``start``, or None if it can not
+        be read back."""
+        position = self.positions.get(start)
+        if position is None or not os.path.exists(self.partial):
+            return None
+        with open(self.partial, 'rb') as partial_file:
+            partial_file.seek(position)
+            try:
+                page = json.loads(partial_file.readline().decode('utf-8'))
+            except ValueError:
+                return None  # Truncated by an interrupted write
+        return page['page'] if page.get('start') == start else None
+
+    def save(self, start, page, count):
+        """Appends a completed page and records its offset as done."""
+        with open(self.partial, 'ab') as partial_file:
+            partial_file.seek(0, os.SEEK_END)
+            position = partial_file.tell()
+            partial_file.write(json.dumps({'start': start, 'page': page})
+                               .encode('utf-8') + b'\n')
+            partial_file.flush()
+            os.fsync(partial_file.fileno())
+        self.count = count
+        self.completed.append(start)
+        self.positions[start] = position
+        self._write_state()
+
+    def remove(self):
+        """Removes the checkpoint and its partial result."""
+        for path in [self.path, self.partial]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _scan(self):
+        """Returns the positions of the pages in the partial result, for
+        states saved without them."""
+        positions = {}
+        if not os.path.exists(self.partial):
+            return positions
+        with open(self.partial, 'rb') as partial_file:
+            position = 0
+            for line in partial_file:
+                try:
+                    start = json.loads(line.decode('utf-8'))['start']
+                except ValueError:
+                    break  # Truncated by an interrupted write
+                positions[start] = position
+                position += len(line)
+        return positions
+
+    def _write_state(self):
+        """Atomically replaces the state file."""
+        tmp_path = '{path}.tmp'.format(path=self.path)
+        with open(tmp_path, 'w') as state_file:
+            json.dump({'entity': self.entity,
+                       'query': self.query,
+                       'count': self.count,
+                       'completed': self.completed,
+                       'positions': self.positions,
+                       'partial': self.partial}, state_file)
+        _replace(tmp_path, self.path)
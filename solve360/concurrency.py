@@ -0,0 +1,80 @@
+"""
+Bounded concurrent execution in worker threads.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import sys
+import threading
+from collections import deque
+
+if sys.version_info[0] == 3:
+    from queue import Queue
+else:
+    from Queue import Queue
+
+
+class _Task(object):
+    """A call of ``fn`` for an item and its outcome."""
+
+    def __init__(self, item):
+        self.item = item
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def imap_ordered(fn, items, workers=4, ahead=None):
+    """Calls ``fn(item)`` for each item in ``workers`` threads.
+
+    Yields ``(item, result, error)`` in the order of ``items``, where error
+    is the exception raised by the call, if any. At most ``ahead`` calls,
+    by default twice the number of workers, are started before their
+    results are consumed, bounding memory use.
+    """
+    ahead = ahead or workers * 2
+    tasks = Queue()
+
+    def work():
+        """Worker loop calling ``fn`` until the sentinel is received."""
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            try:
+                task.result = fn(task.item)
+            except Exception as error:  # pylint: disable=W0703
+                task.error = error
+            task.done.set()
+
+    threads = []
+    for _ in range(max(1, workers)):
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    pending = deque()
+    items = iter(items)
+    try:
+        while True:
+            while len(pending) < ahead:
+                try:
+                    task = _Task(next(items))
+                except StopIteration:
+                    break
+                pending.append(task)
+                tasks.put(task)
+            if not pending:
+                return
+            task = pending.popleft()
+            task.done.wait()
+            yield task.item, task.result, task.error
+    finally:
+        for _ in threads:
+            tasks.put(None)
+
+
+def map_concurrent(fn, items, workers=4):
+    """Returns a dict of item to ``(result, error)``, see ``imap_ordered``."""
+    return dict((item, (result, error)) for item, result, error
+                in imap_ordered(fn, items, workers=workers))
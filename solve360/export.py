@@ -0,0 +1,293 @@
+"""
+Command line export of contacts, companies, projectblogs and reports.
+
+    $ solve360-export contacts --output contacts.ndjson.gz --gzip
+    $ solve360-export report:timetracking --param start=2014-01-01 \\
+          --param end=2014-12-31 --param last=created --format csv
+    $ solve360-export contacts --plan  # Requests and bytes, nothing exported
+
+Credentials are read from ``--user``/``--token`` or the environment
+variables ``SOLVE360_USER`` and ``SOLVE360_TOKEN``.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import io
+import os
+import sys
+import csv
+import json
+import gzip
+import time
+import codecs
+import argparse
+
+from solve360.solve360 import Solve360, VALID_ENTITIES, LIST_MAX_LIMIT
+from solve360.concurrency import imap_ordered
+
+META_KEYS = ['count', 'status']
+
+if sys.version_info[0] == 3:
+    text_type = str
+else:
+    text_type = unicode  # noqa: F821 pylint: disable=E0602
+
+
+def _text(value):
+    """Returns value as text, decoding utf-8 bytes on Python 2."""
+    if isinstance(value, bytes) and not isinstance(value, text_type):
+        return value.decode('utf-8')
+    return value
+
+
+def _bytes(value):
+    """Returns text encoded as utf-8, other values as they are."""
+    if isinstance(value, text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def flatten(record, prefix=''):
+    """Flattens nested dicts to dotted keys, lists are json encoded."""
+    flat = {}
+    for key, value in record.items():
+        key = '{prefix}{key}'.format(prefix=prefix, key=key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, key + '.'))
+        elif isinstance(value, list):
+            flat[key] = json.dumps(value)
+        else:
+            flat[key] = value
+    return flat
+
+
+class NdjsonWriter(object):
+    """Writes one json object per line."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, uid, record):
+        """Writes a record, adding ``id`` if missing."""
+        if 'id' not in record:
+            record = dict(record, id=uid)
+        self.stream.write(_text(json.dumps(record)) + u'\n')
+
+
+class CsvWriter(object):
+    """Writes flattened records as csv.
+
+    The columns are taken from the records of the first page written,
+    later unknown columns are left out to keep memory use bounded.
+
+    The csv module of Python 2 only writes bytes, there the rows are
+    written utf-8 encoded to a buffer that is decoded into the stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.writer = None
+        self.buffer = io.BytesIO() if text_type is not str else None
+
+    def write_page(self, records):
+        """Writes the records of a page, a list of ``(uid, record)``."""
+        rows = []
+        for uid, record in records:
+            row = flatten(record)
+            row.setdefault('id', uid)
+            rows.append(row)
+        if self.buffer is not None:
+            rows = [dict((_bytes(key), _bytes(value))
+                         for key, value in row.items()) for row in rows]
+        if self.writer is None and rows:
+            columns = sorted(set(key for row in rows for key in row))
+            self.writer = csv.DictWriter(self.buffer or self.stream, columns,
+                                         extrasaction='ignore')
+            self.writer.writeheader()
+        for row in rows:
+            self.writer.writerow(row)
+        if self.buffer is not None:
+            self.stream.write(self.buffer.getvalue().decode('utf-8'))
+            self.buffer.seek(0)
+            self.buffer.truncate()
+
+
+class Progress(object):
+    """Reports records written and throughput to a stream."""
+
+    def __init__(self, name, stream=None, interval=2.0):
+        self.name = name
+        self.stream = stream
+        self.interval = interval
+        self.total = None
+        self.records = 0
+        self.started = time.time()
+        self.reported = 0
+
+    def add(self, records):
+        """Counts written records, reporting at most every ``interval``."""
+        self.records += records
+        if time.time() - self.reported >= self.interval:
+            self.report()
+
+    def report(self):
+        """Writes the current progress."""
+        if not self.stream:
+            return
+        self.reported = time.time()
+        elapsed = max(self.reported - self.started, 1e-6)
+        total = '/{}'.format(self.total) if self.total is not None else ''
+        self.stream.write('{name}: {records}{total} records, {rate:.0f} '
+                          'records/s\n'.format(name=self.name,
+                                               records=self.records,
+                                               total=total,
+                                               rate=self.records / elapsed))
+        self.stream.flush()
+
+
+def page_records(page):
+    """Returns the ``(uid, record)`` pairs of a response page."""
+    return [(uid, record) for uid, record in page.items()
+            if uid not in META_KEYS]
+
+
+def export_entity(crm, entity, write_page, progress, limit=LIST_MAX_LIMIT,
+                  workers=4, params=None):
+    """Exports all objects of entity, fetching pages in ``workers`` threads.
+
+    Pages are written in order as they arrive. At most twice the number of
+    workers pages are held in memory.
+    """
+    params = dict(params or {}, limit=limit)
+
+    def fetch(start):
+        """Fetches the page at offset ``start``."""
+        return crm._list_page(entity, start, **params)
+
+    first = fetch(0)
+    progress.total = first.get('count', 0)
+    records = page_records(first)
+    write_page(records)
+    progress.add(len(records))
+    offsets = range(limit, progress.total, limit)
+    for _, page, error in imap_ordered(fetch, offsets, workers=workers):
+        if error:
+            raise error
+        records = page_records(page)
+        write_page(records)
+        progress.add(len(records))
+
+
+def export_report(crm, report_type, write_page, progress, params=None):
+    """Exports a report."""
+    records = page_records(crm._show_report(report_type, **(params or {})))
+    progress.total = len(records)
+    write_page(records)
+    progress.add(len(records))
+
+
+def open_output(path, compress):
+    """Opens the output as a text stream, gzip compressed if ``compress``.
+
+    The stream takes text, on Python 2 stdout is wrapped to encode it.
+    """
+    if path == '-':
+        if compress:
+            raw = getattr(sys.stdout, 'buffer', sys.stdout)
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode='wb'),
+                                    encoding='utf-8')
+        if text_type is not str:
+            return codecs.getwriter('utf-8')(sys.stdout)
+        return sys.stdout
+    if compress:
+        return io.TextIOWrapper(gzip.open(path, 'wb'), encoding='utf-8')
+    return io.open(path, 'w', encoding='utf-8', newline='')
+
+
+def parse_args(argv):
+    """Parses the command line."""
+    parser = argparse.ArgumentParser(
+        prog='solve360-export',
+        description='Export Solve360 records or reports to NDJSON or CSV.')
+    parser.add_argument('source',
+                        help='contacts, companies, projectblogs or '
+                             'report:<type>, e.g. report:activities')
+    parser.add_argument('--user', default=os.environ.get('SOLVE360_USER'))
+    parser.add_argument('--token', default=os.environ.get('SOLVE360_TOKEN'))
+    parser.add_argument('--output', '-o', default='-',
+                        help='Output file, - for stdout (default)')
+    parser.add_argument('--format', choices=['ndjson', 'csv'],
+                        default='ndjson')
+    parser.add_argument('--gzip', action='store_true',
+                        help='Gzip compress the output')
+    parser.add_argument('--limit', type=int, default=LIST_MAX_LIMIT,
+                        help='Objects per page')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Pages fetched concurrently')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Request timeout in seconds')
+    parser.add_argument('--param', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help='List or report parameter, may be repeated')
+    parser.add_argument('--quiet', '-q', action='store_true',
+                        help='Do not report progress')
+    parser.add_argument('--plan', action='store_true',
+                        help='Print the planned requests and bytes as json '
+                             'instead of exporting')
+    args = parser.parse_args(argv)
+    if not args.user or not args.token:
+        parser.error('--user and --token, or SOLVE360_USER and '
+                     'SOLVE360_TOKEN, are required')
+    if args.source not in VALID_ENTITIES and \
+            not args.source.startswith('report:'):
+        parser.error('source must be one of {entities} or report:<type>'
+                     .format(entities=', '.join(VALID_ENTITIES)))
+    try:
+        args.params = dict(param.split('=', 1) for param in args.param)
+    except ValueError:
+        parser.error('--param must be given as KEY=VALUE')
+    return args
+
+
+def export(crm, args, write_page, progress):
+    """Exports the source of the command line."""
+    if args.source.startswith('report:'):
+        export_report(crm, args.source.split(':', 1)[1], write_page,
+                      progress, args.params)
+    else:
+        export_entity(crm, args.source, write_page, progress,
+                      limit=args.limit, workers=args.workers,
+                      params=args.params)
+
+
+def main(argv=None):
+    """Entry point of ``solve360-export``."""
+    args = parse_args(argv)
+    crm = Solve360(args.user, args.token, timeout=args.timeout)
+    if args.plan:
+        with crm.plan() as plan:
+            export(crm, args, lambda records: None, Progress(args.source))
+        sys.stdout.write(json.dumps(plan.summary(), sort_keys=True) + '\n')
+        return 0
+    progress = Progress(args.source, None if args.quiet else sys.stderr)
+    stream = open_output(args.output, args.gzip)
+    try:
+        if args.format == 'csv':
+            write_page = CsvWriter(stream).write_page
+        else:
+            writer = NdjsonWriter(stream)
+
+            def write_page(records):
+                """Writes the records of a page as NDJSON."""
+                for uid, record in records:
+                    writer.write(uid, record)
+        export(crm, args, write_page, progress)
+    finally:
+        stream.flush()
+        if args.output != '-' or args.gzip:
+            stream.close()
+    progress.report()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Per owner report queries fanned out over the users and groups of an account.
+
+The owners are resolved from ``list_ownership`` and the report is queried
+for each of them concurrently. Responses are kept for a short TTL, so
+repeated dashboard refreshes are served without requests.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import time
+import threading
+
+from solve360.concurrency import map_concurrent
+
+USER = 'user'
+GROUP = 'group'
+
+# Report parameter selecting the owner of the report
+OWNER_PARAMS = {'nextactions': 'filter_',
+                'followups': 'responsible',
+                'calendar': 'filter_',
+                'opportunities': 'filter_',
+                'activities': 'users'}
+
+_OWNER_KEYS = {'users': USER, 'user': USER, 'groups': GROUP,
+               'group': GROUP, 'workgroups': GROUP, 'workgroup': GROUP}
+
+
+def _entries(value):
+    """Returns the entries of an owner list, which may be nested in a dict
+    under its singular name or keyed by ID."""
+    if isinstance(value, dict):
+        nested = [inner for inner in value.values()
+                  if isinstance(inner, list)]
+        if nested:
+            return [entry for inner in nested for entry in inner]
+        return [dict(entry, id=entry.get('id', uid))
+                for uid, entry in value.items() if isinstance(entry, dict)]
+    return value if isinstance(value, list) else []
+
+
+def iter_owners(response):
+    """Yields ``{'id', 'name', 'kind'}`` of the users and groups of a list
+    ownership response, kind is ``user`` or ``group``."""
+    seen = set()
+    for key, value in response.items():
+        kind = _OWNER_KEYS.get(key)
+        if kind is None:
+            continue
+        for entry in _entries(value):
+            if not isinstance(entry, dict) or entry.get('id') is None:
+                continue
+            owner = (kind, str(entry['id']))
+            if owner not in seen:
+                seen.add(owner)
+                yield {'id': owner[1], 'name': entry.get('name'),
+                       'kind': kind}
+
+
+class OwnerFanout(object):
+    """Queries reports for every user and group of an account.
+
+        >>> fanout = OwnerFanout(crm, workers=16, ttl=60)
+        >>> fanout.nextactions(due='next7')
+        {'88842777': ({'status': 'success', ...}, None), ...}
+        >>> fanout.calendar('2014-03-01', '2014-03-31', kinds=['user'])
+    """
+
+    def __init__(self, crm, workers=8, ttl=60):
+        """Creates the fan-out.
+
+        :param crm: Solve360 - Client used for all requests.
+        :param workers: int - Max concurrent report requests.
+        :param ttl: float - Seconds owners and successful reports are
+            cached, 0 disables caching. Nothing is cached while the client
+            plans, its report responses are synthetic.
+        """
+        self.crm = crm
+        self.workers = workers
+        self.ttl = ttl
+        self._cache = {}  # key -> (expires, response)
+        self._lock = threading.Lock()
+
+    def owners(self, kinds=(USER, GROUP)):
+        """Returns the owners of ``kinds``, see ``iter_owners``."""
+        response = self._cached(('ownership',), self.crm.list_ownership)
+        return [owner for owner in iter_owners(response)
+                if owner['kind'] in kinds]
+
+    def report(self, report_type, owners=None, kinds=(USER, GROUP),
+               **criteria):
+        """Queries a report once per owner, ``workers`` at a time.
+
+        :param report_type: str - One of ``OWNER_PARAMS``.
+        :param owners: list - Owner IDs, by default those of ``kinds``.
+        :param criteria: dict - Criteria sent with every query.
+        :return: dict - Owner ID to ``(response, error)``.
+        """
+        if report_type not in OWNER_PARAMS:
+            raise ValueError('Invalid report {report}, valid ones are: '
+                             '{reports}'.format(report=report_type,
+                                                reports=', '.join(
+                                                    sorted(OWNER_PARAMS))))
+        if owners is None:
+            owners = [owner['id'] for owner in self.owners(kinds)]
+        param = OWNER_PARAMS[report_type]
+        shared = tuple(sorted((name, repr(value))
+                              for name, value in criteria.items()))
+        self._prune()
+
+        def query(owner):
+            """Queries the report of one owner."""
+            return self._cached(
+                (report_type, owner, shared),
+                lambda: self.crm._show_report(report_type,
+                                              **dict(criteria,
+                                                     **{param: owner})))
+
+        return map_concurrent(query, [str(owner) for owner in owners],
+                              workers=self.workers)
+
+    def nextactions(self, **kwargs):
+        """Queries ``show_report_nextactions`` per owner, see ``report``."""
+        return self.report('nextactions', **kwargs)
+
+    def followups(self, **kwargs):
+        """Queries ``show_report_followups`` per owner, see ``report``."""
+        return self.report('followups', **kwargs)
+
+    def calendar(self, start, end, **kwargs):
+        """Queries ``show_report_calendar`` per owner, see ``report``."""
+        return self.report('calendar', start=start, end=end, **kwargs)
+
+    def clear(self):
+        """Drops all cached owners and reports."""
+        with self._lock:
+            self._cache.clear()
+
+    def _prune(self):
+        """Drops expired responses."""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (expires, _) in self._cache.items()
+                        if expires <= now]:
+                del self._cache[key]
+
+    def _cached(self, key, fetch):
+        """Returns the cached response of key, or fetches and caches it."""
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+        response = fetch()
+        if self.ttl and self.crm.planner is None:
+            with self._lock:
+                self._cache[key] = (time.time() + self.ttl, response)
+        return response
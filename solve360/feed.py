@@ -0,0 +1,152 @@
+"""
+Change feed built on the activities report.
+
+The feed polls ``show_report_activities`` for activities changed since a
+moving watermark, drops changes already seen and emits typed change events
+to the registered handlers. One report request covers all activity types
+and includes the parent data, so no request per record is needed.
+
+Delivery is at least once: a change is marked as seen only after all its
+handlers returned, and the watermark only moves once every change of a
+poll was delivered. A change whose handler raised is emitted again, to
+all its handlers, on the next poll.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import time
+import datetime
+import threading
+from collections import namedtuple
+
+from solve360.solve360 import ACTIVITY_TYPES
+
+ChangeEvent = namedtuple('ChangeEvent', ['kind', 'typeid', 'activity_id',
+                                         'updated', 'activity'])
+
+
+class ChangeFeed(object):
+    """Polls activity changes and emits them to handlers.
+
+        >>> feed = ChangeFeed(crm, since=datetime.date(2014, 3, 1))
+        >>> feed.on('note', handle_note)
+        >>> feed.on('*', handle_any)
+        >>> feed.run(interval=60)
+    """
+
+    def __init__(self, crm, since=None, on_error=None, **report_kwargs):
+        """Creates the feed.
+
+        :param crm: Solve360 - Client used for polling.
+        :param since: date - First day to poll, defaults to today.
+        :param on_error: callable - Called with exceptions raised while
+            polling in ``run`` and by handlers, after which the remaining
+            changes are still emitted. Without it ``poll`` raises the first
+            handler error and ``run`` stops.
+        :param report_kwargs: dict - Extra search criteria for
+            ``show_report_activities``, ``itemsdata`` defaults to 1.
+        """
+        self.crm = crm
+        self.watermark = since or datetime.date.today()
+        self.on_error = on_error
+        self.report_kwargs = report_kwargs
+        self.report_kwargs.setdefault('itemsdata', 1)
+        self.handlers = {}
+        self._seen = {}  # (activity id, updated) -> day of update
+        self._stopped = threading.Event()
+
+    def on(self, kind, handler):
+        """Registers ``handler(event)`` for changes of ``kind``, an activity
+        type name of ``ACTIVITY_TYPES`` or '*' for all changes."""
+        self.handlers.setdefault(kind, []).append(handler)
+
+    def poll(self):
+        """Fetches changes since the watermark and emits the new ones.
+        Returns the events delivered to all their handlers."""
+        start = self.watermark - datetime.timedelta(days=1)  # Timezone margin
+        end = datetime.date.today()
+        response = self.crm.show_report_activities(start.isoformat(),
+                                                   end.isoformat(),
+                                                   last='changed',
+                                                   **self.report_kwargs)
+        events = []
+        failed = False
+        for uid, activity in sorted(response.items(), key=self._updated):
+            if uid in ['count', 'status'] or not isinstance(activity, dict):
+                continue
+            updated = activity.get('updated') or activity.get('created') or ''
+            if (uid, updated) in self._seen:
+                continue
+            event = self._event(uid, updated, activity)
+            try:
+                self._emit(event)
+            except Exception as error:  # pylint: disable=W0703
+                if not self.on_error:
+                    raise
+                self.on_error(error)
+                failed = True
+                continue  # Not seen, emitted again on the next poll
+            self._seen[(uid, updated)] = self._day(updated) or end
+            events.append(event)
+        if not failed:  # Failed changes must stay in the polled window
+            self.watermark = end
+            self._prune()
+        return events
+
+    def run(self, interval=60):
+        """Polls every ``interval`` seconds until ``stop`` is called."""
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            started = time.time()
+            try:
+                self.poll()
+            except Exception as error:  # pylint: disable=W0703
+                if not self.on_error:
+                    raise
+                self.on_error(error)
+            self._stopped.wait(max(0, interval - (time.time() - started)))
+
+    def stop(self):
+        """Stops ``run`` after the current poll."""
+        self._stopped.set()
+
+    @staticmethod
+    def _updated(uid_activity):
+        """Sort key ordering activities by update time."""
+        activity = uid_activity[1]
+        if not isinstance(activity, dict):
+            return ''
+        return u'{}'.format(activity.get('updated') or activity.get('created') or '')
+
+    @staticmethod
+    def _day(updated):
+        """Returns the date of an ISO8601 timestamp, or None."""
+        try:
+            return datetime.datetime.strptime(updated[:10], '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _event(uid, updated, activity):
+        """Creates the typed event of an activity."""
+        try:
+            typeid = int(activity.get('typeid', activity.get('type')))
+        except (TypeError, ValueError):
+            typeid = None
+        return ChangeEvent(kind=ACTIVITY_TYPES.get(typeid, 'unknown'),
+                           typeid=typeid,
+                           activity_id=uid,
+                           updated=updated,
+                           activity=activity)
+
+    def _prune(self):
+        """Forgets changes before the polled window, they are not fetched
+        again."""
+        oldest = self.watermark - datetime.timedelta(days=1)
+        for key in [key for key, day in self._seen.items() if day < oldest]:
+            del self._seen[key]
+
+    def _emit(self, event):
+        """Calls the handlers of the event kind and of '*'."""
+        for handler in self.handlers.get(event.kind, []) + \
+                self.handlers.get('*', []):
+            handler(event)
@@ -0,0 +1,141 @@
+"""
+Breadth-first loading of related contacts, companies and project blogs.
+
+Each level of the graph is fetched as one batch: the nodes of the frontier
+are de-duplicated against everything already fetched and shown
+concurrently, so every node is fetched once however many paths lead to it.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+from solve360.solve360 import ENTITY_CONTACT, ENTITY_COMPANY, \
+    ENTITY_PROJECTBLOG
+from solve360.results import find_item
+from solve360.concurrency import imap_ordered
+
+ITEM_TYPES = {1: ENTITY_CONTACT, 2: ENTITY_COMPANY, 40: ENTITY_PROJECTBLOG}
+
+RELATION_KEYS = ['relateditems', 'companies', 'contacts', 'projectblogs']
+
+
+def _entries(value):
+    """Returns the entries of a relation list, which may be nested in a
+    dict under its singular name or keyed by ID."""
+    if isinstance(value, dict):
+        nested = [inner for key, inner in value.items()
+                  if isinstance(inner, list)]
+        if nested:
+            return [entry for inner in nested for entry in inner]
+        return [dict(entry, id=entry.get('id', uid))
+                for uid, entry in value.items() if isinstance(entry, dict)]
+    return value if isinstance(value, list) else []
+
+
+def related_nodes(response):
+    """Returns the ``(entity, id)`` nodes a show response relates to.
+    Relations of unknown item types are left out."""
+    item = find_item(response)
+    nodes = []
+    for key in RELATION_KEYS:
+        for entry in _entries(item.get(key)):
+            if not isinstance(entry, dict) or entry.get('id') is None:
+                continue
+            try:
+                typeid = int(entry.get('typeid', entry.get('type')))
+            except (TypeError, ValueError):
+                typeid = None
+            entity = ITEM_TYPES.get(typeid, key if key in ITEM_TYPES.values()
+                                    else None)
+            node = (entity, str(entry['id']))
+            if entity and node not in nodes:
+                nodes.append(node)
+    return nodes
+
+
+class Graph(object):
+    """Loaded nodes and their relations.
+
+    ``nodes`` maps ``(entity, id)`` to the show response, ``edges`` maps
+    each fetched node to the nodes it relates to and ``errors`` maps nodes
+    that could not be fetched to the exception raised. Edges may point to
+    nodes beyond the loaded depth, which are not in ``nodes``.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.edges = {}
+        self.errors = {}
+
+    def neighbors(self, entity, uid):
+        """Returns the nodes related to a node."""
+        return self.edges.get((entity, str(uid)), [])
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class GraphLoader(object):
+    """Loads the graph of records related to some root records.
+
+        >>> loader = GraphLoader(crm, workers=8)
+        >>> graph = loader.load([('contacts', 12345)], depth=2)
+        >>> graph.neighbors('contacts', 12345)
+        [('companies', '2345'), ('projectblogs', '3456')]
+    """
+
+    def __init__(self, crm, workers=4, relations=None):
+        """Creates the loader.
+
+        :param crm: Solve360 - Client used to show the records.
+        :param workers: int - Max concurrent requests.
+        :param relations: callable - Returns the related nodes of a show
+            response, defaults to ``related_nodes``.
+        """
+        self.crm = crm
+        self.workers = workers
+        self.relations = relations or related_nodes
+
+    def load(self, roots, depth=1, graph=None):
+        """Loads the roots and the records up to ``depth`` relations away.
+
+        :param roots: list - ``(entity, id)`` of the root records.
+        :param depth: int - Relations followed from the roots, 0 loads only
+            the roots.
+        :param graph: Graph - Graph to extend, its nodes are not fetched
+            again.
+        """
+        if graph is None:
+            graph = Graph()
+        frontier = self._unseen(graph, [(entity, str(uid))
+                                        for entity, uid in roots])
+        for level in range(depth + 1):
+            if not frontier:
+                break
+            for node, response, error in imap_ordered(self._fetch, frontier,
+                                                      workers=self.workers):
+                if error is not None:
+                    graph.errors[node] = error
+                    continue
+                graph.nodes[node] = response
+                graph.edges[node] = self.relations(response)
+            if level == depth:
+                break
+            frontier = self._unseen(graph, [related for node in frontier
+                                            for related in
+                                            graph.edges.get(node, [])])
+        return graph
+
+    def _fetch(self, node):
+        """Shows the record of a node."""
+        entity, uid = node
+        return self.crm._show(uid, entity=entity)
+
+    @staticmethod
+    def _unseen(graph, nodes):
+        """Returns the distinct nodes not fetched or failed yet, in order."""
+        unseen, seen = [], set()
+        for node in nodes:
+            if node not in graph.nodes and node not in graph.errors and \
+                    node not in seen:
+                seen.add(node)
+                unseen.append(node)
+        return unseen
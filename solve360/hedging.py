@@ -0,0 +1,145 @@
+"""
+Hedged requests for reducing tail latency.
+
+A hedged request sends a second identical request when the first has not
+answered within a percentile of recent latencies, and uses whichever
+response arrives first. Latencies are kept per endpoint group, so slow
+endpoints do not raise the threshold of fast ones.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import sys
+import time
+import threading
+from collections import deque
+
+from solve360.breaker import endpoint_group
+
+if sys.version_info[0] == 3:
+    from queue import Queue, Empty
+else:
+    from Queue import Queue, Empty
+
+
+class HedgePolicy(object):
+    """Decides when to hedge and keeps the latency statistics.
+
+        >>> crm = Solve360(user, token, hedge=HedgePolicy(percentile=95))
+
+    Only latency sensitive GET requests are hedged: shows, metadata and
+    list pages of at most ``max_list_limit`` objects. The slower response
+    is closed when it arrives, a request already sent can not be aborted.
+    """
+
+    def __init__(self, percentile=95, max_rate=0.05, min_samples=20,
+                 window=200, group=endpoint_group, max_list_limit=100):
+        """Creates the policy.
+
+        :param percentile: float - Percentile of recent latencies to wait
+            before hedging.
+        :param max_rate: float - Max share of requests that are hedged.
+        :param min_samples: int - Latencies needed before hedging starts.
+        :param window: int - Number of recent latencies kept per group.
+        :param group: callable - Returns the group of a request url, see
+            ``solve360.breaker.endpoint_group``.
+        :param max_list_limit: int - Largest list page ``limit`` hedged.
+        """
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.group = group
+        self.max_list_limit = max_list_limit
+        self.requests = 0
+        self.hedged = 0
+        self._latencies = {}  # group -> recent latencies
+        self._lock = threading.Lock()
+
+    def delay(self, group=None):
+        """Returns seconds to wait before hedging a request of ``group``,
+        or None to not hedge."""
+        with self._lock:
+            latencies = self._latencies.get(group, ())
+            if len(latencies) < self.min_samples:
+                return None
+            latencies = sorted(latencies)
+        index = int(round(self.percentile / 100.0 * (len(latencies) - 1)))
+        return latencies[index]
+
+    def record(self, latency, group=None):
+        """Records the latency of a completed request of ``group``."""
+        with self._lock:
+            if group not in self._latencies:
+                self._latencies[group] = deque(maxlen=self.window)
+            self._latencies[group].append(latency)
+
+    def run(self, send, url=None):
+        """Calls ``send`` and hedges it with a second call if it is slow.
+        Latencies are those of the group of ``url``.
+        Returns the first successful response, or raises the last error."""
+        group = self.group(url) if url is not None else None
+        with self._lock:
+            self.requests += 1
+        delay = self.delay(group)
+        if delay is None:
+            started = time.time()
+            response = send()
+            self.record(time.time() - started, group)
+            return response
+
+        results = Queue()
+        state = {'done': False}
+        lock = threading.Lock()
+
+        def attempt():
+            """Sends a request and queues its outcome."""
+            started = time.time()
+            try:
+                outcome = (True, send(), time.time() - started)
+            except Exception as error:  # pylint: disable=W0703
+                outcome = (False, error, None)
+            with lock:
+                if state['done']:
+                    if outcome[0]:
+                        outcome[1].close()  # Lost the race
+                    return
+            results.put(outcome)
+
+        self._start(attempt)
+        attempts = 1
+        try:
+            outcome = results.get(timeout=delay)
+        except Empty:
+            if self._reserve_hedge():
+                self._start(attempt)
+                attempts += 1
+            outcome = results.get()
+        while not outcome[0] and attempts > 1:
+            attempts -= 1
+            outcome = results.get()
+        with lock:
+            state['done'] = True
+        while not results.empty():  # The other attempt finished meanwhile
+            other = results.get()
+            if other[0]:
+                other[1].close()
+        success, value, latency = outcome
+        if not success:
+            raise value
+        self.record(latency, group)
+        return value
+
+    def _reserve_hedge(self):
+        """Counts a hedge if it keeps hedging within ``max_rate``."""
+        with self._lock:
+            if self.hedged + 1 > self.max_rate * self.requests:
+                return False
+            self.hedged += 1
+            return True
+
+    @staticmethod
+    def _start(target):
+        """Starts ``target`` in a daemon thread."""
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
@@ -0,0 +1,159 @@
+"""
+Request budget planning.
+
+While a plan is active the client records the requests an operation would
+issue instead of sending them, and answers them with synthetic responses so
+the operation runs to completion. Lists are planned from one count probe per
+query, a real request with ``limit=1``, and metadata needed to plan, like
+``list_ownership`` for report fan-outs, is fetched for real. The cost of
+planning itself is reported as ``probes``.
+
+    >>> with crm.plan() as plan:
+    ...     crm.list_all_contacts(limit=500)
+    ...     crm.destroy_contacts(ids, workers=8)
+    >>> plan.summary()
+    {'requests': 1241, 'bytes_sent': 0, 'bytes_received': 52481024, ...}
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import sys
+import json
+import threading
+
+if sys.version_info[0] == 3:
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+else:
+    from urlparse import urlsplit, urlunsplit, parse_qsl
+    from urllib import urlencode
+
+from solve360.cache import classify, SHOW, METADATA, REPORT
+
+LIST = 'list'
+WRITE = 'write'
+OTHER = 'other'
+
+# Rough response sizes of requests that are not probed, in bytes
+DEFAULT_RESPONSE_BYTES = {SHOW: 8192, REPORT: 65536, WRITE: 256, OTHER: 256}
+
+_ENVELOPE = len(json.dumps({'status': 'success', 'count': 0}))
+
+
+class Planner(object):
+    """Records planned requests of a client, see the module documentation.
+
+    The client should not be used for other work while planning, requests
+    made from any thread are planned.
+    """
+
+    def __init__(self, crm, response_bytes=None):
+        """Creates the plan.
+
+        :param crm: Solve360 - Client to plan for.
+        :param response_bytes: dict - Response size estimates per kind,
+            merged into ``DEFAULT_RESPONSE_BYTES``.
+        """
+        self.crm = crm
+        self.response_bytes = dict(DEFAULT_RESPONSE_BYTES,
+                                   **(response_bytes or {}))
+        self.calls = []  # (kind, method, url, bytes sent, bytes received)
+        self.probes = []  # (url, bytes received)
+        self._lists = {}  # list query -> (count, bytes per object)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.crm.planner = self
+        return self
+
+    def __exit__(self, *args):
+        self.crm.planner = None
+
+    def send(self, method, url, auth, headers, data=None):
+        """Plans a request and returns its synthetic response body."""
+        kind = self._kind(method, url)
+        if kind == LIST:
+            body, received = self._list_page(url, auth, headers)
+        elif kind == METADATA:
+            body = self._probe(url, auth, headers)
+            received = len(body)
+        else:
+            body = b'{"status": "success"}'
+            received = self.response_bytes.get(kind, 0)
+        with self._lock:
+            self.calls.append((kind, method, url,
+                               len(data.encode('utf-8')) if data else 0,
+                               received))
+        return body
+
+    def summary(self):
+        """Returns the planned requests and bytes in total and per kind,
+        and the requests and bytes spent on probes."""
+        with self._lock:
+            calls = list(self.calls)
+            probes = list(self.probes)
+        kinds = {}
+        for kind, _, _, sent, received in calls:
+            totals = kinds.setdefault(kind, {'requests': 0, 'bytes_sent': 0,
+                                             'bytes_received': 0})
+            totals['requests'] += 1
+            totals['bytes_sent'] += sent
+            totals['bytes_received'] += received
+        return {'requests': len(calls),
+                'bytes_sent': sum(call[3] for call in calls),
+                'bytes_received': sum(call[4] for call in calls),
+                'kinds': kinds,
+                'probes': {'requests': len(probes),
+                           'bytes_received': sum(probe[1] for probe in probes)}}
+
+    def _kind(self, method, url):
+        """Returns the kind of a request."""
+        if method != 'get':
+            return WRITE
+        root = self.crm.url.split('{url}')[0]
+        path = urlsplit(url[len(root):] if url.startswith(root) else url).path
+        kind_tag = classify(path)
+        if kind_tag is not None:
+            return kind_tag[0]
+        if path.strip('/') in ['contacts', 'companies', 'projectblogs']:
+            return LIST
+        return OTHER
+
+    def _probe(self, url, auth, headers):
+        """Sends a request for real and returns the response body."""
+        response = self.crm.transport.send('get', url, auth=auth,
+                                           headers=headers,
+                                           timeout=self.crm.timeout)
+        response.raise_for_status()
+        body = response.content
+        with self._lock:
+            self.probes.append((url, len(body)))
+        return body
+
+    def _list_page(self, url, auth, headers):
+        """Returns a synthetic list page holding as many placeholder objects
+        as the real page would, probing the count of the query once, and
+        the estimated size of the real page."""
+        parts = urlsplit(url)
+        params = dict(parse_qsl(parts.query))
+        start = int(params.pop('start', 0) or 0)
+        limit = int(params.pop('limit', 0) or 0)
+        query = urlencode(sorted(params.items()))
+        with self._lock:
+            known = self._lists.get((parts.path, query))
+        if known is None:
+            probe_url = urlunsplit(parts[:3] + (urlencode(
+                sorted(dict(params, limit=1, start=0).items())), ''))
+            probe = json.loads(self._probe(probe_url, auth,
+                                           headers).decode('utf-8'))
+            count = int(probe.get('count', 0) or 0)
+            objects = len(probe) - len([key for key in ['count', 'status']
+                                        if key in probe])
+            per_object = len(json.dumps(probe)) - _ENVELOPE if objects else 0
+            known = (count, max(per_object, 0))
+            with self._lock:
+                self._lists[(parts.path, query)] = known
+        count = known[0]
+        size = max(0, min(limit or count, count - start))
+        page = {'status': 'success', 'count': count}
+        for index in range(start, start + size):
+            page['planned-{}'.format(index)] = {}
+        return json.dumps(page).encode('utf-8'), _ENVELOPE + known[1] * size
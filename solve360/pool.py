@@ -0,0 +1,190 @@
+"""
+Client pool for serving many Solve360 accounts.
+
+All clients of a pool share one connection pool and are scheduled through
+the pool, which enforces global and per account limits and hands out
+request slots round-robin between accounts waiting for one.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import time
+import threading
+from collections import deque
+
+from solve360.solve360 import Solve360
+
+
+class _Tenant(object):
+    """Scheduling state and metrics for one account."""
+
+    def __init__(self, user):
+        self.user = user
+        self.waiting = deque()  # Tickets of requests waiting for a slot
+        self.next_ticket = 0
+        self.next_allowed = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.wait_time = 0.0
+        self.request_time = 0.0
+
+    def metrics(self):
+        """Returns a snapshot of the metrics."""
+        return {'requests': self.requests,
+                'errors': self.errors,
+                'in_flight': self.in_flight,
+                'waiting': len(self.waiting),
+                'wait_time': self.wait_time,
+                'request_time': self.request_time}
+
+
+class PooledSolve360(Solve360):
+    """Solve360 client scheduled through a ``ClientPool``."""
+
+    def __init__(self, pool, user, token, **kwargs):
+        """Creates a client for an account of ``pool``."""
+        kwargs['session'] = pool.session
+        super(PooledSolve360, self).__init__(user, token, **kwargs)
+        self.pool = pool
+
+    def _attempt(self, method, url, auth, headers, data, timeout):
+        """Sends the request once the pool grants a slot for it. Each hedge
+        attempt takes a slot of its own, cache hits and planned requests
+        are not sent so they take none."""
+        tenant = self.pool._acquire(self.auth)
+        started = time.time()
+        failed = True
+        try:
+            response = super(PooledSolve360, self)._attempt(method, url, auth,
+                                                            headers, data,
+                                                            timeout)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self.pool._release(tenant, time.time() - started, failed)
+
+
+class ClientPool(object):
+    """Pool of Solve360 clients keyed by credentials.
+
+        >>> pool = ClientPool(max_concurrency=16, account_concurrency=4)
+        >>> crm = pool.client(user, token)
+        >>> crm.list_all_contacts()
+        >>> pool.metrics()
+        {('user', 'token'): {'requests': 3, 'errors': 0, ...}}
+    """
+
+    def __init__(self, max_concurrency=8, account_concurrency=2,
+                 rate=None, account_rate=None, session=None):
+        """Creates the pool and its shared session.
+
+        :param max_concurrency: int - Max requests in flight for all accounts.
+        :param account_concurrency: int - Max requests in flight per account.
+        :param rate: float - Max requests per second for all accounts.
+        :param account_rate: float - Max requests per second per account.
+        :param session: requests.Session - Shared session, one sized for
+            ``max_concurrency`` connections is created by default.
+        """
+        if session is None:
+            import requests  # Deferred to keep importing the package fast
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=max_concurrency)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        self.max_concurrency = max_concurrency
+        self.account_concurrency = account_concurrency
+        self.rate = rate
+        self.account_rate = account_rate
+        self._clients = {}
+        self._tenants = {}
+        self._turns = deque()  # Accounts with waiting requests, next first
+        self._in_flight = 0
+        self._next_allowed = 0
+        self._cond = threading.Condition()
+
+    def client(self, user, token, **kwargs):
+        """Returns the pooled client for the given credentials.
+        Extra kwargs are passed to ``Solve360`` on first use."""
+        key = (user, token)
+        with self._cond:
+            if key not in self._clients:
+                self._clients[key] = PooledSolve360(self, user, token, **kwargs)
+                self._tenants[key] = _Tenant(user)
+            return self._clients[key]
+
+    def metrics(self):
+        """Returns the metrics of each account keyed by ``(user, token)``,
+        like the clients."""
+        with self._cond:
+            return dict((key, tenant.metrics())
+                        for key, tenant in self._tenants.items())
+
+    def _acquire(self, key):
+        """Blocks until a request slot is granted to account ``key``."""
+        with self._cond:
+            tenant = self._tenants[key]
+            ticket = tenant.next_ticket
+            tenant.next_ticket += 1
+            tenant.waiting.append(ticket)
+            if key not in self._turns:
+                self._turns.append(key)
+            started = time.time()
+            while True:
+                granted, delay = self._try_grant(key, ticket)
+                if granted:
+                    break
+                self._cond.wait(delay)
+            tenant.wait_time += time.time() - started
+            return tenant
+
+    def _try_grant(self, key, ticket):
+        """Grants a slot if it is the turn of ``ticket``.
+        Returns whether it was granted and how long to wait otherwise."""
+        tenant = self._tenants[key]
+        now = time.time()
+        if self._in_flight >= self.max_concurrency:
+            return False, None
+        if now < self._next_allowed:
+            return False, self._next_allowed - now
+        if tenant.waiting[0] != ticket:
+            return False, None
+        delay = None
+        for turn in self._turns:  # First account able to send has the turn
+            candidate = self._tenants[turn]
+            if candidate.in_flight >= self.account_concurrency:
+                continue
+            if now < candidate.next_allowed:
+                wait = candidate.next_allowed - now
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            if turn != key:
+                return False, delay
+            break
+        else:
+            return False, delay
+
+        tenant.waiting.popleft()
+        tenant.in_flight += 1
+        self._in_flight += 1
+        if self.rate:
+            self._next_allowed = now + 1.0 / self.rate
+        if self.account_rate:
+            tenant.next_allowed = now + 1.0 / self.account_rate
+        self._turns.remove(key)
+        if tenant.waiting:
+            self._turns.append(key)
+        self._cond.notify_all()
+        return True, None
+
+    def _release(self, tenant, elapsed, failed):
+        """Returns a request slot and records the request."""
+        with self._cond:
+            tenant.in_flight -= 1
+            self._in_flight -= 1
+            tenant.requests += 1
+            tenant.request_time += elapsed
+            if failed:
+                tenant.errors += 1
+            self._cond.notify_all()
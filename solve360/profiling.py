@@ -0,0 +1,169 @@
+"""
+Profiling of client calls.
+
+Each call records the seconds spent per phase: waiting for the response
+(``network``), reading the body (``download``), json decoding (``decode``),
+date parsing (``parse_dates``) and merging list pages (``merge``). Memory
+allocation peaks are recorded with tracemalloc where it can reset its peak
+(Python 3.9+). The peak tracemalloc tracks is process wide, so it is only
+recorded for calls that did not overlap another call, ``peak_memory`` is
+None for the others and on older Pythons.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import time
+import threading
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
+
+
+class _Null(object):
+    """Context doing nothing, used when profiling is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL = _Null()
+
+
+class _Phase(object):
+    """Context timing a phase of the current call."""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler._record(self.name, time.time() - self.started)
+
+
+class _Call(object):
+    """Context collecting the phases of one call."""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.record = {'call': name, 'phases': {}, 'peak_memory': None}
+        self.started = None
+        self.memory = None
+        self.nested = False
+        self.alone = True
+
+    def __enter__(self):
+        local = self.profiler._local
+        self.nested = getattr(local, 'call', None) is not None
+        if self.nested:  # Phases are recorded on the outermost call
+            return self
+        local.call = self.record
+        with self.profiler._lock:
+            active = self.profiler._active
+            if active:  # Resetting the peak would corrupt the others' peaks
+                for call in active:
+                    call.alone = False
+                self.alone = False
+            elif self.profiler.trace_memory and \
+                    hasattr(tracemalloc, 'reset_peak'):
+                # Without reset_peak the peak is that of the whole process
+                tracemalloc.reset_peak()
+                self.memory = tracemalloc.get_traced_memory()[0]
+            active.add(self)
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *args):
+        if self.nested:
+            return
+        self.record['time'] = time.time() - self.started
+        self.profiler._local.call = None
+        with self.profiler._lock:
+            self.profiler._active.discard(self)
+            if self.alone and self.memory is not None:
+                self.record['peak_memory'] = max(
+                    0, tracemalloc.get_traced_memory()[1] - self.memory)
+            self.profiler.calls.append(self.record)
+
+
+class Profiler(object):
+    """Collects per call phase timings of a client.
+
+        >>> crm = Solve360(user, token, profile=True)
+        >>> crm.list_all_contacts()
+        >>> crm.profiler.summary()
+        {'calls': 1, 'time': 12.1, 'peak_memory': 5242880,
+         'phases': {'network': {'calls': 1, 'total': 9.2, 'max': 9.2}, ...}}
+    """
+
+    def __init__(self, trace_memory=True):
+        """Creates the profiler, starting tracemalloc if ``trace_memory``
+        is set and tracemalloc is available."""
+        self.trace_memory = bool(trace_memory and tracemalloc)
+        self._started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.calls = []
+        self._active = set()  # Outermost calls in progress in any thread
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def call(self, name):
+        """Returns a context collecting the phases of a call. Phases
+        recorded outside a call are recorded as a call of their own."""
+        return _Call(self, name)
+
+    def phase(self, name):
+        """Returns a context timing phase ``name`` of the current call."""
+        return _Phase(self, name)
+
+    def summary(self):
+        """Returns totals for all recorded calls. Per phase the number of
+        calls it occurred in, the total and the max seconds of a call."""
+        with self._lock:
+            calls = list(self.calls)
+        phases = {}
+        for record in calls:
+            for name, seconds in record['phases'].items():
+                phase = phases.setdefault(name, {'calls': 0, 'total': 0.0,
+                                                 'max': 0.0})
+                phase['calls'] += 1
+                phase['total'] += seconds
+                phase['max'] = max(phase['max'], seconds)
+        peaks = [record['peak_memory'] for record in calls
+                 if record['peak_memory'] is not None]
+        return {'calls': len(calls),
+                'time': sum(record.get('time', 0.0) for record in calls),
+                'peak_memory': max(peaks) if peaks else None,
+                'phases': phases}
+
+    def reset(self):
+        """Removes all recorded calls."""
+        with self._lock:
+            self.calls = []
+
+    def stop(self):
+        """Stops recording memory, stopping tracemalloc if started here."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.trace_memory = False
+
+    def _record(self, name, seconds):
+        """Adds ``seconds`` to phase ``name`` of the current call."""
+        record = getattr(self._local, 'call', None)
+        if record is None:
+            with self._lock:
+                self.calls.append({'call': name, 'phases': {name: seconds},
+                                   'time': seconds, 'peak_memory': None})
+            return
+        record['phases'][name] = record['phases'].get(name, 0.0) + seconds
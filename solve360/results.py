@@ -0,0 +1,223 @@
+"""
+Result types for list and show operations.
+
+A list backend is created once per list operation and filled with one
+response page at a time through ``update``. The default backend is ``dict``.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import os
+import pickle
+from bisect import bisect_left, bisect_right
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+META_KEYS = ['count', 'status']
+
+
+class SqliteResult(Mapping):
+    """Read-only mapping of list results stored in a SQLite file.
+
+    Pages are written to disk as they arrive and objects are read back from
+    disk on lookup and iteration, so memory use does not grow with the
+    number of objects. Keys ``count`` and ``status`` are kept in memory.
+
+    Use as ``crm.list_contacts(backend=SqliteResult, ...)`` or, to choose
+    the file, ``backend=lambda: SqliteResult('/tmp/contacts.db')``.
+    """
+
+    fetch_size = 500  # Number of rows read from disk at a time
+
+    def __init__(self, path=None):
+        """Opens the result store at ``path``. Without a path a temporary
+        file is used and removed when the result is closed."""
+        import sqlite3  # Deferred to keep importing the package fast
+        import tempfile
+        self._temporary = path is None
+        if self._temporary:
+            handle, path = tempfile.mkstemp(suffix='.db', prefix='solve360-')
+            os.close(handle)
+        self.path = path
+        self._meta = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries '
+                         '(key TEXT PRIMARY KEY, value BLOB)')
+        self._db.commit()
+
+    def update(self, page):
+        """Stores all objects of a response page."""
+        import sqlite3
+        rows = []
+        for key, value in page.items():
+            if key in META_KEYS:
+                self._meta[key] = value
+            else:
+                rows.append((key, sqlite3.Binary(pickle.dumps(value, 2))))
+        self._db.executemany('INSERT OR REPLACE INTO entries (key, value) '
+                             'VALUES (?, ?)', rows)
+        self._db.commit()
+
+    def __getitem__(self, key):
+        if key in self._meta:
+            return self._meta[key]
+        row = self._db.execute('SELECT value FROM entries WHERE key = ?',
+                               (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(bytes(row[0]))
+
+    def __contains__(self, key):
+        if key in self._meta:
+            return True
+        return self._db.execute('SELECT 1 FROM entries WHERE key = ?',
+                                (key,)).fetchone() is not None
+
+    def __iter__(self):
+        for key in list(self._meta):
+            yield key
+        cursor = self._db.execute('SELECT key FROM entries ORDER BY rowid')
+        rows = cursor.fetchmany(self.fetch_size)
+        while rows:
+            for row in rows:
+                yield row[0]
+            rows = cursor.fetchmany(self.fetch_size)
+
+    def __len__(self):
+        rows = self._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        return rows + len(self._meta)
+
+    def items(self):
+        """Iterates objects with a single pass over the file."""
+        for key in list(self._meta):
+            yield key, self._meta[key]
+        cursor = self._db.execute('SELECT key, value FROM entries ORDER BY rowid')
+        rows = cursor.fetchmany(self.fetch_size)
+        while rows:
+            for key, value in rows:
+                yield key, pickle.loads(bytes(value))
+            rows = cursor.fetchmany(self.fetch_size)
+
+    def close(self):
+        """Closes the store, removing it if it is temporary."""
+        self._db.close()
+        if self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def find_item(response):
+    """Returns the item of a show response, see ``Solve360._parse_date``
+    for the traversed structures."""
+    candidates = [response] + [value for value in response.values()
+                               if isinstance(value, dict)]
+    for candidate in candidates:
+        item = candidate.get('item')
+        if isinstance(item, dict):
+            return item
+    return response
+
+
+class ShowResult(Mapping):
+    """Show response with activities indexed by type, parent and date.
+
+    The indexes are built in a single pass over the activities when the
+    result is created. The response itself is available through the
+    mapping interface unchanged.
+    """
+
+    def __init__(self, response, date_field='created'):
+        """Indexes the activities of ``response`` on ``date_field``."""
+        self.response = response
+        activities = find_item(response).get('activities')
+        self.activities = activities if isinstance(activities, dict) else {}
+        self.date_field = date_field
+        from iso8601 import iso8601, ParseError  # Deferred, see SqliteResult
+        dated = []
+        for uid, activity in self.activities.items():
+            date = activity.get('{}_parsed'.format(date_field))
+            if date is None and date_field in activity:
+                try:
+                    date = iso8601.parse_date(activity[date_field])
+                except ParseError:
+                    pass
+            if date is not None:
+                dated.append((date, uid))
+        dated.sort(key=lambda date_uid: date_uid[0])
+        self._dates = [date for date, _ in dated]
+        self._by_date = [uid for _, uid in dated]
+
+        indexed = set(self._by_date)
+        undated = [uid for uid in self.activities if uid not in indexed]
+        self._by_type = {}
+        self._by_parent = {}
+        for uid in undated + self._by_date:  # Oldest first
+            activity = self.activities[uid]
+            try:
+                typeid = int(activity.get('typeid'))
+            except (TypeError, ValueError):
+                typeid = None
+            self._by_type.setdefault(typeid, []).append(uid)
+            if activity.get('parent'):
+                self._by_parent.setdefault(str(activity['parent']), []).append(uid)
+
+    @staticmethod
+    def _type_id(type_):
+        """Returns the activity type id for a type id or name."""
+        from solve360.solve360 import ACTIVITY_TYPES
+        for typeid, name in ACTIVITY_TYPES.items():
+            if type_ == name:
+                return typeid
+        return int(type_)
+
+    def by_type(self, type_):
+        """Activities of a type, oldest first.
+
+        :param type_: int or str - Type id or name, see ``ACTIVITY_TYPES``.
+        """
+        return [self.activities[uid]
+                for uid in self._by_type.get(self._type_id(type_), [])]
+
+    def children(self, parent):
+        """Activities with the given parent activity id, oldest first."""
+        return [self.activities[uid]
+                for uid in self._by_parent.get(str(parent), [])]
+
+    def latest(self, type_=None, n=1):
+        """The ``n`` latest activities, optionally of a type, newest first."""
+        if type_ is None:
+            uids = self._by_date
+        else:
+            uids = self._by_type.get(self._type_id(type_), [])
+        return [self.activities[uid] for uid in uids[::-1][:n]]
+
+    def between(self, start, end):
+        """Activities dated from ``start`` to ``end`` inclusive, oldest first.
+
+        :param start: datetime - Timezone aware start date.
+        :param end: datetime - Timezone aware end date.
+        """
+        first = bisect_left(self._dates, start)
+        last = bisect_right(self._dates, end)
+        return [self.activities[uid] for uid in self._by_date[first:last]]
+
+    def open_tasks(self):
+        """Tasks that are not completed, oldest first."""
+        return [task for task in self.by_type('task')
+                if str(task.get('fields', {}).get('completed', '0')) != '1']
+
+    def __getitem__(self, key):
+        return self.response[key]
+
+    def __iter__(self):
+        return iter(self.response)
+
+    def __len__(self):
+        return len(self.response)
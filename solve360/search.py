@@ -0,0 +1,146 @@
+"""
+Local search index over list results.
+
+An inverted index from tokens of names, emails, phone numbers and company
+names to record IDs, answering token and prefix searches without a request.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import re
+import threading
+from bisect import bisect_left, insort
+
+DEFAULT_SEARCH_FIELDS = ['name', 'firstname', 'lastname', 'company',
+                         'businessemail', 'personalemail', 'otheremail',
+                         'businessphonedirect', 'businessphonemain',
+                         'businessphoneextension', 'cellularphone',
+                         'homephone', 'businessfax']
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_NON_DIGIT = re.compile(r'\D')
+
+
+def tokenize(value):
+    """Returns the tokens of a field value.
+
+    Besides the words of the value, the whole value is a token so emails
+    can be searched in full, and phone numbers are also indexed by their
+    digits only.
+    """
+    value = u'{}'.format(value).strip().lower()
+    if not value:
+        return set()
+    tokens = set(_WORD.findall(value))
+    tokens.add(value)
+    digits = _NON_DIGIT.sub('', value)
+    if len(digits) >= 5:
+        tokens.add(digits)
+    return tokens
+
+
+class SearchIndex(object):
+    """Inverted index over list results.
+
+        >>> index = SearchIndex()
+        >>> index.add(crm.list_all_contacts())
+        >>> index.search('john sm')
+        {'status': 'success', 'count': 1, '12345': {...}}
+    """
+
+    def __init__(self, fields=None):
+        """Creates an empty index over ``fields`` of the records, looked up
+        on the record and in its ``fields``. Defaults to
+        ``DEFAULT_SEARCH_FIELDS``."""
+        self.fields = fields or DEFAULT_SEARCH_FIELDS
+        self.records = {}
+        self._tokens = []  # Sorted, for prefix searches
+        self._postings = {}  # token -> set of IDs
+        self._record_tokens = {}  # ID -> set of tokens
+        self._lock = threading.Lock()
+
+    def add(self, response):
+        """Adds or updates all records of a list response. New tokens are
+        sorted once for the whole response."""
+        records = [(str(uid), record, self._tokenize(record))
+                   for uid, record in response.items()
+                   if uid not in ['count', 'status']]
+        with self._lock:
+            added = len(self._tokens)
+            for uid, record, tokens in records:
+                self._index(uid, record, tokens, self._tokens.append)
+            if len(self._tokens) > added:
+                self._tokens.sort()
+
+    def update(self, uid, record):
+        """Adds or replaces the record with given ID."""
+        tokens = self._tokenize(record)
+        with self._lock:
+            self._index(str(uid), record, tokens,
+                        lambda token: insort(self._tokens, token))
+
+    def remove(self, uid):
+        """Removes the record with given ID."""
+        with self._lock:
+            self._unindex(str(uid))
+
+    def search(self, query, prefix=True, limit=None):
+        """Returns the records matching all tokens of ``query``.
+
+        The result has the shape of a list response. With ``prefix`` set
+        the tokens also match indexed tokens they are a prefix of.
+        """
+        tokens = _WORD.findall(u'{}'.format(query).lower())
+        with self._lock:
+            uids = None
+            for token in tokens:
+                matches = self._prefix(token) if prefix else \
+                    self._postings.get(token, set())
+                uids = matches if uids is None else uids & matches
+                if not uids:
+                    break
+            uids = sorted(uids or [])[:limit]
+            result = {'status': 'success', 'count': len(uids)}
+            for uid in uids:
+                result[uid] = self.records[uid]
+        return result
+
+    def __len__(self):
+        return len(self.records)
+
+    def _prefix(self, prefix):
+        """Returns the IDs of tokens starting with ``prefix``."""
+        uids = set()
+        index = bisect_left(self._tokens, prefix)
+        while index < len(self._tokens) and \
+                self._tokens[index].startswith(prefix):
+            uids.update(self._postings[self._tokens[index]])
+            index += 1
+        return uids
+
+    def _tokenize(self, record):
+        """Returns the tokens of the indexed fields of a record."""
+        tokens = set()
+        for source in [record, record.get('fields') or {}]:
+            for field in self.fields:
+                if source.get(field):
+                    tokens.update(tokenize(source[field]))
+        return tokens
+
+    def _index(self, uid, record, tokens, add_token):
+        """Replaces the record with given ID, calling ``add_token`` for
+        tokens not indexed before."""
+        self._unindex(uid)
+        self.records[uid] = record
+        self._record_tokens[uid] = tokens
+        for token in tokens:
+            if token not in self._postings:
+                self._postings[token] = set()
+                add_token(token)
+            self._postings[token].add(uid)
+
+    def _unindex(self, uid):
+        """Removes a record from the postings, keeping emptied tokens in
+        the sorted token list until they are reused."""
+        for token in self._record_tokens.pop(uid, ()):
+            self._postings[token].discard(uid)
+        self.records.pop(uid, None)
@@ -7,16 +7,34 @@ __author__ = 'Daniel Nibon <daniel@nibon.se>'
 
 import sys
 import json
+import time
+import functools
+import threading
+from collections import deque, OrderedDict
 
 if sys.version_info[0] == 3:
     import urllib.parse as urllib_
+    from urllib.parse import urlsplit, parse_qsl
 else:
     import urllib as urllib_
-
-import requests
-from iso8601 import iso8601, ParseError
+    from urlparse import urlsplit, parse_qsl
+
+from solve360.checkpoint import ListCheckpoint
+from solve360.results import ShowResult, find_item
+from solve360.profiling import Profiler, NULL
+from solve360.transport import RequestsTransport
+from solve360.validation import PayloadValidator, DEFAULT_EXTRA_KEYS
+from solve360.cache import classify, REPORT, decode as cache_decode
+from solve360.concurrency import map_concurrent
+from solve360.tombstones import TombstoneLog
+from solve360.planning import Planner
 
 LIST_MAX_LIMIT = 5000  # Defined max limit for _list operation
+MAX_PENDING_DECODES = 8  # Pages fetched ahead of decoding in a decode pool
+STATUS_DEADLINE_EXCEEDED = 'deadline_exceeded'  # Status of truncated lists
+KNOWN_STATE_MAX = 10000  # Records kept in known_state, least recent dropped
+# Update keys that are commands, e.g. adding categories, not field values
+COMMAND_KEYS = DEFAULT_EXTRA_KEYS
 
 ENTITY_CONTACT = 'contacts'
 ENTITY_COMPANY = 'companies'
@@ -30,11 +48,26 @@ VALID_LIST_PARAM = ['layout', 'fieldlist', 'categories', 'filtermode',
 
 DEFAULT_DATE_FIELDS = ['created', 'updated', 'viewed']
 
+ACTIVITY_TYPES = {3: 'note', 4: 'event', 6: 'followup', 14: 'task',
+                  23: 'file', 24: 'photo', 32: 'opportunity',
+                  61: 'event', 73: 'calllog', 88: 'scheduledemail'}
+
 ERR_MSG_VALID_ENTITIES = 'Invalid entity. Valid once are: {entities}' \
     .format(entities=VALID_ENTITIES)
 ERR_MSG_INVALID_CRED = 'User and token required'
 
 
+class DeadlineExceeded(Exception):
+    """Raised when a request is not completed before its deadline."""
+
+
+def decode_page(content, date_fields):
+    """Decodes a raw list response page and parses its dates.
+    Used by list requests decoding pages in a process pool."""
+    return Solve360._parse_dates(json.loads(content.decode('utf-8')),
+                                 date_fields)
+
+
 def valid_entity(fun):
     """Validates that a valid Entity is set."""
 
@@ -47,96 +80,410 @@ def valid_entity(fun):
     return fn2
 
 
+def profiled(fun):
+    """Collects the phases of the call when profiling is enabled."""
+
+    def fn2(self, *args, **kwargs):
+        """Collects the phases of the call wrapper function."""
+        if not self.profiler:
+            return fun(self, *args, **kwargs)
+        name = fun.__name__.lstrip('_')
+        if kwargs.get('entity'):
+            name = '{name} {entity}'.format(name=name, entity=kwargs['entity'])
+        with self.profiler.call(name):
+            return fun(self, *args, **kwargs)
+
+    return fn2
+
+
 class Solve360(object):  # pylint: disable=R0904
     """Solve360 API wrapper class."""
 
-    def __init__(self, user, token, url='https://secure.solve360.com/{url}'):
-        """Sets given credentials and url for solve360."""
+    def __init__(self, user, token, url='https://secure.solve360.com/{url}',
+                 diff_updates=False, session=None, timeout=None, hedge=None,
+                 breaker=None, profile=False, transport=None, validate=False,
+                 cache=None):
+        """Sets given credentials and url for solve360.
+
+        :param diff_updates: bool - Only send changed fields on updates,
+            see ``_update``.
+        :param session: requests.Session - Session used for all requests,
+            allows sharing connections between clients.
+        :param timeout: float or tuple - Default request timeout in seconds,
+            either for both connect and read or as ``(connect, read)``.
+        :param hedge: HedgePolicy - Hedges slow GET requests when given.
+        :param breaker: CircuitBreaker - Fails fast while Solve360 is failing.
+        :param profile: bool - Record time per phase of each call in
+            ``profiler``, see ``solve360.profiling``.
+        :param transport: Transport - Sends the requests, defaults to a
+            ``RequestsTransport`` over ``session``, see ``solve360.transport``.
+        :param validate: bool - Check payloads against the field schemas
+            before sending them, raising ValidationError, see
+            ``solve360.validation``.
+        :param cache: SharedCache - Cache for show, metadata and report
+            responses, shared by the processes of a host.
+        """
         if not user or not token:
             raise ValueError(ERR_MSG_INVALID_CRED)
         self.auth = (user, token)
         self.url = url
         self.headers = {'Content-Type': 'application/json',
                         'Accept': 'application/json'}
-
-    @staticmethod
-    def _request(method, url, auth, headers, data=None):
+        self.diff_updates = diff_updates
+        self.known_state = OrderedDict()  # (entity, uid) -> last known fields
+        self.known_state_max = KNOWN_STATE_MAX
+        self.skipped_writes = 0
+        self._state_lock = threading.Lock()
+        self.session = session
+        self.transport = transport or RequestsTransport(session)
+        self.timeout = timeout
+        self.hedge = hedge
+        self.breaker = breaker
+        self.profiler = Profiler() if profile else None
+        self.validator = PayloadValidator(self) if validate else None
+        self.cache = cache
+        self.planner = None
+
+    @profiled
+    def _request(self, method, url, auth, headers, data=None, raw=False,
+                 timeout=None, expires=None):
         """Performs the given request and returns the parsed json response.
         In case of none 2XX response codes a HTTPError is raised.
-        Any given data is converted to json."""
+        Any given data is converted to json.
+        With ``raw`` set the response body is returned as bytes.
+
+        ``timeout`` overrides the client timeout for this request. With
+        ``expires``, a ``time.time()`` timestamp, the timeout is capped to
+        the time remaining and DeadlineExceeded is raised once it passes.
+
+        With a ``cache`` set, cacheable GET responses are served from and
+        stored in it, see ``solve360.cache``. While ``plan`` is active the
+        request is planned instead of sent.
+        """
         if data:
             data = json.dumps(data)
         method = method.lower()
         if method not in ['get', 'post', 'put', 'delete']:
             raise ValueError('Invalid method {method}'.format(method=method))
-        response = getattr(requests, method)(url,
-                                             auth=auth,
-                                             headers=headers,
-                                             data=data)
+        entry = self._cache_entry(method, url, auth) if self.cache else None
+        if entry:
+            content = self.cache.get(entry[0])
+            if content is not None:
+                if raw:
+                    return content
+                with self._phase('decode'):
+                    return cache_decode(content)
+        if self.planner is not None:
+            content = self.planner.send(method, url, auth, headers, data)
+            return content if raw else cache_decode(content)
+        timeout = self._timeout(self.timeout if timeout is None else timeout,
+                                expires)
+        send = functools.partial(self._send, method, url, auth, headers, data,
+                                 timeout, expires)
+        with self._phase('network'):
+            if self.breaker:
+                response = self.breaker.call(url, send)
+            else:
+                response = send()
+        with self._phase('download'):
+            content = response.content
+        if entry:
+            decoded = cache_decode(content)
+            self.cache.put(entry[0], entry[1], entry[2], content, decoded)
+            return content if raw else decoded
+        if raw:
+            return content
+        with self._phase('decode'):
+            return response.json()
+
+    def _cache_entry(self, method, url, auth):
+        """Returns ``(key, kind, tag)`` of a cacheable request, or None."""
+        root = self.url.split('{url}')[0]
+        if method != 'get' or not url.startswith(root):
+            return None
+        kind_tag = classify(urlsplit(url[len(root):]).path)
+        if kind_tag is None:
+            return None
+        return (self.cache.key(auth[0], url),) + kind_tag
+
+    def _invalidate(self, *tags, **kwargs):
+        """Invalidates cached responses affected by a write, see
+        ``SharedCache.invalidate``. Reports are always invalidated."""
+        if self.cache and self.planner is None:
+            self.cache.invalidate(tags + (REPORT,), kwargs.get('activity'))
+
+    def plan(self, response_bytes=None):
+        """Returns a context planning the requests made within it instead
+        of sending them, see ``solve360.planning``.
+
+        :param response_bytes: dict - Response size estimates per kind.
+        """
+        return Planner(self, response_bytes)
+
+    def _phase(self, name):
+        """Returns a context timing phase ``name`` when profiling."""
+        return self.profiler.phase(name) if self.profiler else NULL
+
+    def _send(self, method, url, auth, headers, data, timeout, expires):
+        """Sends the request, hedged if enabled, and checks the status."""
+        import requests  # Deferred to keep importing the package fast
+        send = functools.partial(self._attempt, method, url, auth, headers,
+                                 data, timeout)
+        try:
+            if self.hedge and method == 'get' and self._hedgeable(url):
+                response = self.hedge.run(send, url)
+            else:
+                response = send()
+        except requests.Timeout:
+            if expires is not None and time.time() >= expires:
+                raise DeadlineExceeded(url)
+            raise
         response.raise_for_status()
-        return response.json()
+        return response
+
+    def _attempt(self, method, url, auth, headers, data, timeout):
+        """Sends the request once over the transport, hedges send it once
+        more."""
+        return self.transport.send(method, url, auth=auth, headers=headers,
+                                   data=data, timeout=timeout,
+                                   stream=bool(self.profiler))
+
+    def _hedgeable(self, url):
+        """Returns whether a GET request is latency sensitive enough to be
+        hedged: shows, metadata and small list pages. Reports and large
+        list pages are not."""
+        root = self.url.split('{url}')[0]
+        parts = urlsplit(url[len(root):] if url.startswith(root) else url)
+        kind_tag = classify(parts.path)
+        if kind_tag is not None:
+            return kind_tag[0] != REPORT
+        if parts.path.strip('/') not in VALID_ENTITIES:
+            return True
+        limit = dict(parse_qsl(parts.query)).get('limit')
+        return limit is not None and limit.isdigit() and \
+            int(limit) <= self.hedge.max_list_limit
+
+    @staticmethod
+    def _timeout(timeout, expires):
+        """Returns ``timeout`` capped to the time remaining until ``expires``."""
+        if expires is None:
+            return timeout
+        remaining = expires - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(remaining if part is None else min(part, remaining)
+                         for part in timeout)
+        return min(timeout, remaining)
+
+    @staticmethod
+    def _expires(deadline):
+        """Returns the timestamp ``deadline`` seconds from now, if given."""
+        if deadline is None:
+            return None
+        return time.time() + deadline
 
     @valid_entity
-    def _create(self, payload, entity=None):
-        """Create a new entity with payload."""
+    def _create(self, payload, entity=None, timeout=None):
+        """Create a new entity with payload.
+
+        Like for all single requests, ``timeout`` overrides the client
+        timeout for this call.
+        """
+        if self.validator:
+            self.validator.validate(entity, payload, create=True)
         return self._request('post',
                              self.url.format(url='{type}/'.format(type=entity)),
                              self.auth,
                              self.headers,
-                             data=payload)
+                             data=payload,
+                             timeout=timeout)
 
     @valid_entity
-    def _update(self, uid, payload, entity=None):
-        """Updates given entity with payload."""
+    def _update(self, uid, payload, entity=None, baseline=None, timeout=None):
+        """Updates given entity with payload.
+
+        With ``diff_updates`` enabled or a ``baseline`` given, only fields
+        that differ from the baseline, or else the last known state in
+        ``known_state``, are sent. When nothing differs no request is made,
+        ``skipped_writes`` is incremented and ``{'status': 'skipped'}`` is
+        returned. The known state is recorded from shown entities and
+        successful updates, and can be seeded with ``remember``. It holds
+        the ``known_state_max`` most recently used records.
+
+        Only field values are diffed and remembered, see ``_field_keys``.
+        Commands like ``categories`` are always sent.
+        """
+        if self.validator:
+            self.validator.validate(entity, payload)
+        diff = self.diff_updates or baseline is not None
+        if diff:
+            if baseline is None:
+                baseline = self._known(entity, uid)
+            fields = self._field_keys(entity, payload)
+            payload = dict((k, v) for k, v in payload.items()
+                           if k not in fields or k not in baseline or
+                           baseline[k] != v)
+            if not payload:
+                with self._state_lock:
+                    self.skipped_writes += 1
+                return {'status': 'skipped'}
         url = self.url.format(url='{type}/{uid}/'.format(type=entity, uid=uid))
-        return self._request('put',
-                             url,
-                             self.auth,
-                             self.headers,
-                             data=payload)
+        response = self._request('put',
+                                 url,
+                                 self.auth,
+                                 self.headers,
+                                 data=payload,
+                                 timeout=timeout)
+        self._invalidate('{type}/{uid}'.format(type=entity, uid=uid))
+        if diff and self.planner is None:
+            self.remember(entity, uid, dict((k, v) for k, v in payload.items()
+                                            if k in fields))
+        return response
+
+    def _field_keys(self, entity, payload):
+        """Returns the keys of payload that are field values. Command keys
+        are left out and, with ``validate`` set, keys not in the fields
+        schema of entity."""
+        keys = set(payload) - set(COMMAND_KEYS)
+        if self.validator:
+            keys &= set(self.validator.schema(entity).checks)
+        return keys
+
+    def remember(self, entity, uid, fields):
+        """Records ``fields`` as the known state of entity with given ID.
+        Command keys like ``categories`` are not field values and ignored."""
+        key = (entity, str(uid))
+        with self._state_lock:
+            state = self.known_state.pop(key, {})
+            state.update((k, v) for k, v in fields.items()
+                         if k not in COMMAND_KEYS)
+            self.known_state[key] = state
+            while len(self.known_state) > self.known_state_max:
+                self.known_state.popitem(last=False)
+
+    def forget(self, entity, uid):
+        """Drops the known state of entity with given ID."""
+        with self._state_lock:
+            self.known_state.pop((entity, str(uid)), None)
+
+    def _known(self, entity, uid):
+        """Returns a copy of the known state of entity with given ID and
+        marks it as recently used."""
+        key = (entity, str(uid))
+        with self._state_lock:
+            state = self.known_state.pop(key, None)
+            if state is None:
+                return {}
+            self.known_state[key] = state
+            return dict(state)
 
     @valid_entity
+    @profiled
     def _show(self, uid, entity=None, **kwargs):
-        """Show detailed information about entity with given ID."""
+        """Show detailed information about entity with given ID.
+        With ``indexed`` set the response is wrapped in a ``ShowResult``,
+        ``timeout`` overrides the client timeout."""
         url = self.url.format(url='{type}/{uid}/'.format(type=entity, uid=uid))
         response = self._request('get',
                                  url,
                                  self.auth,
-                                 self.headers)
+                                 self.headers,
+                                 timeout=kwargs.get('timeout'))
+        if self.diff_updates:
+            item = find_item(response)
+            if isinstance(item.get('fields'), dict):
+                self.remember(entity, uid, item['fields'])
         date_fields = kwargs.get('date_fields', DEFAULT_DATE_FIELDS)
-        response = self._parse_dates(response, date_fields)
+        with self._phase('parse_dates'):
+            response = self._parse_dates(response, date_fields)
+        if kwargs.get('indexed'):
+            return ShowResult(response)
         return response
 
     @valid_entity
-    def _destroy(self, uid, entity=None):
+    def _destroy(self, uid, entity=None, timeout=None):
         """Delete the entity with given ID."""
         url = self.url.format(url='{type}/{uid}/'.format(type=entity, uid=uid))
-        return self._request('delete',
-                             url,
-                             self.auth,
-                             self.headers)
+        if self.planner is None:
+            self.forget(entity, uid)
+        response = self._request('delete',
+                                 url,
+                                 self.auth,
+                                 self.headers,
+                                 timeout=timeout)
+        self._invalidate('{type}/{uid}'.format(type=entity, uid=uid))
+        return response
+
+    @valid_entity
+    def _destroy_many(self, uids, entity=None, workers=4, tombstones=None,
+                      timeout=None):
+        """Destroys the entities with given IDs, ``workers`` at a time.
+        See ``_destroy_all`` for the result and ``tombstones``."""
+        return self._destroy_all(
+            [(entity, str(uid)) for uid in uids],
+            lambda key: self._destroy(key[1], entity=entity, timeout=timeout),
+            workers, tombstones)
+
+    def _destroy_all(self, keys, destroy, workers, tombstones):
+        """Calls ``destroy(key)`` for the keys concurrently.
+
+        A 404 response counts as success, the record is already gone, and
+        ``{'status': 'missing'}`` is its response. Destroyed keys are logged
+        to ``tombstones``, a ``TombstoneLog`` or its path, and keys already
+        logged are skipped with response ``{'status': 'skipped'}``.
+        Returns a dict of ID to ``(response, error)``.
+        """
+        if tombstones is not None and not isinstance(tombstones, TombstoneLog):
+            tombstones = TombstoneLog(tombstones)
+
+        def destroy_one(key):
+            """Destroys one record, logging its tombstone."""
+            if tombstones is not None and key in tombstones:
+                return {'status': 'skipped'}
+            try:
+                response = destroy(key)
+            except Exception as error:  # pylint: disable=W0703
+                if getattr(getattr(error, 'response', None),
+                           'status_code', None) != 404:
+                    raise
+                response = {'status': 'missing'}
+            if tombstones is not None and self.planner is None:
+                tombstones.add(*key)
+            return response
+
+        results = map_concurrent(destroy_one, keys, workers=workers)
+        return dict((key[-1], result) for key, result in results.items())
+
+    @staticmethod
+    def _list_params(**kwargs):
+        """Returns the given kwargs that are valid list query parameters."""
+        return dict((k, v) for k, v in kwargs.items()
+                    if (v or v == 0) and k in VALID_LIST_PARAM)
 
     def _list_build_query(self, entity, **kwargs):
         """Builds the url and query for a list type entity request.
         The query might be updated when fetching incomplete set"""
-        payload = dict((k, v) for k, v in kwargs.items()
-                       if (v or v == 0) and k in VALID_LIST_PARAM)
-        query = urllib_.urlencode(payload)
+        query = urllib_.urlencode(self._list_params(**kwargs))
         url = self.url.format(url='{type}/?{query}'.format(type=entity,
                                                            query=query))
         return url
 
-    def _parse_dates(self, entries, date_fields=None):
+    @staticmethod
+    def _parse_dates(entries, date_fields=None):
         """Create datetime parsed versions of dates found in entries."""
         if date_fields:
             for entry in entries:
                 if entry not in ['count', 'status']:
-                    self._parse_date(entries[entry], date_fields)
+                    Solve360._parse_date(entries[entry], date_fields)
         return entries
 
     @staticmethod
     def _parse_date_wrapper(entry, field):
         """Returns a dict with a new field name for the parsed date. """
+        from iso8601 import iso8601, ParseError  # Deferred, see _send
         try:
             return {'{}_parsed'.format(field): iso8601.parse_date(entry[field])}
         except ParseError:
@@ -153,139 +500,414 @@ class Solve360(object):  # pylint: disable=R0904
          - Entry -> item -> fields
          - Entry -> item -> activities -> <activity>
         """
-        for field in date_fields:
-            if field in entry:
-                entry.update(Solve360._parse_date_wrapper(entry, field))
-            if 'item' in entry:  # Show operation response
-                if field in entry['item']:
-                    entry['item'].update(Solve360._parse_date_wrapper(entry['item'], field))
-                if 'fields' in entry['item'] and field in entry['item']['fields']:
-                    entry['item']['fields'].update(
-                        Solve360._parse_date_wrapper(entry['item']['fields'],
-                                                     field))
-                if 'activities' in entry['item']:
-                    for activity in entry['item']['activities']:
-                        if field in entry['item']['activities'][activity]:
-                            entry['item']['activities'][activity].update(
-                                Solve360._parse_date_wrapper(entry['item']['activities'][activity],
-                                                             field))
+        entries = [entry]
+        if 'item' in entry:  # Show operation response
+            entries.append(entry['item'])
+            if 'fields' in entry['item']:
+                entries.append(entry['item']['fields'])
+            if 'activities' in entry['item']:
+                entries.extend(entry['item']['activities'].values())
+        for _entry in entries:
+            for field in date_fields:
+                if field in _entry:
+                    _entry.update(Solve360._parse_date_wrapper(_entry, field))
         return entry
 
     @valid_entity
+    @profiled
     def _list(self, entity=None, **kwargs):
-        """List entities."""
-        response = {}
+        """List entities.
+
+        Dates are parsed page by page before each page is merged into the
+        result created by ``backend`` (defaults to ``dict``). See
+        ``solve360.results`` for a disk-backed alternative.
+
+        With a ``decode_pool`` and ``limit`` given, pages after the first are
+        decoded in the pool, see ``_list_decode_pages``.
+
+        ``timeout`` applies to each request. With ``deadline`` seconds given
+        for the whole listing, the pages completed before it are returned
+        with ``status`` set to ``STATUS_DEADLINE_EXCEEDED``, so a truncated
+        listing can be told from a complete one.
+
+        With ``keyset`` set to a field name, pages are sorted and continued
+        by that field, see ``_list_keyset``.
+        """
+        response = kwargs.get('backend', dict)()
+        date_fields = kwargs.get('date_fields', DEFAULT_DATE_FIELDS)
+        expires = self._expires(kwargs.get('deadline'))
         pages = kwargs.get('pages', 1)
         if not type(pages) == int or not pages > 0:
             raise ValueError('Parameter <pages> must be a positive number.')
+        if kwargs.get('keyset'):
+            return self._list_keyset(entity, response, pages, expires, **kwargs)
         while pages > 0:
-            _response = self._request('get',
-                                      self._list_build_query(entity, **kwargs),
-                                      self.auth,
-                                      self.headers)
-            response.update(_response)
+            try:
+                _response = self._request('get',
+                                          self._list_build_query(entity, **kwargs),
+                                          self.auth,
+                                          self.headers,
+                                          timeout=kwargs.get('timeout'),
+                                          expires=expires)
+            except DeadlineExceeded:
+                self._deadline_exceeded(response)
+                break
+            self._list_merge(response, _response, date_fields)
             kwargs['start'] = kwargs.get('start', 0) + kwargs.get('limit', 0)
             pages -= 1
             # Checking response entities excluding keys 'count' and 'status'
             if 'count' in response and response['count'] == len(response) - 2:
                 break  # We got all objects
+            if pages and kwargs.get('decode_pool') and kwargs.get('limit'):
+                self._list_decode_pages(entity, response, pages, expires,
+                                        **kwargs)
+                break
+
+        return response
 
+    def _list_keyset(self, entity, response, remaining_pages, expires,
+                     **kwargs):
+        """Fetches up to ``remaining_pages`` pages sorted ascending by the
+        ``keyset`` field, continuing after the last object seen.
+
+        Each page after the first overlaps the previous page by one object.
+        Objects are recognised as seen by their field value, compared like
+        the server sorts it (see ``_keyset_value``), and for ties with the
+        last value seen by their ID, so ties may be in any order as long as
+        the server keeps it between requests. If objects were created
+        before the offset the page holds more than one seen object and
+        those are skipped. If objects were removed the page holds none, or
+        is empty, then the offset is stepped back until a seen object is
+        reached again so no object is skipped. Both cases are reported to
+        ``on_drift``, a callable given a dict with ``offset``, ``shift``
+        ('created' or 'removed') and ``key``, the last value seen.
+        """
+        field = kwargs['keyset']
+        kwargs['sortfield'] = field
+        kwargs['sortdir'] = 'ASC'
+        kwargs['limit'] = kwargs.get('limit') or LIST_MAX_LIMIT
+        if kwargs['limit'] < 2:
+            raise ValueError('Parameter <limit> must be at least 2 with <keyset>.')
+        date_fields = kwargs.get('date_fields', DEFAULT_DATE_FIELDS)
+        on_drift = kwargs.get('on_drift')
+
+        offset = kwargs.get('start', 0)
+        last = None  # (value, raw value) of the last value seen
+        last_uids = set()  # IDs seen with the last value
+        stepped_back = False
+        while remaining_pages > 0:
+            kwargs['start'] = offset
+            try:
+                page = self._request('get',
+                                     self._list_build_query(entity, **kwargs),
+                                     self.auth,
+                                     self.headers,
+                                     timeout=kwargs.get('timeout'),
+                                     expires=expires)
+            except DeadlineExceeded:
+                self._deadline_exceeded(response)
+                break
+            remaining_pages -= 1
+            values = dict((uid, self._keyset_value(page[uid].get(field)))
+                          for uid in page if uid not in ['count', 'status'])
+            new = [uid for uid in values if last is None or
+                   values[uid] > last[0] or
+                   (values[uid] == last[0] and uid not in last_uids)]
+            seen = len(values) - len(new)
+            # The previous page was full, so a page without seen objects,
+            # even an empty one, started past the overlap
+            if last is not None and offset > 0 and not seen:
+                if on_drift:
+                    on_drift({'offset': offset, 'shift': 'removed',
+                              'key': last[1]})
+                offset = max(0, offset - kwargs['limit'] + 1)
+                stepped_back = True
+                continue
+            if last is not None and seen > 1 and on_drift and not stepped_back:
+                on_drift({'offset': offset, 'shift': 'created', 'key': last[1]})
+            stepped_back = False
+            if new:
+                top = max(values[uid] for uid in new)
+                if last is None or top > last[0]:
+                    last_uids = set()
+                last_uids.update(uid for uid in new if values[uid] == top)
+                last = (top, next(page[uid].get(field) for uid in new
+                                  if values[uid] == top))
+            _page = dict((uid, page[uid]) for uid in new)
+            for meta in ['count', 'status']:
+                if meta in page:
+                    _page[meta] = page[meta]
+            self._list_merge(response, _page, date_fields)
+            if len(values) < kwargs['limit']:
+                break  # Last page
+            offset += len(values) - 1  # Overlap the last object seen
+        return response
+
+    @staticmethod
+    def _keyset_value(value):
+        """Returns a sort key of a field value ordered like the server
+        orders the field: empty values first, then numbers by value, then
+        other values, like dates, as text."""
+        if value is None or value == '':
+            return (0, 0, u'')
+        if not isinstance(value, bool):
+            try:
+                return (1, float(value), u'')
+            except (TypeError, ValueError):
+                pass
+        return (2, 0, u'{}'.format(value))
+
+    def _list_decode_pages(self, entity, response, remaining_pages, expires,
+                           **kwargs):
+        """Fetches the ``remaining_pages`` of a list request as raw bytes.
+
+        Pages are decoded and date parsed by ``decode_pool``, any object with
+        a ``multiprocessing.Pool`` compatible ``apply_async``, and merged
+        into ``response`` in page order. The number of pages is planned from
+        ``count`` of the first page.
+        """
         date_fields = kwargs.get('date_fields', DEFAULT_DATE_FIELDS)
-        response = self._parse_dates(response, date_fields)
+        if 'count' in response:
+            remaining = response['count'] - (len(response) - 2)
+            remaining_pages = min(remaining_pages,  # Ceiling division
+                                  -(-remaining // kwargs['limit']))
+        pending = deque()
+        exceeded = False
+        for _ in range(remaining_pages):
+            try:
+                content = self._request('get',
+                                        self._list_build_query(entity, **kwargs),
+                                        self.auth,
+                                        self.headers,
+                                        raw=True,
+                                        timeout=kwargs.get('timeout'),
+                                        expires=expires)
+            except DeadlineExceeded:
+                exceeded = True
+                break
+            pending.append(kwargs['decode_pool'].apply_async(
+                decode_page, (content, date_fields)))
+            kwargs['start'] += kwargs['limit']
+            if len(pending) > MAX_PENDING_DECODES:
+                self._list_merge_decoded(response, pending.popleft())
+        while pending:
+            self._list_merge_decoded(response, pending.popleft())
+        if exceeded:
+            self._deadline_exceeded(response)
+
+    @staticmethod
+    def _deadline_exceeded(response):
+        """Marks a listing cut short by its deadline."""
+        response.update({'status': STATUS_DEADLINE_EXCEEDED})
+
+    def _list_merge(self, response, page, date_fields):
+        """Parses the dates of a list page and merges it into response."""
+        with self._phase('parse_dates'):
+            page = self._parse_dates(page, date_fields)
+        with self._phase('merge'):
+            response.update(page)
+
+    def _list_merge_decoded(self, response, pending):
+        """Waits for a page decoded in a decode pool and merges it."""
+        with self._phase('decode'):
+            page = pending.get()
+        with self._phase('merge'):
+            response.update(page)
 
+    @valid_entity
+    @profiled
+    def _list_all(self, entity=None, checkpoint=None, **kwargs):
+        """List all entities.
+
+        The first page is used to read ``count`` and plan the offsets of
+        all remaining pages, each page holding ``limit`` objects (defaults
+        to ``LIST_MAX_LIMIT``). Parameters ``start`` and ``pages`` are
+        ignored, ``backend`` and ``date_fields`` work as for ``_list``.
+
+        :param checkpoint: str - Path to a file where progress is saved.
+            Calling again with the same path resumes an interrupted listing.
+            The checkpoint is removed once all pages are fetched.
+
+        ``timeout`` and ``deadline`` work as for ``_list``. A checkpoint is
+        kept when the deadline is exceeded, and ``status`` of the partial
+        result is ``STATUS_DEADLINE_EXCEEDED``.
+        """
+        kwargs['limit'] = kwargs.get('limit') or LIST_MAX_LIMIT
+        kwargs.pop('start', None)
+        kwargs.pop('pages', None)
+        query = urllib_.urlencode(sorted(self._list_params(**kwargs).items()))
+        progress = None
+        saved = set()
+        if checkpoint:
+            progress = ListCheckpoint(checkpoint, entity, query)
+            saved = set(progress.load())
+
+        response = kwargs.get('backend', dict)()
+        date_fields = kwargs.get('date_fields', DEFAULT_DATE_FIELDS)
+        expires = self._expires(kwargs.get('deadline'))
+        count = progress.count if progress else None
+        try:
+            page = progress.read(0) if 0 in saved else None
+            if page is None:
+                page = self._list_page(entity, 0, progress, expires, **kwargs)
+                count = page.get('count', 0)
+            self._list_merge(response, page, date_fields)
+
+            for start in range(kwargs['limit'], count or 0, kwargs['limit']):
+                # Saved pages are read back one at a time as they are merged
+                page = progress.read(start) if start in saved else None
+                if page is None:
+                    page = self._list_page(entity, start, progress, expires,
+                                           **kwargs)
+                self._list_merge(response, page, date_fields)
+        except DeadlineExceeded:
+            self._deadline_exceeded(response)
+            return response
+
+        if progress and self.planner is None:
+            progress.remove()
         return response
 
+    def _list_page(self, entity, start, progress=None, expires=None, **kwargs):
+        """Fetches the list page at offset ``start``.
+        The page is saved to ``progress`` if given."""
+        kwargs['start'] = start
+        page = self._request('get',
+                             self._list_build_query(entity, **kwargs),
+                             self.auth,
+                             self.headers,
+                             timeout=kwargs.get('timeout'),
+                             expires=expires)
+        if progress and self.planner is None:
+            progress.save(start, page, page.get('count', 0))
+        return page
+
     @valid_entity
-    def _create_categories(self, name, entity=None):
+    def _create_categories(self, name, entity=None, timeout=None):
         """Creates a category tag for type entity."""
         url = self.url.format(url='{type}/categories/'.format(type=entity))
-        return self._request('post',
-                             url,
-                             self.auth,
-                             self.headers,
-                             data={'name': name})
+        response = self._request('post',
+                                 url,
+                                 self.auth,
+                                 self.headers,
+                                 data={'name': name},
+                                 timeout=timeout)
+        self._invalidate('{type}/categories'.format(type=entity))
+        return response
 
     @valid_entity
-    def _list_categories(self, entity=None):
+    def _list_categories(self, entity=None, timeout=None):
         """List category tags for type entity."""
         url = self.url.format(url='{type}/categories/'.format(type=entity))
         return self._request('get',
                              url,
                              self.auth,
-                             self.headers)
+                             self.headers,
+                             timeout=timeout)
 
     @valid_entity
-    def _list_fields(self, entity=None):
+    def _list_fields(self, entity=None, timeout=None):
         """List fields for type entity."""
         url = self.url.format(url='{type}/fields/'.format(type=entity))
         return self._request('get',
                              url,
                              self.auth,
-                             self.headers)
+                             self.headers,
+                             timeout=timeout)
 
-    def list_ownership(self):
+    def list_ownership(self, timeout=None):
         """List available users and workgroups."""
         return self._request('get',
                              self.url.format(url='ownership/'),
                              self.auth,
-                             self.headers)
+                             self.headers,
+                             timeout=timeout)
 
     @valid_entity
-    def _create_activity(self, parent, segment, payload, entity=None):
+    def _create_activity(self, parent, segment, payload, entity=None,
+                         timeout=None):
         """Creates a new activity linked to a parent entity.
 
         See http://norada.com/answers/api/external_api_reference_contacts
         for available activities.
         """
+        if self.validator:
+            self.validator.validate_activity(segment, payload, create=True)
         _payload = dict()
         _payload['parent'] = parent
         _payload['data'] = payload
         url = self.url.format(url='{type}/{segment}/'
                               .format(type=entity,
                                       segment=segment))
-        return self._request('post',
-                             url,
-                             self.auth,
-                             self.headers,
-                             data=_payload)
+        response = self._request('post',
+                                 url,
+                                 self.auth,
+                                 self.headers,
+                                 data=_payload,
+                                 timeout=timeout)
+        self._invalidate('{type}/{uid}'.format(type=entity, uid=parent))
+        return response
 
     @valid_entity
-    def _update_activity(self, segment, activity_id, payload, entity=None):
+    def _update_activity(self, segment, activity_id, payload, entity=None,
+                         timeout=None):
         """Updates an activity with id ``activity_id``."""
+        if self.validator:
+            self.validator.validate_activity(segment, payload)
         _payload = dict()
         _payload['data'] = payload
         url = self.url.format(url='{type}/{segment}/{id}/'
                               .format(type=entity,
                                       segment=segment,
                                       id=activity_id))
-        return self._request('put',
-                             url,
-                             self.auth,
-                             self.headers,
-                             data=_payload)
+        response = self._request('put',
+                                 url,
+                                 self.auth,
+                                 self.headers,
+                                 data=_payload,
+                                 timeout=timeout)
+        self._invalidate(activity=activity_id)
+        return response
 
     @valid_entity
-    def _destroy_activity(self, segment, activity_id, entity=None):
+    def _destroy_activity(self, segment, activity_id, entity=None,
+                          timeout=None):
         """Deletes an activity with id ``activity_id``."""
         url = self.url.format(url='{type}/{segment}/{id}/'
                               .format(type=entity,
                                       segment=segment,
                                       id=activity_id))
-        return self._request('delete',
-                             url,
-                             self.auth,
-                             self.headers)
+        response = self._request('delete',
+                                 url,
+                                 self.auth,
+                                 self.headers,
+                                 timeout=timeout)
+        self._invalidate(activity=activity_id)
+        return response
+
+    @valid_entity
+    def _destroy_activities(self, segment, activity_ids, entity=None,
+                            workers=4, tombstones=None, timeout=None):
+        """Deletes the activities with given IDs, ``workers`` at a time.
+        See ``_destroy_all`` for the result and ``tombstones``."""
+        return self._destroy_all(
+            [(entity, segment, str(uid)) for uid in activity_ids],
+            lambda key: self._destroy_activity(segment, key[2], entity=entity,
+                                               timeout=timeout),
+            workers, tombstones)
 
     # Contacts
 
-    def create_contact(self, payload):
+    def create_contact(self, payload, timeout=None):
         """Creates a new contact.
 
         :param payload: dict - Full or partial contact data to update.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._create(payload, entity=ENTITY_CONTACT)
+        return self._create(payload, entity=ENTITY_CONTACT, timeout=timeout)
 
-    def show_contact(self, contact_id):
+    def show_contact(self, contact_id, indexed=False, timeout=None):
         """Shows a contact.
 
         Shows all data related to an existing contact
@@ -293,23 +915,49 @@ class Solve360(object):  # pylint: disable=R0904
         all activities (excluding email messages).
 
         :param contact_id: int - id of the contact to update.
+        :param indexed: bool - Return a ``ShowResult`` with indexed activities.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._show(contact_id, entity=ENTITY_CONTACT)
+        return self._show(contact_id, entity=ENTITY_CONTACT, indexed=indexed,
+                          timeout=timeout)
 
-    def update_contact(self, contact_id, payload):
+    def update_contact(self, contact_id, payload, baseline=None, timeout=None):
         """Updates an existing contact.
 
         :param contact_id: int - id of the contact to update.
         :param payload: dict - Full or partial contact data to update.
+        :param baseline: dict - Known contact data, only changed fields are sent.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._update(contact_id, payload, entity=ENTITY_CONTACT)
+        return self._update(contact_id, payload, entity=ENTITY_CONTACT,
+                            baseline=baseline, timeout=timeout)
 
-    def destroy_contact(self, contact_id):
+    def destroy_contact(self, contact_id, timeout=None):
         """Destroys an existing contact.
 
         :param contact_id: int - id of the contact to destroy.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._destroy(contact_id, entity=ENTITY_CONTACT)
+        return self._destroy(contact_id, entity=ENTITY_CONTACT,
+                             timeout=timeout)
+
+    def destroy_contacts(self, contact_ids, workers=4, tombstones=None,
+                         timeout=None):
+        """Destroys contacts concurrently.
+
+        :param contact_ids: list - ids of the contacts to destroy.
+        :param workers: int - Max concurrent requests.
+        :param tombstones: str - Path of a ``TombstoneLog`` skipping contacts
+            already destroyed, see ``_destroy_all``.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
+        """
+        return self._destroy_many(contact_ids, entity=ENTITY_CONTACT,
+                                  workers=workers, tombstones=tombstones,
+                                  timeout=timeout)
 
     def list_contacts(self, **kwargs):
         """List contacts that match the requested criteria.
@@ -318,60 +966,96 @@ class Solve360(object):  # pylint: disable=R0904
         """
         return self._list(entity=ENTITY_CONTACT, **kwargs)
 
-    def create_contacts_category(self, name):
+    def list_all_contacts(self, **kwargs):
+        """List all contacts that match the requested criteria.
+
+        :param kwargs: dict - valid value is documented in method ``_list_all``.
+        """
+        return self._list_all(entity=ENTITY_CONTACT, **kwargs)
+
+    def create_contacts_category(self, name, timeout=None):
         """Creates a contact category tag.
 
         :param name: Name for category.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._create_categories(name, entity=ENTITY_CONTACT)
+        return self._create_categories(name, entity=ENTITY_CONTACT,
+                                       timeout=timeout)
 
-    def list_contacts_categories(self):
+    def list_contacts_categories(self, timeout=None):
         """List available contact category tags."""
-        return self._list_categories(entity=ENTITY_CONTACT)
+        return self._list_categories(entity=ENTITY_CONTACT, timeout=timeout)
 
-    def list_contacts_fields(self):
+    def list_contacts_fields(self, timeout=None):
         """List available contact fields."""
-        return self._list_fields(entity=ENTITY_CONTACT)
+        return self._list_fields(entity=ENTITY_CONTACT, timeout=timeout)
 
-    def create_contact_activity(self, contact_id, segment, payload):
+    def create_contact_activity(self, contact_id, segment, payload,
+                                timeout=None):
         """Creates a contact activity.
 
         :param contact_id: int - id of the contact to create the activity for.
         :param segment: str - type of segment. See ``_create_activity``.
         :param payload: dict - Activity data.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
         return self._create_activity(contact_id, segment, payload,
-                                     entity=ENTITY_CONTACT)
+                                     entity=ENTITY_CONTACT, timeout=timeout)
 
-    def update_contact_activity(self, segment, activity_id, payload):
+    def update_contact_activity(self, segment, activity_id, payload,
+                                timeout=None):
         """Updates a contact activity.
 
         :param segment: str - type of segment. See ``_create_activity``.
         :param activity_id: int - id of the activity to update.
         :param payload: dict - Full or partial activity data to update.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
         return self._update_activity(segment, activity_id, payload,
-                                     entity=ENTITY_CONTACT)
+                                     entity=ENTITY_CONTACT, timeout=timeout)
 
-    def destroy_contact_activity(self, segment, activity_id):
+    def destroy_contact_activity(self, segment, activity_id, timeout=None):
         """Destroys a contact activity.
 
         :param segment: str - type of segment. See ``_create_activity``.
         :param activity_id: int - id of the activity to update.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
         return self._destroy_activity(segment, activity_id,
-                                      entity=ENTITY_CONTACT)
+                                      entity=ENTITY_CONTACT, timeout=timeout)
+
+    def destroy_contact_activities(self, segment, activity_ids, workers=4,
+                                   tombstones=None, timeout=None):
+        """Destroys contact activities concurrently.
+
+        :param segment: str - type of segment. See ``_create_activity``.
+        :param activity_ids: list - ids of the activities to destroy.
+        :param workers: int - Max concurrent requests.
+        :param tombstones: str - Path of a ``TombstoneLog``, see
+            ``_destroy_all``.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
+        """
+        return self._destroy_activities(segment, activity_ids,
+                                        entity=ENTITY_CONTACT, workers=workers,
+                                        tombstones=tombstones, timeout=timeout)
 
     # Companies
 
-    def create_company(self, payload):
+    def create_company(self, payload, timeout=None):
         """Creates a new company.
 
         :param payload: dict - Full or partial company data to update.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._create(payload, entity=ENTITY_COMPANY)
+        return self._create(payload, entity=ENTITY_COMPANY, timeout=timeout)
 
-    def show_company(self, company_id):
+    def show_company(self, company_id, indexed=False, timeout=None):
         """Shows a company.
 
         Shows all data related to an existing company
@@ -379,23 +1063,49 @@ class Solve360(object):  # pylint: disable=R0904
         all activities (excluding email messages).
 
         :param company_id: int - id of the company to update.
+        :param indexed: bool - Return a ``ShowResult`` with indexed activities.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._show(company_id, entity=ENTITY_COMPANY)
+        return self._show(company_id, entity=ENTITY_COMPANY, indexed=indexed,
+                          timeout=timeout)
 
-    def update_company(self, company_id, payload):
+    def update_company(self, company_id, payload, baseline=None, timeout=None):
         """Updates an existing company.
 
         :param company_id: int - id of the company to update.
         :param payload: dict - Full or partial company data to update.
+        :param baseline: dict - Known company data, only changed fields are sent.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._update(company_id, payload, entity=ENTITY_COMPANY)
+        return self._update(company_id, payload, entity=ENTITY_COMPANY,
+                            baseline=baseline, timeout=timeout)
 
-    def destroy_company(self, company_id):
+    def destroy_company(self, company_id, timeout=None):
         """Destroys an existing company.
 
         :param company_id: int - id of the company to destroy.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._destroy(company_id, entity=ENTITY_COMPANY)
+        return self._destroy(company_id, entity=ENTITY_COMPANY,
+                             timeout=timeout)
+
+    def destroy_companies(self, company_ids, workers=4, tombstones=None,
+                          timeout=None):
+        """Destroys companies concurrently.
+
+        :param company_ids: list - ids of the companies to destroy.
+        :param workers: int - Max concurrent requests.
+        :param tombstones: str - Path of a ``TombstoneLog`` skipping companies
+            already destroyed, see ``_destroy_all``.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
+        """
+        return self._destroy_many(company_ids, entity=ENTITY_COMPANY,
+                                  workers=workers, tombstones=tombstones,
+                                  timeout=timeout)
 
     def list_companies(self, **kwargs):
         """List companies that match the requested criteria.
@@ -404,60 +1114,97 @@ class Solve360(object):  # pylint: disable=R0904
         """
         return self._list(entity=ENTITY_COMPANY, **kwargs)
 
-    def create_company_category(self, name):
+    def list_all_companies(self, **kwargs):
+        """List all companies that match the requested criteria.
+
+        :param kwargs: dict - valid value is documented in method ``_list_all``.
+        """
+        return self._list_all(entity=ENTITY_COMPANY, **kwargs)
+
+    def create_company_category(self, name, timeout=None):
         """Creates a company category tag.
 
         :param name: Name for category.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._create_categories(name, entity=ENTITY_COMPANY)
+        return self._create_categories(name, entity=ENTITY_COMPANY,
+                                       timeout=timeout)
 
-    def list_companies_categories(self):
+    def list_companies_categories(self, timeout=None):
         """List available company category tags."""
-        return self._list_categories(entity=ENTITY_COMPANY)
+        return self._list_categories(entity=ENTITY_COMPANY, timeout=timeout)
 
-    def list_companies_fields(self):
+    def list_companies_fields(self, timeout=None):
         """List available company fields."""
-        return self._list_fields(entity=ENTITY_COMPANY)
+        return self._list_fields(entity=ENTITY_COMPANY, timeout=timeout)
 
-    def create_company_activity(self, company_id, segment, payload):
+    def create_company_activity(self, company_id, segment, payload,
+                                timeout=None):
         """Creates a company activity.
 
         :param company_id: int - id of the company to create the activity for.
         :param segment: str - type of activity. See ``_create_activity``.
         :param payload: dict - Activity data.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
         return self._create_activity(company_id, segment, payload,
-                                     entity=ENTITY_COMPANY)
+                                     entity=ENTITY_COMPANY, timeout=timeout)
 
-    def update_company_activity(self, segment, activity_id, payload):
+    def update_company_activity(self, segment, activity_id, payload,
+                                timeout=None):
         """Updates a company activity.
 
         :param segment: int - type of segment. See ``_create_activity``.
         :param activity_id: str - id of the activity to update.
         :param payload: dict - Full or partial segment data to update.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
         return self._update_activity(segment, activity_id, payload,
-                                     entity=ENTITY_COMPANY)
+                                     entity=ENTITY_COMPANY, timeout=timeout)
 
-    def destroy_company_activity(self, segment, activity_id):
+    def destroy_company_activity(self, segment, activity_id, timeout=None):
         """Destroys a company activity.
 
         :param segment: str - type of segment. See ``_create_activity``.
         :param activity_id: int - id of the segment to update.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
         return self._destroy_activity(segment, activity_id,
-                                      entity=ENTITY_COMPANY)
+                                      entity=ENTITY_COMPANY, timeout=timeout)
+
+    def destroy_company_activities(self, segment, activity_ids, workers=4,
+                                   tombstones=None, timeout=None):
+        """Destroys company activities concurrently.
+
+        :param segment: str - type of segment. See ``_create_activity``.
+        :param activity_ids: list - ids of the activities to destroy.
+        :param workers: int - Max concurrent requests.
+        :param tombstones: str - Path of a ``TombstoneLog``, see
+            ``_destroy_all``.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
+        """
+        return self._destroy_activities(segment, activity_ids,
+                                        entity=ENTITY_COMPANY, workers=workers,
+                                        tombstones=tombstones, timeout=timeout)
 
     # Projectblogs
 
-    def create_projectblog(self, payload):
+    def create_projectblog(self, payload, timeout=None):
         """Creates a new projectblog.
 
         :param payload: dict - Full or partial projectblog data to update.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._create(payload, entity=ENTITY_PROJECTBLOG)
+        return self._create(payload, entity=ENTITY_PROJECTBLOG,
+                            timeout=timeout)
 
-    def show_projectblog(self, projectblog_id):
+    def show_projectblog(self, projectblog_id, indexed=False, timeout=None):
         """Shows a projectblog.
 
         Shows all data related to an existing projectblog
@@ -465,23 +1212,50 @@ class Solve360(object):  # pylint: disable=R0904
         all activities (excluding email messages).
 
         :param projectblog_id: int - id of the projectblog to update.
+        :param indexed: bool - Return a ``ShowResult`` with indexed activities.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._show(projectblog_id, entity=ENTITY_PROJECTBLOG)
+        return self._show(projectblog_id, entity=ENTITY_PROJECTBLOG, indexed=indexed,
+                          timeout=timeout)
 
-    def update_projectblog(self, projectblog_id, payload):
+    def update_projectblog(self, projectblog_id, payload, baseline=None,
+                           timeout=None):
         """Updates an existing projectblog.
 
         :param projectblog_id: int - id of the projectblog to update.
         :param payload: dict - Full or partial projectblog data to update.
+        :param baseline: dict - Known projectblog data, only changed fields are sent.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._update(projectblog_id, payload, entity=ENTITY_PROJECTBLOG)
+        return self._update(projectblog_id, payload, entity=ENTITY_PROJECTBLOG,
+                            baseline=baseline, timeout=timeout)
 
-    def destroy_projectblog(self, projectblog_id):
+    def destroy_projectblog(self, projectblog_id, timeout=None):
         """Destroys an existing projectblog.
 
         :param projectblog_id: int - id of the projectblog to destroy.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._destroy(projectblog_id, entity=ENTITY_PROJECTBLOG)
+        return self._destroy(projectblog_id, entity=ENTITY_PROJECTBLOG,
+                             timeout=timeout)
+
+    def destroy_projectblogs(self, projectblog_ids, workers=4, tombstones=None,
+                             timeout=None):
+        """Destroys projectblogs concurrently.
+
+        :param projectblog_ids: list - ids of the projectblogs to destroy.
+        :param workers: int - Max concurrent requests.
+        :param tombstones: str - Path of a ``TombstoneLog`` skipping projectblogs
+            already destroyed, see ``_destroy_all``.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
+        """
+        return self._destroy_many(projectblog_ids, entity=ENTITY_PROJECTBLOG,
+                                  workers=workers, tombstones=tombstones,
+                                  timeout=timeout)
 
     def list_projectblogs(self, **kwargs):
         """List projectblogs that match the requested criteria.
@@ -490,49 +1264,87 @@ class Solve360(object):  # pylint: disable=R0904
         """
         return self._list(entity=ENTITY_PROJECTBLOG, **kwargs)
 
-    def create_projectblog_category(self, name):
+    def list_all_projectblogs(self, **kwargs):
+        """List all projectblogs that match the requested criteria.
+
+        :param kwargs: dict - valid value is documented in method ``_list_all``.
+        """
+        return self._list_all(entity=ENTITY_PROJECTBLOG, **kwargs)
+
+    def create_projectblog_category(self, name, timeout=None):
         """Creates a projectblog category tag.
 
         :param name: Name for category.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
-        return self._create_categories(name, entity=ENTITY_PROJECTBLOG)
+        return self._create_categories(name, entity=ENTITY_PROJECTBLOG,
+                                       timeout=timeout)
 
-    def list_projectblogs_categories(self):
+    def list_projectblogs_categories(self, timeout=None):
         """List available projectblog category tags."""
-        return self._list_categories(entity=ENTITY_PROJECTBLOG)
+        return self._list_categories(entity=ENTITY_PROJECTBLOG,
+                                     timeout=timeout)
 
-    def list_projectblogs_fields(self):
+    def list_projectblogs_fields(self, timeout=None):
         """List available projectblog fields."""
-        return self._list_fields(entity=ENTITY_PROJECTBLOG)
+        return self._list_fields(entity=ENTITY_PROJECTBLOG, timeout=timeout)
 
-    def create_projectblog_activity(self, projectblog_id, segment, payload):
+    def create_projectblog_activity(self, projectblog_id, segment, payload,
+                                    timeout=None):
         """Creates a projectblog activity.
 
         :param projectblog_id: int - the projectblog to create the activity for.
         :param segment: str - type of activity. See ``_create_activity``.
         :param payload: dict - Activity data.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
         return self._create_activity(projectblog_id, segment, payload,
-                                     entity=ENTITY_PROJECTBLOG)
+                                     entity=ENTITY_PROJECTBLOG,
+                                     timeout=timeout)
 
-    def update_projectblog_activity(self, segment, activity_id, payload):
+    def update_projectblog_activity(self, segment, activity_id, payload,
+                                    timeout=None):
         """Updates a projectblog activity.
 
         :param segment: str - type of segment. See ``_create_activity``.
         :param activity_id: int - id of the activity to update.
         :param payload: dict - Full or partial segment data to update.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
         return self._update_activity(segment, activity_id, payload,
-                                     entity=ENTITY_PROJECTBLOG)
+                                     entity=ENTITY_PROJECTBLOG,
+                                     timeout=timeout)
 
-    def destroy_projectblog_activity(self, segment, activity_id):
+    def destroy_projectblog_activity(self, segment, activity_id, timeout=None):
         """Destroys a projectblog activity.
 
         :param segment: str - type of segment. See ``_create_activity``.
         :param activity_id: int - id of the segment to update.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
         """
         return self._destroy_activity(segment, activity_id,
-                                      entity=ENTITY_PROJECTBLOG)
+                                      entity=ENTITY_PROJECTBLOG,
+                                      timeout=timeout)
+
+    def destroy_projectblog_activities(self, segment, activity_ids, workers=4,
+                                       tombstones=None, timeout=None):
+        """Destroys projectblog activities concurrently.
+
+        :param segment: str - type of segment. See ``_create_activity``.
+        :param activity_ids: list - ids of the activities to destroy.
+        :param workers: int - Max concurrent requests.
+        :param tombstones: str - Path of a ``TombstoneLog``, see
+            ``_destroy_all``.
+        :param timeout: float or tuple - Request timeout, overrides the
+            client timeout.
+        """
+        return self._destroy_activities(segment, activity_ids,
+                                        entity=ENTITY_PROJECTBLOG, workers=workers,
+                                        tombstones=tombstones, timeout=timeout)
 
     # Reports
 
@@ -544,9 +1356,14 @@ class Solve360(object):  # pylint: disable=R0904
 
         The Solve360 web interface does query all activities via XHR by default.
 
+        kwargs ``timeout`` and ``deadline`` are not sent, they set the request
+        timeout and the seconds until DeadlineExceeded is raised.
+
         Reference:
         http://norada.com/answers/api/external_api_reference_activityreports
         """
+        timeout = kwargs.pop('timeout', None)
+        expires = self._expires(kwargs.pop('deadline', None))
         # Filter out None values
         payload = dict((k, v) for k, v in kwargs.items() if v or v == 0)
         if 'filter_' in payload:
@@ -559,7 +1376,9 @@ class Solve360(object):  # pylint: disable=R0904
         return self._request('get',
                              url,
                              self.auth,
-                             self.headers)
+                             self.headers,
+                             timeout=timeout,
+                             expires=expires)
 
     def show_report_nextactions(self, filter_, **kwargs):
         """List open tasks, events and milestones.
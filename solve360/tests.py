@@ -1,11 +1,44 @@
+import io
+import datetime
+import os
+import csv
+import gzip
 import json
+import sys
+import time
+import threading
+import subprocess
+import multiprocessing
+
+if sys.version_info[0] == 3:
+    from urllib.parse import urlsplit, parse_qsl
+else:
+    from urlparse import urlsplit, parse_qsl
 
 from _pytest.python import raises
-from requests import HTTPError
+from requests import HTTPError, Response, Timeout
 import httpretty
 from iso8601 import iso8601
 
-from solve360 import Solve360
+from solve360 import Solve360, SqliteResult, BufferedWriter, ClientPool
+from solve360.writer import Full
+from solve360.solve360 import DeadlineExceeded
+from solve360.hedging import HedgePolicy
+from solve360.breaker import CircuitBreaker, CircuitOpenError, endpoint_group
+from solve360.search import SearchIndex
+from solve360.concurrency import imap_ordered
+from solve360 import export
+from solve360.feed import ChangeFeed
+from solve360.categories import CategoryResolver
+from solve360.transport import MemoryTransport, Urllib3Transport
+from solve360.validation import ValidationError
+from solve360.cache import SharedCache
+from solve360.graph import GraphLoader
+from solve360.aggregate import Aggregation, ReportAggregator
+from solve360.tombstones import TombstoneLog
+from solve360.fanout import OwnerFanout
+from solve360.checkpoint import ListCheckpoint
+from solve360.profiling import Profiler
 
 
 __author__ = 'Daniel Nibon <daniel@nibon.se>'
@@ -18,6 +51,17 @@ def setup_module():
     crm = Solve360('email', 'token')
 
 
+def test_import_defers_heavy_dependencies():
+    script = ('import sys, solve360; '
+              'solve360.Solve360("email", "token", profile=False); '
+              'solve360.ClientPool; solve360.LIST_MAX_LIMIT; '
+              'print(" ".join(sorted(set(name.split(".")[0] for name in sys.modules))))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=root)
+    loaded = set(output.decode('utf-8').split())
+    assert not loaded & set(['requests', 'urllib3', 'iso8601', 'sqlite3'])
+
+
 def test_init_solve_missing_cred():
     with raises(TypeError):
         Solve360()
@@ -62,6 +106,1049 @@ def test_list_page_non_positive():
         crm.list_contacts(pages=-1)
 
 
+def _register_paged_list(entity, count, fail_at=None):
+    """Registers a list endpoint serving ``count`` objects by offset."""
+    def callback(request, uri, headers):
+        start = int(request.querystring.get('start', ['0'])[0])
+        limit = int(request.querystring.get('limit', ['0'])[0])
+        if fail_at is not None and start == fail_at:
+            return 500, headers, '{}'
+        page = {'status': 'success', 'count': count}
+        for uid in range(start, min(start + limit, count)):
+            page[str(uid)] = {'id': uid}
+        return 200, headers, json.dumps(page)
+
+    httpretty.register_uri(httpretty.GET, crm.url.format(url=entity + '/'),
+                           body=callback,
+                           content_type='application/json')
+
+
+@httpretty.activate
+def test_list_all_plans_pages_from_count():
+    _register_paged_list('contacts', 7)
+    contacts = crm.list_all_contacts(limit=3)
+    assert contacts['count'] == 7
+    assert len(contacts) == 7 + 2
+    assert len(httpretty.latest_requests()) == 3
+
+
+@httpretty.activate
+def test_list_all_resumes_from_checkpoint(tmpdir):
+    checkpoint = str(tmpdir.join('contacts.json'))
+    _register_paged_list('contacts', 7, fail_at=6)
+    with raises(HTTPError):
+        crm.list_all_contacts(limit=3, checkpoint=checkpoint)
+    assert os.path.exists(checkpoint)
+
+    httpretty.reset()
+    _register_paged_list('contacts', 7)
+    contacts = crm.list_all_contacts(limit=3, checkpoint=checkpoint)
+    assert len(contacts) == 7 + 2
+    assert len(httpretty.latest_requests()) == 1
+    assert not os.path.exists(checkpoint)
+
+
+def test_checkpoint_reads_pages_lazily(tmpdir):
+    path = str(tmpdir.join('contacts.json'))
+    progress = ListCheckpoint(path, 'contacts', 'limit=2')
+    progress.save(0, {'count': 4, '0': {'id': 0}, '1': {'id': 1}}, 4)
+    progress.save(2, {'count': 4, '2': {'id': 2}, '3': {'id': 3}}, 4)
+    with open(progress.partial, 'ab') as partial_file:
+        partial_file.write(b'{"start": 4, "pa')  # Interrupted write
+
+    resumed = ListCheckpoint(path, 'contacts', 'limit=2')
+    assert resumed.load() == [0, 2]
+    assert resumed.count == 4
+    assert resumed.read(2) == {'count': 4, '2': {'id': 2}, '3': {'id': 3}}
+    assert resumed.read(4) is None
+
+
+@httpretty.activate
+def test_list_all_checkpoint_other_query(tmpdir):
+    checkpoint = str(tmpdir.join('contacts.json'))
+    _register_paged_list('contacts', 7, fail_at=3)
+    with raises(HTTPError):
+        crm.list_all_contacts(limit=3, checkpoint=checkpoint)
+    with raises(ValueError):
+        crm.list_all_contacts(limit=2, checkpoint=checkpoint)
+
+
+def _register_changing_list(entity, records, change):
+    """Registers a list endpoint serving ``records`` sorted by ``created``,
+    calling ``change(records)`` after serving the first page."""
+    served = []
+
+    def callback(request, uri, headers):
+        start = int(request.querystring['start'][0])
+        limit = int(request.querystring['limit'][0])
+        assert request.querystring['sortfield'] == ['created']
+        ordered = sorted(records, key=lambda record: record['created'])
+        page = {'status': 'success', 'count': len(ordered)}
+        for record in ordered[start:start + limit]:
+            page[str(record['id'])] = record
+        if not served:
+            change(records)
+        served.append(start)
+        return 200, headers, json.dumps(page)
+
+    httpretty.register_uri(httpretty.GET, crm.url.format(url=entity + '/'),
+                           body=callback,
+                           content_type='application/json')
+
+
+@httpretty.activate
+def test_list_keyset_removed_during_listing():
+    records = [{'id': uid, 'created': '2014-12-%02d' % uid} for uid in range(1, 11)]
+    _register_changing_list('contacts', records, lambda records: records.pop(1))
+    drift = []
+    contacts = crm.list_contacts(keyset='created', limit=4, pages=10,
+                                 on_drift=drift.append)
+    assert sorted(int(uid) for uid in contacts if uid.isdigit()) == list(range(1, 11))
+    assert drift == [{'offset': 3, 'shift': 'removed', 'key': '2014-12-04'}]
+
+
+@httpretty.activate
+def test_list_keyset_created_during_listing():
+    records = [{'id': uid, 'created': '2014-12-%02d' % uid} for uid in range(1, 11)]
+    _register_changing_list('contacts', records, lambda records: records.append(
+        {'id': 11, 'created': '2014-11-01'}))
+    drift = []
+    contacts = crm.list_contacts(keyset='created', limit=4, pages=10,
+                                 on_drift=drift.append)
+    assert sorted(int(uid) for uid in contacts if uid.isdigit()) == list(range(1, 11))
+    assert [event['shift'] for event in drift] == ['created']
+
+
+def _keyset_transport(records, field, key):
+    """Returns a memory transport serving ``records`` sorted by ``key``."""
+    transport = MemoryTransport()
+
+    def callback(method, url, headers, data):
+        query = dict(parse_qsl(urlsplit(url).query))
+        start, limit = int(query['start']), int(query['limit'])
+        assert query['sortfield'] == field
+        page = {'status': 'success', 'count': len(records)}
+        for record in sorted(records, key=key)[start:start + limit]:
+            page[str(record['id'])] = record
+        return 200, None, page
+
+    transport.register('get', crm.url.format(url='contacts/'), callback)
+    return transport
+
+
+def test_list_keyset_ties():
+    records = [{'id': uid, 'created': '2014-12-01'} for uid in range(1, 11)]
+    keyset_crm = Solve360('email', 'token', transport=_keyset_transport(
+        records, 'created', lambda record: (record['created'], -record['id'])))
+    drift = []
+    contacts = keyset_crm.list_contacts(keyset='created', limit=4, pages=10,
+                                        on_drift=drift.append)
+    assert sorted(int(uid) for uid in contacts if uid.isdigit()) == list(range(1, 11))
+    assert drift == []
+
+
+def test_list_keyset_empty_page_after_removals():
+    records = [{'id': uid, 'custom100': str(uid)} for uid in range(10)]
+    transport = _keyset_transport(records, 'custom100',
+                                  lambda record: int(record['custom100']))
+    served = []
+
+    def remove_read(method, url, headers, data):
+        served.append(url)
+        if len(served) == 3:
+            del records[:5]  # Already read, removed before the third page
+        return callback(method, url, headers, data)
+
+    route = ('get', transport._route(crm.url.format(url='contacts/')))
+    callback = transport.routes[route][2]
+    transport.routes[route] = transport.routes[route][:2] + (remove_read,)
+    keyset_crm = Solve360('email', 'token', transport=transport)
+    drift = []
+    contacts = keyset_crm.list_contacts(keyset='custom100', limit=4, pages=10,
+                                        on_drift=drift.append)
+    assert sorted(int(uid) for uid in contacts if uid.isdigit()) == list(range(10))
+    assert drift[0] == {'offset': 6, 'shift': 'removed', 'key': '6'}
+
+
+def test_list_keyset_numeric_field():
+    records = [{'id': uid, 'custom100': str(uid)} for uid in range(1, 13)]
+    keyset_crm = Solve360('email', 'token', transport=_keyset_transport(
+        records, 'custom100', lambda record: int(record['custom100'])))
+    drift = []
+    contacts = keyset_crm.list_contacts(keyset='custom100', limit=4, pages=10,
+                                        on_drift=drift.append)
+    assert sorted(int(uid) for uid in contacts if uid.isdigit()) == list(range(1, 13))
+    assert drift == []
+
+
+def test_list_keyset_limit():
+    with raises(ValueError):
+        crm.list_contacts(keyset='created', limit=1)
+
+
+@httpretty.activate
+def test_list_decode_pool():
+    ISO8601 = "2014-12-12T15:19:21+01:00"
+    def callback(request, uri, headers):
+        start = int(request.querystring['start'][0]) if 'start' in request.querystring else 0
+        page = {'status': 'success', 'count': 7}
+        for uid in range(start, min(start + 2, 7)):
+            page[str(uid)] = {'id': uid, 'updated': ISO8601}
+        return 200, headers, json.dumps(page)
+
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/'),
+                           body=callback,
+                           content_type='application/json')
+    pool = multiprocessing.Pool(2)
+    try:
+        contacts = crm.list_contacts(limit=2, pages=10, decode_pool=pool)
+    finally:
+        pool.terminate()
+    assert len(contacts) == 7 + 2
+    assert len(httpretty.latest_requests()) == 4
+    assert contacts['6']['updated_parsed'] == iso8601.parse_date(ISO8601)
+
+
+class _TimeoutSession(object):
+    """Session serving list pages of one object, timing out from ``stall``."""
+
+    def __init__(self, stall):
+        self.stall = stall
+        self.timeouts = []
+
+    def get(self, url, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        if len(self.timeouts) > self.stall:
+            time.sleep(timeout[1] if isinstance(timeout, tuple) else timeout)
+            raise Timeout()
+        response = Response()
+        response.status_code = 200
+        response._content = json.dumps({'status': 'success', 'count': 5,
+                                        'obj%d' % len(self.timeouts): {}}).encode()
+        return response
+
+
+def test_request_timeouts():
+    session = _TimeoutSession(stall=2)
+    timeout_crm = Solve360('email', 'token', session=session, timeout=(3, 10))
+    timeout_crm.list_contacts()
+    timeout_crm.list_contacts(timeout=5)
+    assert session.timeouts == [(3, 10), 5]
+    with raises(Timeout):
+        timeout_crm.list_contacts(timeout=0.01)
+
+
+class _TimeoutTransport(MemoryTransport):
+    """Memory transport recording the timeout of each request."""
+
+    def __init__(self):
+        super(_TimeoutTransport, self).__init__()
+        self.timeouts = []
+
+    def send(self, method, url, auth=None, headers=None, data=None,
+             timeout=None, stream=False):
+        self.timeouts.append(timeout)
+        return super(_TimeoutTransport, self).send(method, url, auth, headers,
+                                                   data, timeout, stream)
+
+
+def test_request_timeouts_per_call():
+    transport = _TimeoutTransport()
+    timeout_crm = Solve360('email', 'token', transport=transport, timeout=(3, 10))
+    for method, path in [('get', 'contacts/1/'), ('put', 'contacts/1/'),
+                         ('delete', 'contacts/1/'), ('get', 'contacts/fields/'),
+                         ('post', 'contacts/note/'), ('get', 'ownership/')]:
+        transport.register(method, timeout_crm.url.format(url=path),
+                           {'status': 'success'})
+    timeout_crm.show_contact(1)
+    timeout_crm.show_contact(1, timeout=1)
+    timeout_crm.update_contact(1, {'lastname': 'D'}, timeout=2)
+    timeout_crm.destroy_contacts([1], workers=1, timeout=3)
+    timeout_crm.list_contacts_fields(timeout=4)
+    timeout_crm.create_contact_activity(1, 'note', {'details': 'A'}, timeout=5)
+    timeout_crm.list_ownership(timeout=6)
+    assert transport.timeouts == [(3, 10), 1, 2, 3, 4, 5, 6]
+
+
+def test_list_deadline_returns_completed_pages():
+    session = _TimeoutSession(stall=2)
+    deadline_crm = Solve360('email', 'token', session=session, timeout=(3, 10))
+    contacts = deadline_crm.list_contacts(limit=1, pages=5, deadline=0.2)
+    assert sorted(contacts) == ['count', 'obj1', 'obj2', 'status']
+    assert contacts['status'] == 'deadline_exceeded'
+    assert session.timeouts[2][1] <= 0.2
+    contacts = Solve360('email', 'token', session=_TimeoutSession(stall=2)) \
+        .list_contacts(limit=1, pages=2, deadline=10)
+    assert contacts['status'] == 'success'
+
+
+def test_list_all_deadline_keeps_checkpoint(tmpdir):
+    checkpoint = str(tmpdir.join('contacts.json'))
+    session = _TimeoutSession(stall=2)
+    deadline_crm = Solve360('email', 'token', session=session)
+    contacts = deadline_crm.list_all_contacts(limit=1, deadline=0.2,
+                                              checkpoint=checkpoint)
+    assert len(contacts) == 2 + 2
+    assert contacts['status'] == 'deadline_exceeded'
+    assert os.path.exists(checkpoint)
+
+
+def test_report_deadline():
+    deadline_crm = Solve360('email', 'token', session=_TimeoutSession(stall=0))
+    with raises(DeadlineExceeded):
+        deadline_crm.show_report_activities('2014-01-01', '2014-02-01',
+                                            deadline=0.01)
+
+
+class _SlowFirstSession(object):
+    """Session where the first request stalls and later ones answer."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        response = Response()
+        response.status_code = 200
+        response._content = json.dumps({'status': 'call%d' % self.calls}).encode()
+        response.raw = io.BytesIO()
+        if self.calls == 1:
+            time.sleep(0.5)
+        return response
+
+
+def test_hedged_get():
+    policy = HedgePolicy(min_samples=1, max_rate=1)
+    policy.record(0.01, endpoint_group(crm.url.format(url='ownership/')))
+    hedge_crm = Solve360('email', 'token', session=_SlowFirstSession(), hedge=policy)
+    started = time.time()
+    assert hedge_crm.list_ownership()['status'] == 'call2'
+    assert time.time() - started < 0.5
+    assert policy.hedged == 1
+
+
+def test_hedge_rate_cap():
+    policy = HedgePolicy(min_samples=1, max_rate=0.5)
+    policy.record(0.01, endpoint_group(crm.url.format(url='ownership/')))
+    hedge_crm = Solve360('email', 'token', session=_SlowFirstSession(), hedge=policy)
+    assert hedge_crm.list_ownership()['status'] == 'call1'
+    assert policy.hedged == 0
+
+
+def test_hedge_groups_and_large_lists():
+    policy = HedgePolicy(min_samples=1, max_rate=1)
+    policy.record(5.0, endpoint_group(crm.url.format(url='contacts/')))
+    hedge_crm = Solve360('email', 'token', session=_SlowFirstSession(), hedge=policy)
+    assert policy.delay(endpoint_group(crm.url.format(url='contacts/1/'))) == 5.0
+    assert policy.delay(endpoint_group(crm.url.format(url='ownership/'))) is None
+    assert hedge_crm._hedgeable(crm.url.format(url='contacts/1/'))
+    assert hedge_crm._hedgeable(crm.url.format(url='contacts/fields/'))
+    assert hedge_crm._hedgeable(crm.url.format(url='contacts/?limit=50'))
+    assert not hedge_crm._hedgeable(crm.url.format(url='contacts/?limit=5000'))
+    assert not hedge_crm._hedgeable(crm.url.format(url='contacts/'))
+    assert not hedge_crm._hedgeable(crm.url.format(url='report/activities/'))
+    assert hedge_crm.list_contacts(limit=5000)['status'] == 'call1'
+    assert policy.requests == 0
+
+
+def test_hedge_attempts_take_pool_slots():
+    policy = HedgePolicy(min_samples=1, max_rate=1)
+    policy.record(0.01, endpoint_group(crm.url.format(url='ownership/')))
+    pool = ClientPool(session=_SlowFirstSession())
+    client = pool.client('email', 'token', hedge=policy)
+    assert client.list_ownership()['status'] == 'call2'
+    time.sleep(0.6)  # The first attempt returns its slot
+    metrics = pool.metrics()[('email', 'token')]
+    assert (metrics['requests'], metrics['in_flight']) == (2, 0)
+
+
+@httpretty.activate
+def test_circuit_breaker():
+    breaker = CircuitBreaker(min_requests=2, reset_timeout=0.05)
+    changes = []
+    breaker.add_listener(lambda *change: changes.append(change))
+    breaker_crm = Solve360('email', 'token', breaker=breaker)
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/1/'),
+                           status=503)
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/2/'),
+                           status=404)
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/3/'),
+                           body='{"status": "success"}',
+                           content_type='application/json')
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='ownership/'),
+                           body='{"status": "success"}',
+                           content_type='application/json')
+    group = 'secure.solve360.com/contacts'
+    with raises(HTTPError):
+        breaker_crm.show_contact(2)  # Client errors are not failures
+    with raises(HTTPError):
+        breaker_crm.show_contact(1)
+    assert breaker.state(group) == 'open'
+    with raises(CircuitOpenError):
+        breaker_crm.show_contact(3)
+    assert breaker_crm.list_ownership()['status'] == 'success'
+
+    time.sleep(0.05)
+    assert breaker_crm.show_contact(3)['status'] == 'success'
+    assert breaker.state(group) == 'closed'
+    assert changes == [(group, 'closed', 'open'),
+                       (group, 'open', 'half-open'),
+                       (group, 'half-open', 'closed')]
+
+
+@httpretty.activate
+def test_profile():
+    _register_paged_list('contacts', 4)
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='ownership/'),
+                           body='{"status": "success"}',
+                           content_type='application/json')
+    profile_crm = Solve360('email', 'token', profile=True)
+    profile_crm.list_contacts(limit=2, pages=3)
+    profile_crm.list_ownership()
+    summary = profile_crm.profiler.summary()
+    assert summary['calls'] == 2
+    assert [call['call'] for call in profile_crm.profiler.calls] == \
+        ['list contacts', 'request']
+    assert sorted(summary['phases']) == ['decode', 'download', 'merge',
+                                         'network', 'parse_dates']
+    assert summary['phases']['merge']['calls'] == 1
+    if sys.version_info >= (3, 9):
+        assert summary['peak_memory'] > 0
+    profile_crm.profiler.reset()
+    profile_crm.profiler.stop()
+    assert profile_crm.profiler.summary()['calls'] == 0
+
+
+def test_profile_overlapping_calls_skip_peak_memory():
+    profiler = Profiler()
+    entered, done = threading.Event(), threading.Event()
+
+    def first():
+        with profiler.call('first'):
+            entered.set()
+            done.wait(10)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    entered.wait(10)
+    with profiler.call('second'):
+        pass
+    done.set()
+    thread.join()
+    with profiler.call('alone'):
+        pass
+    profiler.stop()
+    peaks = dict((call['call'], call['peak_memory']) for call in profiler.calls)
+    assert peaks['first'] is None and peaks['second'] is None
+    if sys.version_info >= (3, 9):
+        assert peaks['alone'] is not None
+
+
+def test_profile_without_reset_peak(monkeypatch):
+    try:
+        import tracemalloc
+    except ImportError:  # Python < 3.4, peaks are never recorded
+        return
+    monkeypatch.delattr(tracemalloc, 'reset_peak', raising=False)
+    profiler = Profiler()
+    with profiler.call('call'):
+        pass
+    profiler.stop()
+    assert profiler.calls[0]['peak_memory'] is None
+
+
+def test_memory_transport():
+    transport = MemoryTransport()
+    memory_crm = Solve360('email', 'token', transport=transport)
+    transport.register('get', memory_crm.url.format(url='contacts/131/'),
+                       {'status': 'success', 'item': {'id': 131}})
+    transport.register('put', memory_crm.url.format(url='contacts/131/'),
+                       lambda method, url, headers, data:
+                       (200, None, {'status': 'success', 'sent': json.loads(data)}))
+    assert memory_crm.show_contact(131)['item']['id'] == 131
+    assert memory_crm.update_contact(131, {'firstname': 'A'})['sent'] == \
+        {'firstname': 'A'}
+    with raises(HTTPError) as error:
+        memory_crm.show_contact(132)
+    assert error.value.response.status_code == 404
+    assert [request[0] for request in transport.requests] == ['get', 'put', 'get']
+
+
+@httpretty.activate
+def test_urllib3_transport():
+    httpretty.register_uri(httpretty.PUT, crm.url.format(url='contacts/151/'),
+                           body='{"status": "success"}',
+                           content_type='application/json')
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/152/'),
+                           status=500)
+    urllib3_crm = Solve360('email', 'token', transport=Urllib3Transport())
+    assert urllib3_crm.update_contact(151, {'firstname': 'A'})['status'] == 'success'
+    request = httpretty.last_request()
+    assert json.loads(request.body.decode('utf-8')) == {'firstname': 'A'}
+    assert request.headers['Authorization'] == 'Basic ZW1haWw6dG9rZW4='
+    with raises(HTTPError) as error:
+        urllib3_crm.show_contact(152)
+    assert error.value.response.status_code == 500
+
+
+def test_payload_validation():
+    transport = MemoryTransport()
+    validating_crm = Solve360('email', 'token', transport=transport, validate=True)
+    transport.register('get', validating_crm.url.format(url='contacts/fields/'),
+                       {'status': 'success',
+                        'fields': {'field': [
+                            {'name': 'firstname', 'type': 'text', 'required': '1'},
+                            {'name': 'businessemail', 'type': 'email'},
+                            {'name': 'custom100', 'type': 'number'},
+                            {'name': 'custom101', 'type': 'date'}]}})
+    transport.register('post', validating_crm.url.format(url='contacts/'),
+                       {'status': 'success'})
+    transport.register('put', validating_crm.url.format(url='contacts/1/'),
+                       {'status': 'success'})
+    with raises(ValidationError) as error:
+        validating_crm.create_contact({'businessemail': 'a@', 'nickname': 'B'})
+    assert sorted(error.value.errors) == ["Invalid email value for businessemail: 'a@'",
+                                          'Missing required field firstname',
+                                          'Unknown contacts field nickname']
+    assert validating_crm.create_contact({'firstname': 'A'})['status'] == 'success'
+    assert validating_crm.update_contact(1, {'custom100': '12.5',
+                                             'categories': {}})['status'] == 'success'
+    with raises(ValidationError):
+        validating_crm.create_contact_activity(1, 'note', {'title': 'No details'})
+    assert [request[0] for request in transport.requests] == ['get', 'post', 'put']
+
+    errors = validating_crm.validator.bulk('contacts', [
+        {'firstname': 'A', 'custom101': '2014-03-05'},
+        {'firstname': 'B', 'custom100': 'many'},
+        {'custom101': 'March'}], create=True)
+    assert sorted(errors) == [1, 2]
+    assert errors[2] == ["Invalid date value for custom101: 'March'",
+                         'Missing required field firstname']
+
+
+def test_shared_cache(tmpdir):
+    path = str(tmpdir.join('cache.db'))
+    writer, reader = MemoryTransport(), MemoryTransport()
+    writer_crm = Solve360('email', 'token', transport=writer, cache=SharedCache(path))
+    reader_crm = Solve360('email', 'token', transport=reader, cache=SharedCache(path))
+    show_url = writer_crm.url.format(url='contacts/131/')
+    for transport in [writer, reader]:
+        transport.register('get', show_url,
+                           {'status': 'success',
+                            'item': {'id': 131, 'activities': {'900': {'typeid': 3}}}})
+        transport.register('get', writer_crm.url.format(url='report/activities/'),
+                           {'status': 'success'})
+    writer.register('put', show_url, {'status': 'success'})
+    writer.register('put', writer_crm.url.format(url='contacts/note/900/'),
+                    {'status': 'success'})
+
+    assert writer_crm.show_contact(131)['item']['id'] == 131
+    assert reader_crm.show_contact(131)['item']['id'] == 131
+    writer_crm.show_report_activities('2014-01-01', '2014-01-31')
+    reader_crm.show_report_activities('2014-01-01', '2014-01-31')
+    assert reader.requests == []  # Served by the fetches of the writer
+
+    writer_crm.update_contact(131, {'firstname': 'A'})
+    reader_crm.show_contact(131)
+    reader_crm.show_report_activities('2014-01-01', '2014-01-31')
+    assert len(reader.requests) == 2
+
+    writer_crm.update_contact_activity('note', 900, {'details': 'B'})
+    reader_crm.show_contact(131)
+    assert len(reader.requests) == 3
+
+
+def test_shared_cache_eviction(tmpdir):
+    cache = SharedCache(str(tmpdir.join('cache.db')), max_entries=2,
+                        ttls={'metadata': 0})
+    for key in ['a', 'b', 'c']:
+        cache.put(key, 'show', key, b'{}')
+        time.sleep(0.01)
+    assert cache.get('a') is None
+    assert cache.get('c') == b'{}'
+    cache.put('fields', 'metadata', 'contacts/fields', b'{}')
+    assert cache.get('fields') is None
+    assert SharedCache.key('email', 'https://x/report/a/?b=1&a=2') == \
+        SharedCache.key('email', 'https://x/report/a/?a=2&b=1')
+
+
+def test_shared_cache_hits_are_read_only(tmpdir):
+    cache = SharedCache(str(tmpdir.join('cache.db')))
+    cache.put('a', 'show', 'contacts/1', b'{}')
+    changes = cache._db.total_changes
+    assert cache.get('a') == b'{}' and cache.get('a') == b'{}'
+    assert cache._db.total_changes == changes
+    cache.touch_interval = 0
+    assert cache.get('a') == b'{}'
+    assert cache._db.total_changes == changes + 1
+    assert cache.hits == 3
+
+
+def test_graph_loader():
+    transport = MemoryTransport()
+    graph_crm = Solve360('email', 'token', transport=transport)
+    related = {('contacts', '1'): [(2, '10'), (40, '20')],
+               ('companies', '10'): [(1, '1'), (1, '2')],
+               ('projectblogs', '20'): [(1, '2'), (2, '10')],
+               ('contacts', '2'): [(2, '11')]}
+    for (entity, uid), items in related.items():
+        transport.register('get', graph_crm.url.format(url='{}/{}/'.format(entity, uid)),
+                           {'status': 'success',
+                            'item': {'id': uid, 'relateditems': {'relateditem': [
+                                {'id': item, 'typeid': str(typeid)}
+                                for typeid, item in items]}}})
+    graph = GraphLoader(graph_crm, workers=1).load([('contacts', 1)], depth=2)
+    assert sorted(graph.nodes) == [('companies', '10'), ('contacts', '1'),
+                                   ('contacts', '2'), ('projectblogs', '20')]
+    assert graph.neighbors('contacts', 1) == [('companies', '10'),
+                                              ('projectblogs', '20')]
+    assert graph.nodes[('contacts', '2')]['item']['id'] == '2'
+    assert ('companies', '11') in graph.neighbors('contacts', 2)  # Beyond depth
+    assert len(transport.requests) == 4
+
+
+def test_report_aggregator():
+    entries = {'2014-01-01': {'1': {'created': '2014-01-02T10:00:00+00:00',
+                                    'fields': {'user': 'A', 'hours': '2.5'}},
+                              '2': {'created': '2014-01-20T10:00:00+00:00',
+                                    'fields': {'user': 'B', 'hours': '1'}}},
+               '2014-02-01': {'3': {'created': '2014-02-03T10:00:00+00:00',
+                                    'fields': {'user': 'A', 'hours': '4'}},
+                              '4': {'created': '2014-02-04T10:00:00+00:00',
+                                    'fields': {'user': 'A', 'hours': 'n/a'}}}}
+    transport = MemoryTransport()
+    report_crm = Solve360('email', 'token', transport=transport)
+
+    def respond(method, url, headers, data):
+        start = [part.split('=')[1] for part in url.split('?')[1].split('&')
+                 if part.startswith('start=')][0]
+        return 200, None, dict(entries.get(start, {}), status='success')
+
+    transport.register('get', report_crm.url.format(url='report/timetracking/'), respond)
+    hours = ReportAggregator(report_crm, 'timetracking', Aggregation(
+        ['user'], {'hours': ('sum', 'hours'), 'entries': ('count', None),
+                   'longest': ('max', 'hours')}, bucket='month'), last='created')
+    hours.load('2014-01-01', '2014-02-28', days=31)
+    assert len(transport.requests) == 2
+    assert 'last=created' in transport.requests[0][1]
+    assert hours.result() == {
+        ('A', '2014-01'): {'hours': 2.5, 'entries': 1, 'longest': 2.5},
+        ('B', '2014-01'): {'hours': 1.0, 'entries': 1, 'longest': 1.0},
+        ('A', '2014-02'): {'hours': 4.0, 'entries': 2, 'longest': 4.0}}
+
+    entries['2014-02-01']['4']['fields']['hours'] = '3'
+    hours.refresh(start='2014-02-01', end='2014-02-28')
+    assert hours.rows()[1] == {'user': 'A', 'bucket': '2014-02', 'hours': 7.0,
+                               'entries': 2, 'longest': 4.0}
+    with raises(ValueError):
+        Aggregation(['user'], {'hours': ('avg', 'hours')})
+
+
+def test_destroy_contacts_tombstones(tmpdir):
+    path = str(tmpdir.join('purge.log'))
+    transport = MemoryTransport()
+    purge_crm = Solve360('email', 'token', transport=transport)
+    transport.register('delete', purge_crm.url.format(url='contacts/1/'), {'status': 'success'})
+    transport.register('delete', purge_crm.url.format(url='contacts/3/'), {}, status=500)
+    transport.register('delete', purge_crm.url.format(url='contacts/note/7/'),
+                       {'status': 'success'})
+    results = purge_crm.destroy_contacts([1, 2, 3], workers=2, tombstones=path)
+    assert results['1'] == ({'status': 'success'}, None)
+    assert results['2'] == ({'status': 'missing'}, None)  # 404, already gone
+    assert isinstance(results['3'][1], HTTPError)
+
+    transport.requests[:] = []
+    results = purge_crm.destroy_contacts([1, 2, 3], tombstones=path)
+    assert results['1'] == ({'status': 'skipped'}, None)
+    assert [request[1] for request in transport.requests] == \
+        [purge_crm.url.format(url='contacts/3/')]
+    results = purge_crm.destroy_contact_activities('note', [7], tombstones=path)
+    assert results == {'7': ({'status': 'success'}, None)}
+    assert ('contacts', 'note', 7) in TombstoneLog(path)
+
+
+def test_owner_fanout():
+    transport = MemoryTransport()
+    fanout_crm = Solve360('email', 'token', transport=transport)
+    transport.register('get', fanout_crm.url.format(url='ownership/'),
+                       {'status': 'success',
+                        'users': {'user': [{'id': '1', 'name': 'A'},
+                                           {'id': '2', 'name': 'B'}]},
+                        'groups': {'group': [{'id': '10', 'name': 'Sales'}]}})
+    transport.register('get', fanout_crm.url.format(url='report/nextactions/'),
+                       lambda method, url, headers, data:
+                       (200, None, {'status': 'success', 'url': url}))
+    results = OwnerFanout(fanout_crm, workers=1).nextactions(due='next7')
+    assert sorted(results) == ['1', '10', '2']
+    assert 'filter=10' in results['10'][0]['url']
+    assert 'due=next7' in results['10'][0]['url']
+
+    fanout = OwnerFanout(fanout_crm, workers=1, ttl=60)
+    transport.requests[:] = []
+    fanout.nextactions(kinds=['user'])
+    fanout.nextactions(kinds=['user'])
+    assert len(transport.requests) == 3  # Ownership and two reports, once
+    with raises(ValueError):
+        fanout.report('timetracking')
+
+
+def test_owner_fanout_after_plan():
+    transport = MemoryTransport()
+    fanout_crm = Solve360('email', 'token', transport=transport)
+    transport.register('get', fanout_crm.url.format(url='ownership/'),
+                       {'status': 'success', 'users': {'user': [{'id': '1'}]}})
+    transport.register('get', fanout_crm.url.format(url='report/nextactions/'),
+                       {'status': 'success', '7': {'id': 7}})
+    fanout = OwnerFanout(fanout_crm, workers=1, ttl=60)
+    with fanout_crm.plan() as plan:
+        fanout.nextactions()
+    assert plan.summary()['kinds']['report']['requests'] == 1
+    transport.requests[:] = []
+    results = fanout.nextactions()
+    assert results['1'] == ({'status': 'success', '7': {'id': 7}}, None)
+    assert len(transport.requests) == 2  # Nothing cached by the plan
+
+
+def test_plan_dry_run():
+    transport = MemoryTransport()
+    plan_crm = Solve360('email', 'token', transport=transport)
+    transport.register('get', plan_crm.url.format(url='contacts/'),
+                       {'status': 'success', 'count': 12,
+                        '1': {'id': 1, 'name': 'A'}})
+    with plan_crm.plan() as plan:
+        contacts = plan_crm.list_all_contacts(limit=5)
+        plan_crm.destroy_contacts([1, 2], workers=1)
+    assert plan_crm.planner is None
+    assert contacts['count'] == 12
+    summary = plan.summary()
+    assert summary['requests'] == 5
+    assert summary['kinds']['list']['requests'] == 3
+    assert summary['kinds']['write']['requests'] == 2
+    assert summary['bytes_received'] > 0
+    assert summary['probes']['requests'] == 1
+    assert len(transport.requests) == 1
+    assert 'limit=1' in transport.requests[0][1]
+
+
+@httpretty.activate
+def test_list_sqlite_backend():
+    ISO8601 = "2014-12-12T15:19:21+01:00"
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/'),
+                           responses=[
+                               httpretty.Response(body=json.dumps(
+                                   {'status': 'success', 'count': 2,
+                                    'obj1': {'updated': ISO8601}}),
+                                   content_type='application/json'),
+                               httpretty.Response(body=json.dumps(
+                                   {'status': 'success', 'count': 2,
+                                    'obj2': {}}),
+                                   content_type='application/json')
+                           ])
+    with crm.list_contacts(limit=1, pages=3, backend=SqliteResult) as contacts:
+        assert contacts['count'] == 2
+        assert len(contacts) == 2 + 2
+        assert contacts['obj1']['updated_parsed'] == iso8601.parse_date(ISO8601)
+        assert 'obj3' not in contacts
+        assert sorted(contacts) == ['count', 'obj1', 'obj2', 'status']
+        assert dict(contacts.items())['obj2'] == {}
+        path = contacts.path
+    assert not os.path.exists(path)
+
+
+def test_search_index():
+    index = SearchIndex()
+    index.add({'status': 'success', 'count': 2,
+               '1': {'name': 'John Smith',
+                     'fields': {'businessemail': 'john@example.com',
+                                'cellularphone': '+46 70-123 45 67'}},
+               '2': {'name': 'Jane Smithers', 'company': 'Example Inc'}})
+    assert sorted(index.search('smi')) == ['1', '2', 'count', 'status']
+    assert index.search('smi')['count'] == 2
+    assert sorted(index.search('jo smith')) == ['1', 'count', 'status']
+    assert '1' in index.search('john@example.com', prefix=False)
+    assert '1' in index.search('4670123')
+    assert '2' in index.search('example inc')
+    assert index.search('smith', prefix=False)['count'] == 1
+    assert index.search('nobody')['count'] == 0
+
+    index.update(1, {'name': 'Johnny Walker'})
+    assert '1' not in index.search('smith')
+    assert '1' in index.search('walk')
+    index.remove('2')
+    assert index.search('smi')['count'] == 0
+    assert len(index) == 1
+
+    index.add({'3': {'name': 'Adam Smithson'}, '4': {'name': 'Aaron Walker'}})
+    assert sorted(index.search('smi')) == ['3', 'count', 'status']
+    assert sorted(index.search('walk')) == ['1', '4', 'count', 'status']
+
+
+@httpretty.activate
+def test_change_feed():
+    today = datetime.date.today().isoformat()
+    activities = {'status': 'success',
+                  '1': {'typeid': 3, 'updated': today + 'T10:00:00+00:00'},
+                  '2': {'typeid': '14', 'updated': today + 'T11:00:00+00:00'}}
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='report/activities/'),
+                           body=lambda request, uri, headers:
+                           (200, headers, json.dumps(activities)),
+                           content_type='application/json')
+    feed = ChangeFeed(crm)
+    notes, changes = [], []
+    feed.on('note', notes.append)
+    feed.on('*', changes.append)
+    assert len(feed.poll()) == 2
+    assert 'last=changed' in httpretty.last_request().path
+    assert [event.activity_id for event in notes] == ['1']
+    assert [event.kind for event in changes] == ['note', 'task']
+    assert feed.poll() == []
+
+    activities['2']['updated'] = today + 'T12:00:00+00:00'
+    events = feed.poll()
+    assert [(event.kind, event.activity_id) for event in events] == [('task', '2')]
+
+
+def test_change_feed_retries_failed_handlers():
+    transport = MemoryTransport()
+    feed_crm = Solve360('email', 'token', transport=transport)
+    today = datetime.date.today().isoformat()
+    transport.register('get', feed_crm.url.format(url='report/activities/'),
+                       {'status': 'success',
+                        '1': {'typeid': 3, 'updated': today + 'T10:00:00+00:00'},
+                        '2': {'typeid': 3, 'updated': today + 'T11:00:00+00:00'}})
+    delivered, errors = [], []
+
+    def handler(event):
+        if event.activity_id == '1' and not errors:
+            raise RuntimeError(event.activity_id)
+        delivered.append(event.activity_id)
+
+    feed = ChangeFeed(feed_crm, on_error=errors.append)
+    feed.on('note', handler)
+    assert [event.activity_id for event in feed.poll()] == ['2']
+    assert len(errors) == 1
+    assert [event.activity_id for event in feed.poll()] == ['1']
+    assert feed.poll() == []
+    assert delivered == ['2', '1']
+
+    feed = ChangeFeed(feed_crm)
+    feed.on('note', lambda event: 1 / 0)
+    with raises(ZeroDivisionError):
+        feed.poll()
+    feed.handlers.clear()
+    assert len(feed.poll()) == 2
+
+
+@httpretty.activate
+def test_category_resolver_tag():
+    calls = []
+
+    def respond(body):
+        def callback(request, uri, headers):
+            calls.append(request.method)
+            return 200, headers, json.dumps(body)
+        return callback
+
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/categories/'),
+                           body=respond({'status': 'success',
+                                         'categories': {'category': [
+                                             {'id': '10', 'name': 'Customer'}]}}),
+                           content_type='application/json')
+    httpretty.register_uri(httpretty.POST, crm.url.format(url='contacts/categories/'),
+                           body=respond({'status': 'success',
+                                         'item': {'id': '11', 'name': 'New'}}),
+                           content_type='application/json')
+    for uid in [1, 2]:
+        httpretty.register_uri(httpretty.PUT, crm.url.format(url='contacts/{}/'.format(uid)),
+                               body=respond({'status': 'success'}),
+                               content_type='application/json')
+    resolver = CategoryResolver(crm, workers=1)
+    results = resolver.tag('contacts', [1, 2, '1'], ['customer', 'New', 'Customer '])
+    assert sorted(results) == ['1', '2']
+    assert all(error is None for _, error in results.values())
+    assert json.loads(httpretty.last_request().body.decode('utf-8')) == \
+        {'categories': {'add': {'category': ['10', '11']}}}
+    assert calls == ['GET', 'POST', 'PUT', 'PUT']
+    assert resolver.name('contacts', '11') == 'New'
+    assert resolver.id('contacts', 'Missing', create=False) is None
+    resolver.tag('contacts', [2], ['New'])
+    assert calls[4:] == ['PUT']
+
+
+def test_category_resolver_creates_once():
+    class Client(object):
+        created = []
+
+        def _list_categories(self, entity=None):
+            return {'status': 'success'}
+
+        def _create_categories(self, name, entity=None):
+            time.sleep(0.01)
+            self.created.append(name)
+            return {'status': 'success', 'item': {'id': str(len(self.created))}}
+
+    resolver = CategoryResolver(Client())
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        resolver.id('contacts', 'Race'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert Client.created == ['Race']
+    assert results == ['1'] * 8
+
+
+# --------------------------------------
+# EXPORT
+# --------------------------------------
+
+@httpretty.activate
+def test_export_ndjson_gzip(tmpdir):
+    _register_paged_list('contacts', 7)
+    output = str(tmpdir.join('contacts.ndjson.gz'))
+    assert export.main(['contacts', '--user', 'email', '--token', 'token',
+                        '--limit', '3', '--workers', '1', '--gzip',
+                        '--output', output, '--quiet']) == 0
+    with gzip.open(output, 'rt') as stream:
+        records = [json.loads(line) for line in stream]
+    assert [record['id'] for record in records] == list(range(7))
+
+
+@httpretty.activate
+def test_export_report_csv(tmpdir):
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='report/timetracking/'),
+                           body=json.dumps({'status': 'success',
+                                            '1': {'fields': {'hours': '2'}},
+                                            '2': {'fields': {'hours': '3'}}}),
+                           content_type='application/json')
+    output = str(tmpdir.join('timetracking.csv'))
+    export.main(['report:timetracking', '--user', 'email', '--token', 'token',
+                 '--format', 'csv', '--param', 'start=2014-01-01',
+                 '--output', output, '--quiet'])
+    assert 'start=2014-01-01' in httpretty.last_request().path
+    with open(output) as stream:
+        rows = sorted(csv.DictReader(stream), key=lambda row: row['id'])
+    assert [(row['id'], row['fields.hours']) for row in rows] == [('1', '2'), ('2', '3')]
+
+
+def test_export_writers_unicode():
+    records = [('1', {'name': u'\xc5sa', 'tags': [u'\xe9t\xe9']})]
+    stream = io.StringIO()
+    writer = export.NdjsonWriter(stream)
+    for uid, record in records:
+        writer.write(uid, record)
+    assert json.loads(stream.getvalue())['name'] == u'\xc5sa'
+    stream = io.StringIO(newline='')
+    export.CsvWriter(stream).write_page(records)
+    stream.seek(0)
+    rows = list(csv.DictReader(stream))
+    assert rows[0]['name'] == u'\xc5sa'
+
+
+def test_export_plan(capsys, monkeypatch):
+    transport = MemoryTransport()
+    monkeypatch.setattr(export, 'Solve360',
+                        lambda *args, **kwargs: Solve360(*args, transport=transport,
+                                                         **kwargs))
+    transport.register('get', crm.url.format(url='contacts/'),
+                       {'status': 'success', 'count': 7, '1': {'id': 1}})
+    assert export.main(['contacts', '--user', 'email', '--token', 'token',
+                        '--limit', '3', '--workers', '1', '--plan']) == 0
+    summary = json.loads(capsys.readouterr()[0])
+    assert summary['requests'] == 3
+    assert len(transport.requests) == 1
+
+
+def test_export_arguments():
+    with raises(SystemExit):
+        export.main(['invalid', '--user', 'email', '--token', 'token'])
+
+
+def test_imap_ordered():
+    def slow_square(number):
+        time.sleep(0.01 * (5 - number))
+        if number == 3:
+            raise ValueError(number)
+        return number * number
+
+    results = list(imap_ordered(slow_square, range(5), workers=3))
+    assert [(item, result) for item, result, _ in results] == \
+        [(0, 0), (1, 1), (2, 4), (3, None), (4, 16)]
+    assert isinstance(results[3][2], ValueError)
+
+
+# --------------------------------------
+# POOL
+# --------------------------------------
+
+@httpretty.activate
+def test_client_pool_metrics():
+    pool = ClientPool()
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='ownership/'),
+                           body='{"status": "success"}',
+                           content_type='application/json')
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/10000/'),
+                           status=404)
+    client = pool.client('email', 'token')
+    assert pool.client('email', 'token') is client
+    assert client.session is pool.session
+    assert client.list_ownership()['status'] == 'success'
+    with raises(HTTPError):
+        client.show_contact(10000)
+    metrics = pool.metrics()[('email', 'token')]
+    assert metrics['requests'] == 2
+    assert metrics['errors'] == 1
+    assert metrics['in_flight'] == 0
+
+
+def test_client_pool_slots_only_for_sends(tmpdir):
+    pool = ClientPool()
+    transport = MemoryTransport()
+    client = pool.client('email', 'token', transport=transport,
+                         cache=SharedCache(str(tmpdir.join('cache.db'))))
+    pool.client('email', 'other token')
+    transport.register('get', client.url.format(url='ownership/'),
+                       {'status': 'success'})
+    client.list_ownership()
+    client.list_ownership()  # Cache hit
+    with client.plan():
+        client.destroy_contact(1)
+    metrics = pool.metrics()
+    assert metrics[('email', 'token')]['requests'] == 1
+    assert metrics[('email', 'other token')]['requests'] == 0
+
+
+def test_client_pool_round_robin():
+    pool = ClientPool(max_concurrency=1)
+    pool.client('a', 'token')
+    pool.client('b', 'token')
+    order = []
+
+    def request(key):
+        tenant = pool._acquire(key)
+        order.append(key[0])
+        pool._release(tenant, 0, False)
+
+    def wait_for_waiting(key, waiting):
+        while len(pool._tenants[key].waiting) < waiting:
+            time.sleep(0.001)
+
+    first = pool._acquire(('a', 'token'))
+    threads = [threading.Thread(target=request, args=(('a', 'token'),))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for_waiting(('a', 'token'), 3)
+    threads.append(threading.Thread(target=request, args=(('b', 'token'),)))
+    threads[-1].start()
+    wait_for_waiting(('b', 'token'), 1)
+    pool._release(first, 0, False)
+    for thread in threads:
+        thread.join()
+    assert order == ['a', 'b', 'a', 'a']
+
+
 # --------------------------------------
 # CONTACTS
 # --------------------------------------
@@ -118,6 +1205,132 @@ def test_update_contact():
     assert contact['status'] == 'success'
 
 
+@httpretty.activate
+def test_update_contact_diff():
+    diff_crm = Solve360('email', 'token', diff_updates=True)
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/151/'),
+                           body=json.dumps({'status': 'success',
+                                            'item': {'fields': {'lastname': 'D',
+                                                                'firstname': 'A'}}}),
+                           content_type='application/json')
+    httpretty.register_uri(httpretty.PUT, crm.url.format(url='contacts/151/'),
+                           body='{"status": "success"}',
+                           content_type='application/json')
+    diff_crm.show_contact(151)
+    assert diff_crm.update_contact(151, {'lastname': 'D'})['status'] == 'skipped'
+    assert diff_crm.skipped_writes == 1
+    assert len(httpretty.latest_requests()) == 1
+
+    response = diff_crm.update_contact(151, {'lastname': 'E', 'firstname': 'A'})
+    assert response['status'] == 'success'
+    assert json.loads(httpretty.last_request().body.decode()) == {'lastname': 'E'}
+    assert diff_crm.update_contact(151, {'lastname': 'E'})['status'] == 'skipped'
+
+
+def test_update_diff_always_sends_commands():
+    transport = MemoryTransport()
+    diff_crm = Solve360('email', 'token', diff_updates=True, transport=transport)
+    transport.register('put', diff_crm.url.format(url='contacts/1/'),
+                       lambda method, url, headers, data:
+                       (200, None, {'status': 'success', 'sent': json.loads(data)}))
+    command = {'categories': {'remove': {'category': ['10']}}, 'lastname': 'D'}
+    assert diff_crm.update_contact(1, command)['sent'] == command
+    assert diff_crm.update_contact(1, command)['sent'] == \
+        {'categories': {'remove': {'category': ['10']}}}
+    assert diff_crm.known_state[('contacts', '1')] == {'lastname': 'D'}
+
+
+def test_known_state_bounded_and_forgotten():
+    transport = MemoryTransport()
+    state_crm = Solve360('email', 'token', diff_updates=True, transport=transport)
+    state_crm.known_state_max = 2
+    transport.register('delete', state_crm.url.format(url='contacts/1/'),
+                       {'status': 'success'})
+    for uid in [1, 2, 3]:
+        state_crm.remember('contacts', uid, {'lastname': 'D'})
+    assert list(state_crm.known_state) == [('contacts', '2'), ('contacts', '3')]
+    state_crm.remember('contacts', 1, {'lastname': 'D'})
+    assert list(state_crm.known_state) == [('contacts', '3'), ('contacts', '1')]
+    state_crm.destroy_contact(1)
+    assert list(state_crm.known_state) == [('contacts', '3')]
+
+
+@httpretty.activate
+def test_update_contact_baseline():
+    httpretty.register_uri(httpretty.PUT, crm.url.format(url='contacts/151/'),
+                           body='{"status": "success"}',
+                           content_type='application/json')
+    response = crm.update_contact(151, {'lastname': 'D'}, baseline={'lastname': 'D'})
+    assert response['status'] == 'skipped'
+    assert len(httpretty.latest_requests()) == 0
+
+
+@httpretty.activate
+def test_buffered_writer_merges_updates():
+    httpretty.register_uri(httpretty.PUT, crm.url.format(url='contacts/151/'),
+                           body='{"status": "success"}',
+                           content_type='application/json')
+    httpretty.register_uri(httpretty.PUT, crm.url.format(url='contacts/note/111/'),
+                           body='{"status": "success"}',
+                           content_type='application/json')
+    with BufferedWriter(crm, workers=1) as writer:  # httpretty is not thread safe
+        with writer._cond:  # Holds the worker while queueing
+            writer.update('contacts', 151, {'firstname': 'A'})
+            writer.update('contacts', 151, {'lastname': 'B'})
+            writer.update_activity('contacts', 'note', 111, {'details': 'C'})
+    assert writer.sent == 2
+    assert writer.merged == 1
+    bodies = [json.loads(request.body.decode())
+              for request in httpretty.latest_requests()]
+    assert {'firstname': 'A', 'lastname': 'B'} in bodies
+    assert {'data': {'details': 'C'}} in bodies
+
+
+@httpretty.activate
+def test_buffered_writer_errors():
+    httpretty.register_uri(httpretty.PUT, crm.url.format(url='contacts/151/'),
+                           status=500)
+    errors = []
+    writer = BufferedWriter(crm, on_error=lambda *args: errors.append(args))
+    writer.update('contacts', 151, {'firstname': 'A'})
+    assert writer.flush(timeout=10)
+    writer.close()
+    assert writer.errors == 1
+    assert errors[0][0] == ('entity', 'contacts', 151)
+    assert isinstance(errors[0][2], HTTPError)
+    with raises(ValueError):
+        writer.update('contacts', 151, {'firstname': 'A'})
+    with raises(ValueError):
+        writer.update('invalid_entity', 151, {'firstname': 'A'})
+
+
+def test_buffered_writer_failing_error_callback():
+    transport = MemoryTransport()
+    writer_crm = Solve360('email', 'token', transport=transport)
+    transport.register('put', writer_crm.url.format(url='contacts/151/'), {},
+                       status=500)
+    transport.register('put', writer_crm.url.format(url='contacts/152/'),
+                       {'status': 'success'})
+
+    def on_error(key, payload, error):
+        raise RuntimeError(key)
+
+    writer = BufferedWriter(writer_crm, workers=1, on_error=on_error)
+    writer.update('contacts', 151, {'firstname': 'A'})
+    writer.update('contacts', 152, {'firstname': 'A'})
+    assert writer.flush(timeout=10)
+    writer.close()
+    assert (writer.errors, writer.sent) == (1, 1)
+
+
+def test_buffered_writer_backpressure():
+    writer = BufferedWriter(crm, workers=0, max_pending=1)
+    writer.update('contacts', 151, {'firstname': 'A'})
+    writer.update('contacts', 151, {'lastname': 'B'})
+    with raises(Full):
+        writer.update('contacts', 152, {'firstname': 'A'}, timeout=0.01)
+
+
 @httpretty.activate
 def test_list_contacts():
     httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/'),
@@ -543,6 +1756,39 @@ def test_parse_show_entity_dates():
     assert response['obj1']['item']['activities']['act1']['viewed_parsed'] == PARSED_3
 
 
+@httpretty.activate
+def test_show_indexed_activities():
+    def activity(typeid, created, **kwargs):
+        kwargs.update({'typeid': typeid, 'created': created})
+        return kwargs
+
+    response_body = {'status': 'success',
+                     'item': {'id': 42,
+                              'activities': {
+                                  '1': activity(3, '2014-12-12T10:00:00+00:00'),
+                                  '2': activity('14', '2014-12-14T10:00:00+00:00',
+                                                fields={'completed': '0'}),
+                                  '3': activity(3, '2014-12-13T10:00:00+00:00',
+                                                parent=1),
+                                  '4': activity(14, '2014-12-11T10:00:00+00:00',
+                                                fields={'completed': '1'})}}}
+    httpretty.register_uri(httpretty.GET, crm.url.format(url='contacts/42/'),
+                           body=json.dumps(response_body),
+                           content_type='application/json')
+    response = crm.show_contact(42, indexed=True)
+    assert response['status'] == 'success'
+    assert [a['created'][:10] for a in response.by_type('note')] == \
+        ['2014-12-12', '2014-12-13']
+    assert response.latest('task')[0]['created'][:10] == '2014-12-14'
+    assert [a['created'][:10] for a in response.latest(n=2)] == \
+        ['2014-12-14', '2014-12-13']
+    assert response.children(1)[0]['created'][:10] == '2014-12-13'
+    assert len(response.open_tasks()) == 1
+    between = response.between(iso8601.parse_date('2014-12-12T00:00:00Z'),
+                               iso8601.parse_date('2014-12-13T10:00:00Z'))
+    assert len(between) == 2
+
+
 # --------------------------------------
 # REPORTS
 # --------------------------------------
@@ -0,0 +1,48 @@
+"""
+Persistent log of destroyed records.
+
+Bulk destroys append each record confirmed as deleted to the log, one json
+encoded key per line, so a re-run of an interrupted purge skips them.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import os
+import json
+import threading
+
+
+class TombstoneLog(object):
+    """Append-only set of destroyed record keys stored in a file.
+
+    Keys are tuples such as ``('contacts', '123')`` or, for activities,
+    ``('contacts', 'note', '456')``.
+    """
+
+    def __init__(self, path):
+        """Opens the log at ``path``, loading the keys already logged."""
+        self.path = path
+        self._keys = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as log_file:
+                for line in log_file:
+                    try:
+                        self._keys.add(tuple(json.loads(line)))
+                    except ValueError:
+                        continue  # Truncated by an interrupted write
+
+    def add(self, *key):
+        """Logs a key as destroyed."""
+        key = tuple(str(part) for part in key)
+        with self._lock:
+            if key in self._keys:
+                return
+            with open(self.path, 'a') as log_file:
+                log_file.write(json.dumps(list(key)) + '\n')
+            self._keys.add(key)
+
+    def __contains__(self, key):
+        return tuple(str(part) for part in key) in self._keys
+
+    def __len__(self):
+        return len(self._keys)
@@ -0,0 +1,258 @@
+"""
+Transports sending the HTTP requests of a client.
+
+A transport sends a request and returns a response with ``status_code``,
+``headers``, the body bytes as ``content``, ``json()``, ``close()`` and
+``raise_for_status()``. Whatever the transport, failures are raised as the
+exceptions of ``requests``: ``HTTPError``, ``Timeout`` and
+``ConnectionError``.
+
+    >>> crm = Solve360(user, token, transport=Urllib3Transport(maxsize=16))
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import sys
+import json
+import base64
+
+if sys.version_info[0] == 3:
+    from urllib.parse import urlsplit
+else:
+    from urlparse import urlsplit
+
+
+class Transport(object):
+    """Interface of transports."""
+
+    def send(self, method, url, auth=None, headers=None, data=None,
+             timeout=None, stream=False):
+        """Sends a request and returns the response.
+
+        :param method: str - Lower case HTTP method.
+        :param auth: tuple - ``(user, token)`` for basic authentication.
+        :param data: str - Request body.
+        :param timeout: float or tuple - Seconds, or ``(connect, read)``.
+        :param stream: bool - Defer reading the body until ``content``.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Releases the connections of the transport."""
+
+
+class Response(object):
+    """Response of the transports not based on ``requests``."""
+
+    def __init__(self, status_code, headers, url, content=None, read=None,
+                 release=None):
+        """Creates the response, the body is either given as ``content`` or
+        read on first access with ``read()``."""
+        self.status_code = status_code
+        self.headers = headers
+        self.url = url
+        self._content = content
+        self._read = read
+        self._release = release
+
+    @property
+    def content(self):
+        """The body as bytes."""
+        if self._content is None:
+            self._content = self._read() if self._read else b''
+            self.close()
+        return self._content
+
+    def json(self):
+        """Returns the json decoded body."""
+        return json.loads(self.content.decode('utf-8'))
+
+    def close(self):
+        """Releases the connection of the response."""
+        if self._release:
+            self._release()
+            self._release = None
+
+    def raise_for_status(self):
+        """Raises ``requests.HTTPError`` for 4XX and 5XX responses."""
+        if self.status_code >= 400:
+            import requests  # Deferred, see solve360.solve360
+            kind = 'Client' if self.status_code < 500 else 'Server'
+            raise requests.HTTPError('{status} {kind} Error for url: {url}'
+                                     .format(status=self.status_code,
+                                             kind=kind, url=self.url),
+                                     response=self)
+
+
+def basic_auth(auth):
+    """Returns the basic authorization header value of ``(user, token)``."""
+    credentials = u'{}:{}'.format(*auth).encode('utf-8')
+    return 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+
+def _request_headers(auth, headers):
+    """Returns the headers with authorization added."""
+    headers = dict(headers or {})
+    if auth:
+        headers['Authorization'] = basic_auth(auth)
+    return headers
+
+
+def _body(data):
+    """Returns the request body as bytes, or None."""
+    if data is None or isinstance(data, bytes):
+        return data
+    return data.encode('utf-8')
+
+
+class RequestsTransport(Transport):
+    """Sends requests with ``requests``, through ``session`` if given.
+    The default transport."""
+
+    def __init__(self, session=None):
+        self.session = session
+
+    def send(self, method, url, auth=None, headers=None, data=None,
+             timeout=None, stream=False):
+        if self.session is None:
+            import requests  # Deferred, see solve360.solve360
+            sender = requests
+        else:
+            sender = self.session
+        return getattr(sender, method)(url, auth=auth, headers=headers,
+                                       data=data, timeout=timeout,
+                                       stream=stream)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+class Urllib3Transport(Transport):
+    """Sends requests through a urllib3 connection pool, skipping the
+    session and model layers of ``requests``."""
+
+    def __init__(self, pool=None, maxsize=10):
+        """:param pool: urllib3.PoolManager - Pool to use, by default one
+            keeping ``maxsize`` connections per host."""
+        import urllib3
+        self.pool = pool or urllib3.PoolManager(maxsize=maxsize)
+
+    def send(self, method, url, auth=None, headers=None, data=None,
+             timeout=None, stream=False):
+        import urllib3
+        import requests
+        from urllib3 import exceptions
+        if isinstance(timeout, tuple):
+            timeout = urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        elif timeout is not None:
+            timeout = urllib3.Timeout(total=timeout)
+        try:
+            raw = self.pool.request(method.upper(), url,
+                                    headers=_request_headers(auth, headers),
+                                    body=_body(data), timeout=timeout,
+                                    retries=False, redirect=False,
+                                    preload_content=False)
+        except exceptions.NewConnectionError as error:
+            raise requests.ConnectionError(error)
+        except exceptions.ConnectTimeoutError as error:
+            raise requests.ConnectTimeout(error)
+        except exceptions.TimeoutError as error:
+            raise requests.ReadTimeout(error)
+        except exceptions.HTTPError as error:
+            raise requests.ConnectionError(error)
+
+        def read():
+            """Reads the body, mapping read timeouts."""
+            try:
+                return raw.read()
+            except exceptions.TimeoutError as error:
+                raise requests.ReadTimeout(error)
+
+        response = Response(raw.status, dict(raw.headers), url, read=read,
+                            release=raw.release_conn)
+        if not stream:
+            response.content  # pylint: disable=W0104
+        return response
+
+    def close(self):
+        self.pool.clear()
+
+
+class HttpxTransport(Transport):
+    """Sends requests with httpx, over HTTP/2 where the server supports it.
+    Requires ``httpx``, and ``h2`` for HTTP/2."""
+
+    def __init__(self, client=None, http2=True):
+        """:param client: httpx.Client - Client to use, by default one with
+            HTTP/2 enabled if ``http2`` is set."""
+        import httpx
+        self.client = client or httpx.Client(http2=http2)
+
+    def send(self, method, url, auth=None, headers=None, data=None,
+             timeout=None, stream=False):
+        import httpx
+        import requests
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        try:
+            raw = self.client.request(method.upper(), url, auth=auth,
+                                      headers=headers, content=_body(data),
+                                      timeout=timeout)
+        except httpx.ConnectTimeout as error:
+            raise requests.ConnectTimeout(error)
+        except httpx.TimeoutException as error:
+            raise requests.ReadTimeout(error)
+        except httpx.TransportError as error:
+            raise requests.ConnectionError(error)
+        return Response(raw.status_code, dict(raw.headers), url,
+                        content=raw.content)
+
+    def close(self):
+        self.client.close()
+
+
+class MemoryTransport(Transport):
+    """Serves registered responses without network, for tests and
+    benchmarks.
+
+        >>> transport = MemoryTransport()
+        >>> transport.register('get', crm_url + 'contacts/131/',
+        ...                    {'status': 'success'})
+
+    Routes match on method and url without the query string. The body is
+    bytes, text, an object encoded as json or a callable called as
+    ``body(method, url, headers, data)`` returning ``(status, headers,
+    body)``. Unmatched requests get a 404 response. Sent requests are kept
+    in ``requests`` as ``(method, url, data)``.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+
+    def register(self, method, url, body, status=200, headers=None):
+        """Registers the response for method and url."""
+        self.routes[(method.lower(), self._route(url))] = (status, headers,
+                                                           body)
+
+    def send(self, method, url, auth=None, headers=None, data=None,
+             timeout=None, stream=False):
+        self.requests.append((method, url, data))
+        status, response_headers, body = self.routes.get(
+            (method.lower(), self._route(url)), (404, None, b''))
+        if callable(body):
+            status, response_headers, body = body(method, url, headers, data)
+        if not isinstance(body, (bytes, type(u''))):
+            body = json.dumps(body)
+        return Response(status,
+                        dict(response_headers or
+                             {'Content-Type': 'application/json'}),
+                        url, content=_body(body))
+
+    @staticmethod
+    def _route(url):
+        """Returns the url without query string and fragment."""
+        parts = urlsplit(url)
+        return '{scheme}://{netloc}{path}'.format(scheme=parts.scheme,
+                                                  netloc=parts.netloc,
+                                                  path=parts.path)
@@ -0,0 +1,263 @@
+"""
+Client-side payload validation.
+
+The schema of an entity, as returned by ``list_*_fields``, is fetched and
+compiled to one check per field once. Payloads are then checked for unknown
+fields, values of the wrong type and missing required fields before they
+are sent.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import re
+import sys
+import threading
+
+if sys.version_info[0] == 3:
+    string_types = (str,)
+    number_types = (int, float)
+else:
+    string_types = (basestring,)  # noqa pylint: disable=E0602
+    number_types = (int, long, float)  # noqa pylint: disable=E0602
+
+# Payload keys accepted besides the fields of the schema
+DEFAULT_EXTRA_KEYS = ['categories', 'ownership', 'relateditems']
+
+# Required data of activity segments, other segments are not checked
+ACTIVITY_REQUIRED = {'note': ['details'],
+                     'followup': ['details'],
+                     'task': ['title'],
+                     'event': ['title']}
+
+_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2})?.*)?$')
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+_NUMBER = re.compile(r'^-?\d+(\.\d+)?$')
+
+
+class ValidationError(ValueError):
+    """Raised for invalid payloads, the reasons are listed in ``errors``."""
+
+    def __init__(self, errors):
+        super(ValidationError, self).__init__('; '.join(errors))
+        self.errors = errors
+
+
+def _is_scalar(value):
+    """Strings, numbers, booleans and None are sent as is."""
+    return value is None or isinstance(value, string_types + number_types +
+                                       (bool,))
+
+
+def _check_text(value):
+    """Any scalar but booleans."""
+    return _is_scalar(value) and not isinstance(value, bool)
+
+
+def _check_number(value):
+    """Numbers or numeric strings."""
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, number_types) or \
+        (isinstance(value, string_types) and
+         (not value or _NUMBER.match(value) is not None))
+
+
+def _check_date(value):
+    """ISO8601 date or timestamp strings."""
+    return isinstance(value, string_types) and \
+        (not value or _DATE.match(value) is not None)
+
+
+def _check_email(value):
+    """Email address strings."""
+    return isinstance(value, string_types) and \
+        (not value or _EMAIL.match(value) is not None)
+
+
+def _check_boolean(value):
+    """Booleans, 0 and 1."""
+    return value in [True, False, 0, 1, '0', '1', '']
+
+
+def _check_multiple(value):
+    """A scalar or a list of scalars."""
+    if isinstance(value, list):
+        return all(_check_text(item) for item in value)
+    return _check_text(value)
+
+
+FIELD_CHECKS = {'text': _check_text,
+                'textarea': _check_text,
+                'phone': _check_text,
+                'url': _check_text,
+                'select': _check_text,
+                'radio': _check_text,
+                'number': _check_number,
+                'numeric': _check_number,
+                'decimal': _check_number,
+                'currency': _check_number,
+                'money': _check_number,
+                'date': _check_date,
+                'datetime': _check_date,
+                'email': _check_email,
+                'checkbox': _check_boolean,
+                'boolean': _check_boolean,
+                'multiselect': _check_multiple,
+                'checkboxes': _check_multiple}
+
+
+def iter_fields(response):
+    """Yields the field dicts of a list fields response. Both a
+    ``fields``/``field`` list and fields keyed by name are handled."""
+    fields = response.get('fields', response)
+    if isinstance(fields, dict) and 'field' in fields:
+        fields = fields['field']
+    if isinstance(fields, dict):
+        fields = [dict(value, name=value.get('name', name))
+                  for name, value in fields.items()
+                  if isinstance(value, dict)]
+    for field in fields or []:
+        if isinstance(field, dict) and field.get('name'):
+            yield field
+
+
+def _is_required(field):
+    """Returns whether a field of the schema is required."""
+    return u'{}'.format(field.get('required', '')).lower() in ['1', 'true',
+                                                              'yes']
+
+
+class Schema(object):
+    """Compiled schema of one entity."""
+
+    def __init__(self, entity, response, extra_keys=None):
+        """Compiles the fields of a list fields ``response``."""
+        self.entity = entity
+        self.checks = {}  # field name -> (type, check)
+        self.required = []
+        for field in iter_fields(response):
+            type_ = u'{}'.format(field.get('type', 'text')).lower()
+            self.checks[field['name']] = (type_,
+                                          FIELD_CHECKS.get(type_, _is_scalar))
+            if _is_required(field):
+                self.required.append(field['name'])
+        self.extra_keys = set(DEFAULT_EXTRA_KEYS if extra_keys is None
+                              else extra_keys)
+
+    def errors(self, payload, create=False):
+        """Returns the errors of a payload, required fields are only
+        checked when ``create`` is set."""
+        if not isinstance(payload, dict):
+            return ['Payload must be a dict']
+        errors = []
+        for name, value in payload.items():
+            if name in self.extra_keys:
+                continue
+            if name not in self.checks:
+                errors.append('Unknown {entity} field {name}'
+                              .format(entity=self.entity, name=name))
+                continue
+            type_, check = self.checks[name]
+            if not check(value):
+                errors.append('Invalid {type} value for {name}: {value!r}'
+                              .format(type=type_, name=name, value=value))
+        if create:
+            for name in self.required:
+                if payload.get(name) in [None, '']:
+                    errors.append('Missing required field {name}'
+                                  .format(name=name))
+        return errors
+
+
+class PayloadValidator(object):
+    """Validates payloads against the field schemas of a client.
+
+        >>> validator = PayloadValidator(crm)
+        >>> validator.validate('contacts', {'firstname': 'A'})
+        >>> validator.bulk('contacts', rows, create=True)
+        {3: ["Invalid email value for businessemail: 'a@'"]}
+
+    The schema of an entity is fetched with ``list_*_fields`` the first
+    time it is needed, ``refresh`` fetches it again.
+    """
+
+    def __init__(self, crm, extra_keys=None, activity_required=None):
+        """Creates the validator.
+
+        :param crm: Solve360 - Client used to fetch the schemas.
+        :param extra_keys: list - Payload keys accepted besides the fields,
+            defaults to ``DEFAULT_EXTRA_KEYS``.
+        :param activity_required: dict - Required data per activity segment,
+            defaults to ``ACTIVITY_REQUIRED``.
+        """
+        self.crm = crm
+        self.extra_keys = extra_keys
+        self.activity_required = ACTIVITY_REQUIRED if activity_required is None \
+            else activity_required
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    def schema(self, entity):
+        """Returns the compiled schema of entity."""
+        schema = self._schemas.get(entity)
+        if schema is None:
+            with self._lock:
+                schema = self._schemas.get(entity)
+                if schema is None:
+                    schema = Schema(entity,
+                                    self.crm._list_fields(entity=entity),
+                                    self.extra_keys)
+                    self._schemas[entity] = schema
+        return schema
+
+    def refresh(self, entity):
+        """Drops the compiled schema of entity, fetched again on next use."""
+        with self._lock:
+            self._schemas.pop(entity, None)
+
+    def errors(self, entity, payload, create=False):
+        """Returns the errors of a payload, see ``Schema.errors``."""
+        return self.schema(entity).errors(payload, create=create)
+
+    def validate(self, entity, payload, create=False):
+        """Raises ValidationError if the payload has errors."""
+        errors = self.errors(entity, payload, create=create)
+        if errors:
+            raise ValidationError(errors)
+
+    def activity_errors(self, segment, payload, create=False):
+        """Returns the errors of an activity payload. Values must be sent
+        as is and, on create, the required data of the segment be set."""
+        if not isinstance(payload, dict):
+            return ['Payload must be a dict']
+        errors = ['Invalid value for {name}: {value!r}'
+                  .format(name=name, value=value)
+                  for name, value in payload.items() if not _is_scalar(value)]
+        if create:
+            for name in self.activity_required.get(segment, []):
+                if payload.get(name) in [None, '']:
+                    errors.append('Missing required {segment} data {name}'
+                                  .format(segment=segment, name=name))
+        return errors
+
+    def validate_activity(self, segment, payload, create=False):
+        """Raises ValidationError if the activity payload has errors."""
+        errors = self.activity_errors(segment, payload, create=create)
+        if errors:
+            raise ValidationError(errors)
+
+    def bulk(self, entity, payloads, create=False):
+        """Validates many payloads against one compiled schema.
+
+        :param payloads: dict or list - Payloads keyed by record, or a list
+            keyed by index.
+        :return: dict - Errors of the invalid payloads, by key.
+        """
+        schema = self.schema(entity)
+        if not isinstance(payloads, dict):
+            payloads = dict(enumerate(payloads))
+        result = {}
+        for key, payload in payloads.items():
+            errors = schema.errors(payload, create=create)
+            if errors:
+                result[key] = errors
+        return result
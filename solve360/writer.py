@@ -0,0 +1,186 @@
+"""
+Write-behind buffering of updates.
+
+Updates are queued and sent by background workers. Pending updates to the
+same entity and ID are merged so only one request is made for them.
+"""
+__author__ = 'Daniel Nibon <daniel@nibon.se>'
+
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+if sys.version_info[0] == 3:
+    from queue import Full
+else:
+    from Queue import Full
+
+from solve360.solve360 import VALID_ENTITIES, ERR_MSG_VALID_ENTITIES
+
+
+class BufferedWriter(object):
+    """Buffers updates and sends them from background workers.
+
+        >>> with BufferedWriter(crm, workers=4, rate=10) as writer:
+        ...     writer.update('contacts', 12345, {'firstname': 'A'})
+        ...     writer.update('contacts', 12345, {'lastname': 'B'})  # Merged
+    """
+
+    def __init__(self, crm, workers=2, rate=None, max_pending=1000,
+                 on_error=None):
+        """Starts the workers.
+
+        :param crm: Solve360 - Client used to send the updates.
+        :param workers: int - Number of concurrent requests.
+        :param rate: float - Max requests per second for all workers.
+        :param max_pending: int - Max number of distinct pending updates
+            before ``update`` blocks.
+        :param on_error: callable - Called as ``on_error(key, payload, error)``
+            when an update fails. Exceptions it raises are ignored.
+        """
+        self.crm = crm
+        self.rate = rate
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self.sent = 0
+        self.merged = 0
+        self.errors = 0
+        self._pending = OrderedDict()
+        self._active = set()
+        self._closed = False
+        self._next_send = 0
+        self._cond = threading.Condition()
+        self._throttle_lock = threading.Lock()
+        self._workers = []
+        for _ in range(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def update(self, entity, uid, payload, timeout=None):
+        """Queues an update of entity with given ID.
+
+        Blocks while the queue is full, raises ``Full`` if ``timeout``
+        seconds pass first.
+        """
+        self._enqueue(entity, ('entity', entity, uid), payload, timeout)
+
+    def update_activity(self, entity, segment, activity_id, payload,
+                        timeout=None):
+        """Queues an update of an activity, see ``update``."""
+        self._enqueue(entity, ('activity', entity, segment, activity_id),
+                      payload, timeout)
+
+    def flush(self, timeout=None):
+        """Blocks until all queued updates are sent.
+        Returns False if ``timeout`` seconds pass first."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending or self._active:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        """Sends all queued updates and stops the workers."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _enqueue(self, entity, key, payload, timeout):
+        """Merges payload into a pending update for key or queues it."""
+        if entity not in VALID_ENTITIES:
+            raise ValueError(ERR_MSG_VALID_ENTITIES)
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            if self._closed:
+                raise ValueError('Writer is closed.')
+            if key in self._pending:
+                self._pending[key].update(payload)
+                self.merged += 1
+                return
+            while len(self._pending) >= self.max_pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise Full()
+                self._cond.wait(remaining)
+            self._pending[key] = dict(payload)
+            self._cond.notify_all()
+
+    def _next_key(self):
+        """Returns the oldest pending key not currently being sent."""
+        for key in self._pending:
+            if key not in self._active:
+                return key
+        return None
+
+    def _throttle(self):
+        """Sleeps as needed to keep all workers within ``rate``."""
+        if not self.rate:
+            return
+        with self._throttle_lock:
+            now = time.time()
+            wait = self._next_send - now
+            self._next_send = max(now, self._next_send) + 1.0 / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def _send(self, key, payload):
+        """Sends the update for key."""
+        if key[0] == 'entity':
+            _, entity, uid = key
+            return self.crm._update(uid, payload, entity=entity)
+        _, entity, segment, activity_id = key
+        return self.crm._update_activity(segment, activity_id, payload,
+                                         entity=entity)
+
+    def _work(self):
+        """Worker loop sending pending updates until closed."""
+        while True:
+            with self._cond:
+                key = self._next_key()
+                while key is None:
+                    if self._closed and not self._pending and not self._active:
+                        return
+                    self._cond.wait()
+                    key = self._next_key()
+                payload = self._pending.pop(key)
+                self._active.add(key)
+                self._cond.notify_all()
+            failed = True
+            try:
+                self._throttle()
+                self._send(key, payload)
+                failed = False
+            except Exception as error:  # pylint: disable=W0703
+                self._report(key, payload, error)
+            finally:
+                with self._cond:
+                    self._active.discard(key)
+                    if failed:
+                        self.errors += 1
+                    else:
+                        self.sent += 1
+                    self._cond.notify_all()
+
+    def _report(self, key, payload, error):
+        """Calls ``on_error`` for a failed update. A failing callback must
+        not stop the worker, which would leave the key active forever."""
+        if not self.on_error:
+            return
+        try:
+            self.on_error(key, payload, error)
+        except Exception:  # pylint: disable=W0703
+            pass